@@ -0,0 +1,142 @@
+"""A synthetic cost landscape standing in for a real GPU. It maps the PPCG flags of
+a configuration to per-kernel execution times. The landscape has a smooth basin
+around the best tile sizes, penalties for block sizes that are not a multiple of
+the warp size, plateaus once the grid saturates the device, a little deterministic
+roughness, and regions where PPCG, the build or the binary fails"""
+
+import re
+import math
+import random
+import hashlib
+
+# The kernels of the mock application: their default sizes, as PPCG would choose
+# them, and the sizes at which they run fastest
+KERNELS = {"0": {"tile": [32, 32], "block": [32, 16], "grid": [256, 256], "best_tile": [32, 8], "base": 0.050},
+           "1": {"tile": [32],     "block": [32],     "grid": [1024],     "best_tile": [48],    "base": 0.020}}
+
+WARP_SIZE          = 32
+MAX_THREADS        = 1024
+# Beyond this many blocks the device is saturated and more blocks make no difference
+SATURATED_GRID     = 512
+# PPCG gives up when the tile of a kernel has more points than this
+MAX_TILE_POINTS    = 2048
+# The build fails when the tile of a kernel does not fit into shared memory
+BYTES_PER_POINT    = 8
+ROUGHNESS          = 0.02
+
+# The multiplicative effect of PPCG flags on every kernel
+FLAG_FACTORS       = {"--no-shared-memory"                   : 1.30,
+                      "--no-private-memory"                  : 1.10,
+                      "--no-scale-tile-loops"                : 0.97,
+                      "--no-isl-schedule-separate-components": 1.05,
+                      "--no-wrap"                            : 0.99}
+FUSE_FACTORS       = {"max": 0.95, "min": 1.00}
+
+def parse_sizes(flags):
+    """The sizes requested by '--sizes' as {kernel: {'tile': [...], 'block': [...], 'grid': [...]}},
+    where kernel 'i' means every kernel"""
+    sizes = {}
+    match = re.search(r'--sizes="?\{([^}]*)\}', flags)
+    if not match:
+        return sizes
+    for the_kernel, the_param, values in re.findall(r'kernel\[(\w+)\]\s*->\s*(tile|block|grid)\[([\d,\s]*)\]', match.group(1)):
+        sizes.setdefault(the_kernel, {})[the_param] = [int(value) for value in values.split(',') if value.strip()]
+    return sizes
+
+def fit(requested, default):
+    """PPCG uses as many sizes as the kernel has dimensions, padding with its defaults"""
+    if not requested:
+        return list(default)
+    return (list(requested) + list(default[len(requested):]))[:len(default)]
+
+def effective_sizes(flags):
+    requested = parse_sizes(flags)
+    sizes     = {}
+    for the_kernel, kernel in KERNELS.items():
+        kernel_request = requested.get(the_kernel, requested.get("i", {}))
+        sizes[the_kernel] = dict((param, fit(kernel_request.get(param), kernel[param]))
+                                 for param in ["tile", "block", "grid"])
+    return sizes
+
+def dump_sizes(sizes):
+    """The sizes in the format printed by 'ppcg --dump-sizes'"""
+    lexemes = []
+    for the_kernel in sorted(sizes.keys(), key=int):
+        for param in ["tile", "block", "grid"]:
+            lexemes.append("kernel[%s] -> %s[%s]" % (the_kernel, param, ','.join(str(value) for value in sizes[the_kernel][param])))
+    return "{ %s }" % '; '.join(lexemes)
+
+def product(values):
+    result = 1
+    for value in values:
+        result *= value
+    return result
+
+def max_shared_memory(flags):
+    match = re.search(r'--max-shared-memory\s+(\d+)', flags)
+    return int(match.group(1)) if match else None
+
+def ppcg_fails(flags, sizes):
+    return any(product(kernel["tile"]) > MAX_TILE_POINTS for kernel in sizes.values())
+
+def build_fails(flags, sizes):
+    shared_memory = max_shared_memory(flags)
+    if shared_memory is None or "--no-shared-memory" in flags:
+        return False
+    # Pretend PPCG generates code which requests the tile in shared memory regardless
+    return any(product(kernel["tile"]) * BYTES_PER_POINT > 64 * shared_memory for kernel in sizes.values())
+
+def run_fails(flags, sizes):
+    return any(product(kernel["block"]) > MAX_THREADS for kernel in sizes.values())
+
+def roughness(*keys):
+    """A deterministic pseudo-random value in [0, 1) for the given configuration"""
+    digest = hashlib.md5(repr(keys).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) / float(1 << 32)
+
+def flag_factor(flags):
+    factor = 1.0
+    for flag, the_factor in FLAG_FACTORS.items():
+        if re.search(r'(^|\s)%s(\s|$)' % re.escape(flag), flags):
+            factor *= the_factor
+    match = re.search(r'--isl-schedule-fuse\s+(\w+)', flags)
+    if match:
+        factor *= FUSE_FACTORS.get(match.group(1), 1.0)
+    return factor
+
+def kernel_time(the_kernel, kernel_sizes, flags):
+    kernel = KERNELS[the_kernel]
+    # A smooth basin in log space around the best tile sizes
+    distance = sum((math.log(max(tile, 1), 2) - math.log(best, 2)) ** 2
+                   for tile, best in zip(kernel_sizes["tile"], kernel["best_tile"]))
+    tile_factor = 1.0 + 0.15 * distance
+    # Partly filled warps waste threads
+    threads      = product(kernel_sizes["block"])
+    warps        = int(math.ceil(threads / float(WARP_SIZE)))
+    block_factor = float(warps * WARP_SIZE) / threads
+    # Too few threads cannot hide latency
+    if threads < 128:
+        block_factor *= 1.0 + (128 - threads) / 256.0
+    # A plateau once the device is saturated
+    blocks      = product(kernel_sizes["grid"])
+    grid_factor = 1.0 + max(0, SATURATED_GRID - blocks) / float(SATURATED_GRID)
+    rough       = 1.0 + ROUGHNESS * roughness(the_kernel, kernel_sizes["tile"], kernel_sizes["block"], kernel_sizes["grid"])
+    return kernel["base"] * tile_factor * block_factor * grid_factor * flag_factor(flags) * rough
+
+def kernel_times(flags, sizes, noise=0.0, rng=random):
+    """The execution time of each kernel, with optional multiplicative measurement noise"""
+    times = {}
+    for the_kernel in sizes.keys():
+        the_time = kernel_time(the_kernel, sizes[the_kernel], flags)
+        if noise:
+            the_time *= 1.0 + rng.uniform(0.0, noise)
+        times[the_kernel] = the_time
+    return times
+
+def lower_bound():
+    """No configuration runs faster than this"""
+    best_flags = 1.0
+    for factor in FLAG_FACTORS.values():
+        best_flags *= min(factor, 1.0)
+    best_flags *= min(FUSE_FACTORS.values())
+    return sum(kernel["base"] for kernel in KERNELS.values()) * best_flags
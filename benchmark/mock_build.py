@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+
+"""Stands in for the build of the code generated by the mock PPCG. Fails when the
+tiles do not fit into the shared memory PPCG was allowed to use"""
+
+import sys
+import json
+import shutil
+import argparse
+import landscape
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--input",
+                        help="the generated code (default: %(default)s)",
+                        default="mock_kernels.json")
+    parser.add_argument("--output",
+                        help="the binary (default: %(default)s)",
+                        default="mock_binary.json")
+    args = parser.parse_args()
+    with open(args.input, 'r') as f:
+        code = json.load(f)
+    if landscape.build_fails(code["flags"], code["sizes"]):
+        sys.stderr.write("mock_build: too much shared memory requested\n")
+        sys.exit(1)
+    shutil.copyfile(args.input, args.output)
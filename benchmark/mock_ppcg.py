@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+"""Stands in for PPCG. Reads the flags from AUTOTUNER_PPCG_FLAGS, prints the sizes
+of the mock kernels to standard error as 'ppcg --dump-sizes' does, and writes the
+'generated code' for the mock build"""
+
+import os
+import sys
+import json
+import argparse
+import landscape
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output",
+                        help="the generated code (default: %(default)s)",
+                        default="mock_kernels.json")
+    args  = parser.parse_args()
+    flags = os.environ.get("AUTOTUNER_PPCG_FLAGS", "")
+    sizes = landscape.effective_sizes(flags)
+    if landscape.ppcg_fails(flags, sizes):
+        sys.stderr.write("mock_ppcg: tile sizes too large to schedule\n")
+        sys.exit(1)
+    with open(args.output, 'w') as f:
+        json.dump({"flags": flags, "sizes": sizes}, f)
+    if "--dump-sizes" in flags:
+        sys.stderr.write(landscape.dump_sizes(sizes) + "\n")
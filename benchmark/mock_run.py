@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+"""Stands in for running the binary built by the mock build. Prints the time of
+each kernel as 'kernel<N> <seconds>', taken from the synthetic cost landscape.
+Fails when a kernel launches more threads per block than the device allows"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import landscape
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--binary",
+                        help="the binary (default: AUTOTUNER_BINARY if set, otherwise %(default)s)",
+                        default="mock_binary.json")
+    parser.add_argument("--noise",
+                        type=float,
+                        help="add up to this fraction of uniformly distributed measurement noise (default: %(default)s)",
+                        default=0.0)
+    parser.add_argument("--sleep",
+                        action="store_true",
+                        help="take as long as the reported time",
+                        default=False)
+    args   = parser.parse_args()
+    binary = os.environ.get("AUTOTUNER_BINARY", args.binary)
+    with open(binary, 'r') as f:
+        code = json.load(f)
+    if landscape.run_fails(code["flags"], code["sizes"]):
+        sys.stderr.write("mock_run: too many threads per block\n")
+        sys.exit(1)
+    times = landscape.kernel_times(code["flags"], code["sizes"], args.noise, random.Random())
+    if args.sleep:
+        time.sleep(sum(times.values()))
+    for the_kernel in sorted(times.keys(), key=int):
+        print("kernel%s %.6f" % (the_kernel, times[the_kernel]))
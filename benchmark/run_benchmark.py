@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""Measure the quality and the speed of the search strategies of the auto-tuner
+without a GPU or PPCG. Every strategy tunes the mock application, whose execution
+time comes from a synthetic cost landscape, to the same budget of evaluations.
+Reported are the best execution time found after a quarter, half and all of the
+budget, relative to a lower bound on the execution time, and the time the
+auto-tuner spends per evaluation outside of the mock PPCG, build and binary"""
+
+import os
+import sys
+import csv
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import collections
+import landscape
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+tuner         = os.path.join(os.path.dirname(benchmark_dir), "main.py")
+strategies    = ["ga", "random", "simulated-annealing"]
+checkpoints   = [0.25, 0.5, 1.0]
+
+def busy_time(intervals):
+    """The length of the union of the given (start, end) intervals"""
+    total    = 0.0
+    last_end = None
+    for start, end in sorted(intervals):
+        if last_end is None or start > last_end:
+            total   += end - start
+            last_end = end
+        elif end > last_end:
+            total   += end - last_end
+            last_end = end
+    return total
+
+def strategy_arguments(strategy, args):
+    """Arguments giving the strategy a budget of about --budget evaluations"""
+    if strategy == "ga":
+        return ["ga",
+                "--population", str(args.population),
+                "--generations", str(max(1, args.budget / args.population))]
+    if strategy == "random":
+        return ["random",
+                "--population", str(args.budget)]
+    if strategy == "simulated-annealing":
+        # One evaluation for the initial solution, then one per temperature step
+        return ["simulated-annealing",
+                "--temperature-steps", str(args.temperature_steps),
+                "--cooling-steps", str(max(1, int(math.ceil((args.budget - 1) / float(args.temperature_steps)))))]
+    assert False, "Unknown strategy %s" % strategy
+
+def tuner_command(strategy, args, work_dir):
+    mock = lambda name: "%s %s" % (args.python, os.path.join(benchmark_dir, name))
+    cmd  = [args.python, tuner,
+            "--ppcg-cmd", mock("mock_ppcg.py"),
+            "--build-cmd", mock("mock_build.py"),
+            "--run-cmd", "%s --noise %f" % (mock("mock_run.py"), args.noise),
+            "--execution-time-from-binary",
+            "--runs", str(args.runs),
+            "--telemetry-file", os.path.join(work_dir, "telemetry.jsonl"),
+            "--trace-csv-file", os.path.join(work_dir, "trace.csv"),
+            "--predict-infeasible",
+            # A loose bound on the threads per block, as a user who roughly knows
+            # the device would set, which still leaves a region of failing launches
+            "--block-size-product-bound", str(2 * landscape.MAX_THREADS)]
+    if not args.predict_infeasible:
+        # Record failures in PPCG and the build rather than ending the run, but never predict them
+        cmd += ["--infeasibility-min-samples", str(sys.maxint)]
+    return cmd + args.tuner_args.split() + strategy_arguments(strategy, args)
+
+def run_once(strategy, repetition, args):
+    work_dir = tempfile.mkdtemp(prefix="autotuner-benchmark-")
+    try:
+        cmd   = tuner_command(strategy, args, work_dir)
+        if args.seed is not None:
+            # The same seed for every strategy in the same repetition
+            cmd.insert(2, "--seed=%d" % (args.seed + repetition))
+        start = time.time()
+        with open(os.path.join(work_dir, "tuner.log"), 'w') as log:
+            returncode = subprocess.call(cmd, cwd=work_dir, stdout=log, stderr=subprocess.STDOUT)
+        wall_time = time.time() - start
+        if returncode:
+            with open(os.path.join(work_dir, "tuner.log"), 'r') as log:
+                sys.stderr.write(log.read())
+            raise RuntimeError("'%s' failed on repetition %d" % (strategy, repetition))
+        best_so_far = []
+        failures    = 0
+        with open(os.path.join(work_dir, "telemetry.jsonl"), 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                if record["type"] == "evaluation":
+                    best_so_far.append(record["best_so_far"])
+                    if record["status"] != "passed":
+                        failures += 1
+        with open(os.path.join(work_dir, "trace.csv"), 'r') as f:
+            intervals = [(float(row["start"]), float(row["end"]))
+                         for row in csv.DictReader(f) if row["thread"] == "tuner"]
+        return {"best_so_far": best_so_far,
+                "failures"   : failures,
+                "wall_time"  : wall_time,
+                "overhead"   : wall_time - busy_time(intervals)}
+    finally:
+        if args.keep_dirs:
+            sys.stderr.write("Kept '%s'\n" % work_dir)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def best_at(best_so_far, evaluations):
+    found = [best for best in best_so_far[:evaluations] if best is not None]
+    return found[-1] if found else None
+
+def mean(values):
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
+
+def summarise(results, args):
+    bound = landscape.lower_bound()
+    print("Execution time relative to the lower bound of %f seconds (lower is better), mean of %d repetitions" % (bound, args.repetitions))
+    print("%-22s %12s %10s %s %14s" % ("Strategy",
+                                       "Evaluations",
+                                       "Failures",
+                                       ' '.join("%9s" % ("@%d%%" % (100 * checkpoint)) for checkpoint in checkpoints),
+                                       "Overhead/eval"))
+    for strategy, runs in results.iteritems():
+        evaluations = mean([len(run["best_so_far"]) for run in runs])
+        qualities   = []
+        for checkpoint in checkpoints:
+            best = mean([best_at(run["best_so_far"], int(math.ceil(checkpoint * args.budget))) for run in runs])
+            qualities.append("%9s" % ("%.3f" % (best / bound) if best is not None else "-"))
+        overhead = mean([run["overhead"] / len(run["best_so_far"]) for run in runs if run["best_so_far"]])
+        print("%-22s %12.1f %10.1f %s %11.1f ms" % (strategy,
+                                                    evaluations,
+                                                    mean([run["failures"] for run in runs]),
+                                                    ' '.join(qualities),
+                                                    1000 * overhead))
+
+def export_curves(results, filename):
+    """The best execution time found against evaluations, one row per evaluation"""
+    with open(filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(["strategy", "repetition", "evaluation", "best_so_far"])
+        for strategy, runs in results.iteritems():
+            for repetition, run in enumerate(runs):
+                for evaluation, best in enumerate(run["best_so_far"]):
+                    writer.writerow([strategy, repetition+1, evaluation+1, best])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--strategies",
+                        nargs="+",
+                        choices=strategies,
+                        help="the search strategies to compare (default: all)",
+                        default=strategies)
+    parser.add_argument("--budget",
+                        type=int,
+                        help="the number of evaluations given to each strategy (default: %(default)s)",
+                        default=100)
+    parser.add_argument("--repetitions",
+                        type=int,
+                        help="how many times to run each strategy (default: %(default)s)",
+                        default=3)
+    parser.add_argument("--population",
+                        type=int,
+                        help="the population size of the genetic algorithm (default: %(default)s)",
+                        default=10)
+    parser.add_argument("--temperature-steps",
+                        type=int,
+                        help="the number of temperature steps of simulated annealing (default: %(default)s)",
+                        default=10)
+    parser.add_argument("--runs",
+                        type=int,
+                        help="the number of times the tuner runs each binary (default: %(default)s)",
+                        default=1)
+    parser.add_argument("--noise",
+                        type=float,
+                        help="the fraction of measurement noise added by the mock binary (default: %(default)s)",
+                        default=0.02)
+    parser.add_argument("--predict-infeasible",
+                        action="store_true",
+                        help="let the tuner predict and skip configurations which will fail",
+                        default=False)
+    parser.add_argument("--seed",
+                        type=int,
+                        help="seed the tuner with this seed plus the repetition number, making the runs repeatable when there is no noise",
+                        default=None)
+    parser.add_argument("--tuner-args",
+                        help="further arguments for the tuner, such as '--interleave-runs'",
+                        default="")
+    parser.add_argument("--python",
+                        help="the interpreter for the tuner and the mock tools (default: %(default)s)",
+                        default=sys.executable)
+    parser.add_argument("--curves-file",
+                        help="write the best execution time found after every evaluation to this CSV file",
+                        default=None)
+    parser.add_argument("--keep-dirs",
+                        action="store_true",
+                        help="keep the working directory, with the tuner log, telemetry and trace, of every run",
+                        default=False)
+    args = parser.parse_args()
+
+    results = collections.OrderedDict()
+    for strategy in args.strategies:
+        results[strategy] = []
+        for repetition in xrange(1, args.repetitions+1):
+            sys.stderr.write("Running %s, repetition %d of %d\n" % (strategy, repetition, args.repetitions))
+            results[strategy].append(run_once(strategy, repetition, args))
+    summarise(results, args)
+    if args.curves_file:
+        export_curves(results, args.curves_file)
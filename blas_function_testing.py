@@ -3,72 +3,225 @@ from __future__ import print_function
 import config
 import re
 import os
-import shutil
 import collections
 import copy
 import sys
 import debug
 import internal_exceptions
-import subprocess
+import random_streams
 import timeit
+import Queue
+import multiprocessing
+import threading
+import enums
+import dispatch
+import tracing
+import child_process
+import hashlib
+import cPickle as pickle
+import telemetry
 import pycparser
 from pycparser import c_ast
+from pycparser import c_parser
 from pycparser import c_generator
 from numpy import random 
 
-def run_compiler(the_cmd):  
-    debug.verbose_message("Running '%s'" % the_cmd, __name__)
-    start = timeit.default_timer()
-    proc  = subprocess.Popen(the_cmd, shell=True, stderr=subprocess.PIPE)    
-    end   = timeit.default_timer() 
-    config.time_VOBLA += end - start
-    if proc.wait():
-        raise internal_exceptions.FailedCompilationException("FAILED: '%s'" % the_cmd) 
+# The source of random test data, created on first use
+random_state = None
 
-def compile_test_case(test_file, host_file):
-    ocl_file          = config.Arguments.ppcg_home + os.sep + "ocl_utilities.c"
-    test_file_obj     = "%s.o" % os.path.splitext(test_file)[0]
-    host_file_obj     = "%s.o" % os.path.splitext(host_file)[0]
-    ocl_utilities_obj = "%s.o" % os.path.splitext(ocl_file)[0]
-    binary            = "%s" % os.path.splitext(test_file)[0]
-    
-    test_file_cmd = '%s -O3 -std=c99 -I%s -include "pencil.h" -c %s -o %s' % (config.Arguments.cc,
-                                                                              config.Arguments.pencil_home + os.sep + "etc",
-                                                                              test_file,
-                                                                              test_file_obj)
-    
-    host_file_cmd = '%s -O3 -std=c99 -I%s -include "CL/opencl.h" -include "pencil.h" -c %s -o %s' % (config.Arguments.cc,
-                                                                                                     config.Arguments.pencil_home + os.sep + "etc",
-                                                                                                     host_file,
-                                                                                                     host_file_obj)
+def get_random_state():
+    """numpy random numbers seeded from the data stream, so that the test data of a
+    test case is the same whenever the seed is the same"""
+    global random_state
+    if random_state is None:
+        random_state = random.RandomState(random_streams.data.randint(0, 2**32-1))
+    return random_state
+
+# Functions every test harness defines to fill its arrays quickly: a xorshift
+# generator, which is far cheaper than rand(), filling whole buffers at once, and
+# a copy of one element across a buffer in doubling memcpy calls
+harness_functions = """
+static unsigned int test_random(unsigned int *state)
+{
+  unsigned int x = *state;
+  x ^= x << 13;
+  x ^= x >> 17;
+  x ^= x << 5;
+  return *state = x;
+}
+
+static void test_fill_int(int *data, size_t count, unsigned int *state)
+{
+  for (size_t i = 0; i < count; ++i)
+    data[i] = (int) (test_random(state) & 0xff);
+}
+
+static void test_fill_float(float *data, size_t count, unsigned int *state)
+{
+  for (size_t i = 0; i < count; ++i)
+    data[i] = (float) (test_random(state) >> 8) * (1.0f / 16777216.0f);
+}
+
+static void test_fill_double(double *data, size_t count, unsigned int *state)
+{
+  for (size_t i = 0; i < count; ++i)
+    data[i] = (double) test_random(state) * (1.0 / 4294967296.0);
+}
+
+static void test_replicate(void *data, const void *element, size_t size, size_t count)
+{
+  size_t filled = 1;
+  if (count == 0)
+    return;
+  memcpy(data, element, size);
+  while (filled < count)
+  {
+    size_t copy = filled < count - filled ? filled : count - filled;
+    memcpy((char *) data + filled * size, data, copy * size);
+    filled += copy;
+  }
+}
+"""
+
+class BuildStep:
+    """A compiler command which may only run once the steps it depends on have succeeded"""
     
-    ocl_file_cmd = '%s -O3 -std=c99 -c %s -o %s' % (config.Arguments.cc,
-                                                    ocl_file,
-                                                    ocl_utilities_obj)
+    def __init__(self, name, cmd, dependencies=[]):
+        self.name         = name
+        self.cmd          = cmd
+        self.dependencies = dependencies
+        self.usage        = None
+
+def run_build_graph(steps):
+    """Run each step as soon as its dependencies have succeeded, with up to 
+    --harness-build-jobs steps at once. Every step is traced with the time its 
+    compiler took, and the time until the last step finishes goes to config.time_VOBLA"""
+    finished = Queue.Queue()
+    pending  = list(steps)
+    done     = []
+    failed   = None
+    running  = 0
+    # Trace each concurrent step on its own line
+    slots    = range(config.Arguments.harness_build_jobs, 0, -1)
     
-    binary_cmd = '%s %s %s %s -o %s -lOpenCL' % (config.Arguments.cc,
-                                                 ocl_utilities_obj,
-                                                 test_file_obj,
-                                                 host_file_obj,
-                                                 binary)
+    def run_step(step, slot):
+        try:
+            with tracing.span(enums.TraceCategory.build, step.name, thread="build-%d" % slot):
+                step.usage = child_process.run(step.cmd, capture_stderr=True)
+        finally:
+            finished.put((step, slot))
     
-    run_compiler(test_file_cmd)
-    run_compiler(host_file_cmd)
-    run_compiler(ocl_file_cmd)
-    run_compiler(binary_cmd)
-    return binary
+    start = timeit.default_timer()
+    while running or (pending and not failed):
+        if not failed:
+            for step in [step for step in pending if all(dependency in done for dependency in step.dependencies)]:
+                if not slots:
+                    break
+                debug.verbose_message("Running '%s'" % step.cmd, __name__)
+                pending.remove(step)
+                running += 1
+                the_thread = threading.Thread(target=run_step, args=(step, slots.pop()))
+                the_thread.daemon = True
+                the_thread.start()
+        assert running, "The build steps %s depend on each other" % ', '.join(step.name for step in pending)
+        step, slot = finished.get()
+        running -= 1
+        slots.append(slot)
+        if step.usage is None or step.usage.returncode:
+            failed = failed or step
+            if step.usage is not None:
+                debug.verbose_message(step.usage.stderr, __name__)
+        else:
+            done.append(step)
+    config.time_VOBLA += timeit.default_timer() - start
+    if failed:
+        raise internal_exceptions.FailedCompilationException("FAILED: '%s'" % failed.cmd) 
 
-def write_to_file(ast_new_file, ppcg_input_file):
+def get_ocl_utilities():
+    """The object of the OpenCL utilities which every test case links, and the step
+    building it, which is None if it is in the cache already. The object is built 
+    once, into the build cache, for each version of the file and the compiler"""
+    ocl_file = config.Arguments.ppcg_home + os.sep + "ocl_utilities.c"
+    with open(ocl_file, 'r') as f:
+        key = hashlib.sha1('\0'.join([config.Arguments.cc, f.read()])).hexdigest()
+    ocl_utilities_obj = os.path.join(os.path.abspath(config.Arguments.build_cache_dir), "ocl_utilities-%s.o" % key)
+    if os.path.exists(ocl_utilities_obj):
+        telemetry.cache_hit("object")
+        return ocl_utilities_obj, None
+    telemetry.cache_miss("object")
+    if not os.path.isdir(config.Arguments.build_cache_dir):
+        os.makedirs(config.Arguments.build_cache_dir)
+    # Compile to a private name first so that a partially written object is never in the cache
+    ocl_file_cmd = '%s -O3 -std=c99 -c %s -o %s.%d.tmp && mv %s.%d.tmp %s' % (config.Arguments.cc,
+                                                                             ocl_file,
+                                                                             ocl_utilities_obj, os.getpid(),
+                                                                             ocl_utilities_obj, os.getpid(),
+                                                                             ocl_utilities_obj)
+    return ocl_utilities_obj, BuildStep("compile %s" % os.path.basename(ocl_file), ocl_file_cmd)
+
+def compile_test_cases(test_cases):
+    """Build the binary of each (test file, host files) pair in a single build 
+    graph, compiling every host file once however many test cases link it"""
+    for option in ["ppcg_home", "pencil_home"]:
+        if not getattr(config.Arguments, option):
+            raise internal_exceptions.UnsetOptionException("--%s is needed to build test cases" % option.replace('_', '-'))
+    ocl_utilities_obj, ocl_file_step = get_ocl_utilities()
+    steps      = [ocl_file_step] if ocl_file_step else []
+    host_steps = collections.OrderedDict()
+    binaries   = []
+    for test_file, host_files in test_cases:
+        test_file_obj = "%s.o" % os.path.splitext(test_file)[0]
+        binary        = "%s" % os.path.splitext(test_file)[0]
+        
+        # clock_gettime is POSIX rather than C99. The macro must be defined before
+        # the first header is included, which -include "pencil.h" does
+        test_file_cmd = '%s -O3 -std=c99 -D_POSIX_C_SOURCE=199309L -I%s -include "pencil.h" -c %s -o %s' % (config.Arguments.cc,
+                                                                                                            config.Arguments.pencil_home + os.sep + "etc",
+                                                                                                            test_file,
+                                                                                                            test_file_obj)
+        test_file_step = BuildStep("compile %s" % os.path.basename(test_file), test_file_cmd)
+        steps.append(test_file_step)
+        link_steps = [test_file_step] + ([ocl_file_step] if ocl_file_step else [])
+        
+        for host_file in host_files:
+            if host_file not in host_steps:
+                host_file_obj = "%s.o" % os.path.splitext(host_file)[0]
+                host_file_cmd = '%s -O3 -std=c99 -D_POSIX_C_SOURCE=199309L -I%s -include "CL/opencl.h" -include "pencil.h" -c %s -o %s' % (config.Arguments.cc,
+                                                                                                                                           config.Arguments.pencil_home + os.sep + "etc",
+                                                                                                                                           host_file,
+                                                                                                                                           host_file_obj)
+                host_steps[host_file] = (host_file_obj, BuildStep("compile %s" % os.path.basename(host_file), host_file_cmd))
+                steps.append(host_steps[host_file][1])
+            link_steps.append(host_steps[host_file][1])
+        
+        # Older C libraries keep clock_gettime in librt
+        binary_cmd = '%s %s %s %s -o %s -lOpenCL -lrt' % (config.Arguments.cc,
+                                                          ocl_utilities_obj,
+                                                          test_file_obj,
+                                                          ' '.join(host_steps[host_file][0] for host_file in host_files),
+                                                          binary)
+        steps.append(BuildStep("link %s" % os.path.basename(binary), binary_cmd, link_steps))
+        binaries.append(binary)
+    run_build_graph(steps)
+    return binaries
+
+def compile_test_case(test_file, host_file):
+    return compile_test_cases([(test_file, [host_file])])[0]
+
+def write_to_file(ast_new_file, name):
     generator  = c_generator.CGenerator()
     old_stdout = sys.stdout
-    test_file  = "%s.test.c" % config.Arguments.tuning_function
+    test_file  = "%s.test.c" % name
     f          = open(test_file, 'w')
     try:
         sys.stdout = f
-        # Include the standard library and the time headers for random number generation
+        # Include the standard library, string and time headers for allocation, 
+        # data initialisation and timing, and the standard I/O header for reporting times
+        print('#include "stdio.h"')
         print('#include "stdlib.h"')
+        print('#include "string.h"')
         print('#include "time.h"')
-        print("")
+        print(harness_functions)
         # Generate the code
         print(generator.visit(ast_new_file))
     finally:
@@ -76,116 +229,234 @@ def write_to_file(ast_new_file, ppcg_input_file):
         sys.stdout = old_stdout
     return os.path.abspath(test_file)
 
-def create_main(pencil_info):
-    debug.verbose_message("Create AST for function 'main'", __name__)
-    
-    # The statements in "main"
-    main_stmts = []
-    
-    # Initialise the pseudo-random number generator
-    ast_time_param = c_ast.Constant("int", "0") 
-    ast_time_call  = c_ast.FuncCall(c_ast.ID("time"), c_ast.ExprList([ast_time_param]))
-    ast_srand_call = c_ast.FuncCall(c_ast.ID("srand"), c_ast.ExprList([ast_time_call]));
-    main_stmts.append(ast_srand_call);
+def create_scalar_decl(name, the_type, init=None):
+    return c_ast.Decl(name, 
+                      [], 
+                      [], 
+                      [], 
+                      c_ast.TypeDecl(name, [], the_type),
+                      init, 
+                      None)
+
+def create_heap_array_decl(formal_param):
+    """'float A[n][m]' becomes 'float (*A)[m] = malloc(n * sizeof(*A))', which is 
+    passed to the PENCIL function just like the array"""
+    ast_size   = c_ast.BinaryOp("*", 
+                                c_ast.ID(formal_param.dimensions[0]), 
+                                c_ast.UnaryOp("sizeof", c_ast.UnaryOp("*", c_ast.ID(formal_param.name))))
+    ast_malloc = c_ast.FuncCall(c_ast.ID("malloc"), c_ast.ExprList([ast_size]))
+    return c_ast.Decl(formal_param.name, 
+                      [], 
+                      [], 
+                      [], 
+                      c_ast.PtrDecl([], copy.deepcopy(formal_param.type.type)), 
+                      ast_malloc, 
+                      None)
+
+def create_element_count(formal_param):
+    """The number of elements in the array, as a size_t"""
+    ast_size_t = c_ast.Typename(None, c_ast.TypeDecl(None, None, c_ast.IdentifierType(["size_t"])))
+    ast_count  = c_ast.Cast(ast_size_t, c_ast.ID(formal_param.dimensions[0]))
+    for dimension in formal_param.dimensions[1:]:
+        ast_count = c_ast.BinaryOp("*", ast_count, c_ast.ID(dimension))
+    return ast_count
+
+def create_array_initialisation(formal_param):
+    """Statements which fill the array with pseudo-random data from the fill functions 
+    of the harness. Structs whose fields all have the same type are filled as a flat 
+    array of that type. Other structs get one pseudo-random element which is copied 
+    across the array"""
+    ast_count = create_element_count(formal_param)
+    ast_state = c_ast.UnaryOp("&", c_ast.ID("test_seed"))
+    if len(set(formal_param.base_type)) == 1:
+        (base_type,) = set(formal_param.base_type)
+        if base_type not in ["int", "float", "double"]:
+            assert False, "Unknown base type %s" % base_type
+        if formal_param.struct_name:
+            ast_count = c_ast.BinaryOp("*", 
+                                       ast_count, 
+                                       c_ast.Constant("int", str(len(formal_param.base_type))))
+        ast_pointer_type = c_ast.Typename(None, c_ast.PtrDecl([], c_ast.TypeDecl(None, None, c_ast.IdentifierType([base_type]))))
+        return [c_ast.FuncCall(c_ast.ID("test_fill_%s" % base_type), 
+                               c_ast.ExprList([c_ast.Cast(ast_pointer_type, c_ast.ID(formal_param.name)), 
+                                               ast_count, 
+                                               ast_state]))]
+    stmts        = []
+    pattern_name = "test_pattern_%s" % formal_param.name
+    ast_random   = c_ast.FuncCall(c_ast.ID("test_random"), c_ast.ExprList([ast_state]))
+    struct_field_initialisers = []
+    for base_type in formal_param.base_type:
+        ast_cast_type = c_ast.TypeDecl(None, None, c_ast.IdentifierType([base_type]))
+        struct_field_initialisers.append(c_ast.Cast(c_ast.Typename(None, ast_cast_type), copy.deepcopy(ast_random)))
+    stmts.append(create_scalar_decl(pattern_name, 
+                                    c_ast.Struct(formal_param.struct_name, None), 
+                                    c_ast.InitList(struct_field_initialisers)))
+    stmts.append(c_ast.FuncCall(c_ast.ID("test_replicate"), 
+                                c_ast.ExprList([c_ast.ID(formal_param.name), 
+                                                c_ast.UnaryOp("&", c_ast.ID(pattern_name)), 
+                                                c_ast.UnaryOp("sizeof", c_ast.ID(pattern_name)), 
+                                                ast_count])))
+    return stmts
+
+def create_counted_loop(index, count, body):
+    """for (int index = 0; index < count; ++index) body"""
+    ast_loop_header_init = c_ast.DeclList([create_scalar_decl(index, c_ast.IdentifierType(["int"]), c_ast.Constant("int", "0"))])
+    ast_loop_header_cond = c_ast.BinaryOp("<", c_ast.ID(index), c_ast.Constant("int", str(count)))
+    ast_loop_header_step = c_ast.UnaryOp("++", c_ast.ID(index))
+    return c_ast.For(ast_loop_header_init, 
+                     ast_loop_header_cond, 
+                     ast_loop_header_step, 
+                     c_ast.Compound(body))
+
+def create_elapsed_time(start, end):
+    """The seconds between two struct timespec variables, as a double"""
+    ast_double = c_ast.Typename(None, c_ast.TypeDecl(None, None, c_ast.IdentifierType(["double"])))
+    ast_difference = lambda field: c_ast.Cast(ast_double,
+                                              c_ast.BinaryOp("-", 
+                                                             c_ast.StructRef(c_ast.ID(end), ".", c_ast.ID(field)), 
+                                                             c_ast.StructRef(c_ast.ID(start), ".", c_ast.ID(field))))
+    return c_ast.BinaryOp("+", 
+                          ast_difference("tv_sec"), 
+                          c_ast.BinaryOp("*", ast_difference("tv_nsec"), c_ast.Constant("double", "1e-9")))
+
+def create_clock_gettime(variable):
+    return c_ast.FuncCall(c_ast.ID("clock_gettime"), 
+                          c_ast.ExprList([c_ast.ID("CLOCK_MONOTONIC"), c_ast.UnaryOp("&", c_ast.ID(variable))]))
+
+def create_timed_call(label, description, ast_func_call):
+    """Statements which call the PENCIL function --harness-warmup-runs times untimed
+    and then --harness-repeats times timed, and print its mean time as '<label> <seconds>', 
+    where the label is 'function<N>' or 'size<N>', the formats --execution-time-from-binary 
+    expects, so that only time spent in the PENCIL functions counts towards fitness. 
+    What the label stands for goes to standard error"""
+    stmts = []
+    stmts.append(create_scalar_decl("test_time", c_ast.IdentifierType(["double"]), c_ast.Constant("double", "0.0")))
+    if config.Arguments.harness_warmup_runs:
+        stmts.append(create_counted_loop("test_run", 
+                                         config.Arguments.harness_warmup_runs, 
+                                         [copy.deepcopy(ast_func_call)]))
+    stmts.append(create_counted_loop("test_run", 
+                                     config.Arguments.harness_repeats, 
+                                     [create_clock_gettime("test_start"),
+                                      copy.deepcopy(ast_func_call),
+                                      create_clock_gettime("test_end"),
+                                      c_ast.Assignment("+=", c_ast.ID("test_time"), create_elapsed_time("test_start", "test_end"))]))
+    stmts.append(c_ast.FuncCall(c_ast.ID("fprintf"), 
+                                c_ast.ExprList([c_ast.ID("stderr"), 
+                                                c_ast.Constant("string", '"%s is %s\\n"' % (label, description))])))
+    stmts.append(c_ast.FuncCall(c_ast.ID("printf"), 
+                                c_ast.ExprList([c_ast.Constant("string", '"%s %%.9f\\n"' % label),
+                                                c_ast.BinaryOp("/", 
+                                                               c_ast.ID("test_time"), 
+                                                               c_ast.Constant("double", "%d.0" % config.Arguments.harness_repeats))])))
+    return stmts
+
+def get_size_points():
+    """The problem sizes to run each PENCIL function on: every combination of the 
+    --problem-size values, each as a map from parameter name to value. Without 
+    --problem-size there is a single point, None, where the sizes are random"""
+    return dispatch.get_size_classes() or [None]
+
+def create_size_point_stmts(pencil_info, function_number, function_name, point_number, point):
+    """Declare and initialise the arguments of one PENCIL function at one problem 
+    size, time it and release its arrays"""
+    stmts = []
     
     # Create local variable declarations matching those in the
-    # formal parameter list of each function.
-    # Each scalar is initialised using the value selected
-    for function_name in pencil_info.functions.keys():
-        for formal_param in pencil_info.get_formal_params(function_name):
+    # formal parameter list of the function.
+    # Each scalar is initialised using the value selected, or the value of the 
+    # problem size, and each array is allocated on the heap, as the sizes would 
+    # overflow the stack
+    for formal_param in pencil_info.get_formal_params(function_name):
+        if isinstance(formal_param.type, c_ast.ArrayDecl):
+            stmts.append(create_heap_array_decl(formal_param))
+        else:
             ast_local_decl = copy.deepcopy(formal_param)
             if isinstance(formal_param.type, c_ast.TypeDecl):
                 if isinstance(formal_param.type.type, c_ast.IdentifierType):
-                    ast_local_decl.init = c_ast.Constant(ast_local_decl.type.type.names[0], str(formal_param.value))     
-            main_stmts.append(ast_local_decl)
+                    value = formal_param.value
+                    if point and formal_param.name in point:
+                        value = point[formal_param.name]
+                    ast_local_decl.init = c_ast.Constant(ast_local_decl.type.type.names[0], str(value))     
+            stmts.append(ast_local_decl)
             
-    # Initialise array variables using a loop nest of the appropriate depth
-    for function_name in pencil_info.functions.keys():
-        for formal_param in pencil_info.get_formal_params(function_name):
-            if isinstance(formal_param.type, c_ast.ArrayDecl):
-                # The name of the loop indices to create
-                loop_indices = ["test_%d" % dim for dim in range(0,len(formal_param.dimensions))]
-                # The innermost loop index is the last one in the list
-                inner_loop_index = len(formal_param.dimensions) - 1
-                # Create the statement that assigns into an array element
-                for i in range(0, len(formal_param.dimensions)):
-                    if i == 0:
-                        ast_array_reference = c_ast.ArrayRef(c_ast.ID(formal_param.name), c_ast.ID(loop_indices[i]))
-                    else:
-                        ast_array_reference = c_ast.ArrayRef(ast_array_reference, c_ast.ID(loop_indices[i]))
-                # Create the loop nest
-                for i in reversed(range(0, len(formal_param.dimensions))):
-                    ast_loop_header_step = c_ast.UnaryOp("++", 
-                                                         c_ast.ID(loop_indices[i]))
-                    ast_loop_header_cond = c_ast.BinaryOp("<", 
-                                                          c_ast.ID(loop_indices[i]), 
-                                                          c_ast.ID(formal_param.dimensions[i]))
-                    ast_loop_header_decl = c_ast.Decl(loop_indices[i], 
-                                                      [], 
-                                                      [], 
-                                                      [], 
-                                                      c_ast.TypeDecl(loop_indices[i], [], c_ast.IdentifierType(["int"])),
-                                                      c_ast.Constant("int", "0"), 
-                                                      None)
-                    ast_loop_header_init = c_ast.DeclList([ast_loop_header_decl])
-                    if i == inner_loop_index:
-                        ast_rand_call = c_ast.FuncCall(c_ast.ID("rand"), c_ast.ExprList([]))                        
-                        if len(formal_param.base_type) == 1:
-                            ast_cast_type      = c_ast.TypeDecl(None, None, c_ast.IdentifierType([formal_param.base_type[0]]))
-                            ast_cast_rand_call = c_ast.Cast(c_ast.Typename(None, ast_cast_type), ast_rand_call)
-                            ast_loop_body      = c_ast.Assignment("=", ast_array_reference, ast_cast_rand_call)
-                        else:
-                            loop_body_stmts = []
-                            struct_field_initialisers = []
-                            for j in range(0, len(formal_param.base_type)):
-                                ast_cast_type      = c_ast.TypeDecl(None, None, c_ast.IdentifierType([formal_param.base_type[j]]))
-                                ast_cast_rand_call = c_ast.Cast(c_ast.Typename(None, ast_cast_type), ast_rand_call)
-                                struct_field_initialisers.append(ast_cast_rand_call)
-                            ast_struct_initialiser = c_ast.InitList(struct_field_initialisers)
-                            ast_struct_decl = c_ast.Decl("rand_value", 
-                                                         [],
-                                                         [],
-                                                         [],
-                                                         c_ast.TypeDecl("rand_value", [], c_ast.Struct(formal_param.struct_name, None)),
-                                                         ast_struct_initialiser,
-                                                         None)
-                            loop_body_stmts.append(ast_struct_decl)
-                            
-                            ast_array_assignment = c_ast.Assignment("=", ast_array_reference, c_ast.ID("rand_value"))
-                            loop_body_stmts.append(ast_array_assignment)
-                            ast_loop_body = c_ast.Compound(loop_body_stmts)
-                        ast_loop = c_ast.For(ast_loop_header_init, 
-                                             ast_loop_header_cond, 
-                                             ast_loop_header_step, 
-                                             ast_loop_body)
-                    else:
-                        ast_loop = c_ast.For(ast_loop_header_init, 
-                                             ast_loop_header_cond, 
-                                             ast_loop_header_step, 
-                                             ast_loop)
-                main_stmts.append(ast_loop)
+    # Initialise array variables in bulk
+    for formal_param in pencil_info.get_formal_params(function_name):
+        if isinstance(formal_param.type, c_ast.ArrayDecl):
+            stmts.extend(create_array_initialisation(formal_param))
         
-    # Create function calls into each PENCIL function
-    for function_name in pencil_info.functions.keys():
-        expr_list = []
-        for formal_param in pencil_info.get_formal_params(function_name):
-            the_type = formal_param.type
-            # Whittle down through array declarations to get the identifier
-            while isinstance(the_type, c_ast.ArrayDecl):
-                the_type = the_type.type
-            expr_list.append(c_ast.ID(the_type.declname))
-        ast_func_call = c_ast.FuncCall(c_ast.ID(function_name), c_ast.ExprList(expr_list))
-        main_stmts.append(ast_func_call)
+    # Create a timed function call into the PENCIL function
+    expr_list = []
+    for formal_param in pencil_info.get_formal_params(function_name):
+        the_type = formal_param.type
+        # Whittle down through array declarations to get the identifier
+        while isinstance(the_type, c_ast.ArrayDecl):
+            the_type = the_type.type
+        expr_list.append(c_ast.ID(the_type.declname))
+    ast_func_call = c_ast.FuncCall(c_ast.ID(function_name), c_ast.ExprList(expr_list))
+    if point is None:
+        stmts.extend(create_timed_call("function%d" % function_number, function_name, ast_func_call))
+    else:
+        description = "%s with %s" % (function_name, ' '.join("%s=%d" % (name, value) for name, value in point.iteritems()))
+        stmts.extend(create_timed_call("size%d" % point_number, description, ast_func_call))
+    
+    # Release the arrays
+    for formal_param in pencil_info.get_formal_params(function_name):
+        if isinstance(formal_param.type, c_ast.ArrayDecl):
+            stmts.append(c_ast.FuncCall(c_ast.ID("free"), c_ast.ExprList([c_ast.ID(formal_param.name)])))
+    return stmts
+
+def create_function_block(pencil_info, function_number, function_name):
+    """Run one PENCIL function at every problem size. The statements run when the 
+    harness is given no argument, or the name of the function as its first argument"""
+    stmts = []
+    for point_number, point in enumerate(get_size_points()):
+        stmts.append(c_ast.Compound(create_size_point_stmts(pencil_info, function_number, function_name, point_number, point)))
+    
+    ast_no_argument = c_ast.BinaryOp("<", c_ast.ID("argc"), c_ast.Constant("int", "2"))
+    ast_strcmp_call = c_ast.FuncCall(c_ast.ID("strcmp"), 
+                                     c_ast.ExprList([c_ast.ArrayRef(c_ast.ID("argv"), c_ast.Constant("int", "1")),
+                                                     c_ast.Constant("string", '"%s"' % function_name)]))
+    ast_selected    = c_ast.BinaryOp("==", ast_strcmp_call, c_ast.Constant("int", "0"))
+    return c_ast.If(c_ast.BinaryOp("||", ast_no_argument, ast_selected), 
+                    c_ast.Compound(stmts), 
+                    None)
+
+def create_main(pencil_info):
+    debug.verbose_message("Create AST for function 'main'", __name__)
+    
+    # The statements in "main"
+    main_stmts = []
+    
+    # Seed the generator of test data from --seed, so that a test case runs on 
+    # the same data whenever the seed is the same
+    ast_seed = c_ast.Constant("int", "%du" % get_random_state().randint(1, 2**31-1))
+    main_stmts.append(create_scalar_decl("test_seed", c_ast.IdentifierType(["unsigned", "int"]), ast_seed))
+    main_stmts.append(create_scalar_decl("test_start", c_ast.Struct("timespec", None)))
+    main_stmts.append(create_scalar_decl("test_end", c_ast.Struct("timespec", None)))
+    
+    # Each PENCIL function gets its own block, so that functions whose 
+    # parameters have the same names can share a harness
+    for function_number, function_name in enumerate(pencil_info.functions.keys()):
+        main_stmts.append(create_function_block(pencil_info, function_number, function_name))
     
     # The return statement
     ast_return = c_ast.Return(c_ast.Constant("int", "0"))
     main_stmts.append(ast_return)
     
-    # The function body for "main"
+    # The function body for "main", which takes the function to run from argv
+    ast_argc_decl = create_scalar_decl("argc", c_ast.IdentifierType(["int"]))
+    ast_argv_decl = c_ast.Decl("argv", 
+                               [], 
+                               [], 
+                               [], 
+                               c_ast.PtrDecl([], c_ast.PtrDecl([], c_ast.TypeDecl("argv", [], c_ast.IdentifierType(["char"])))), 
+                               None, 
+                               None)
     ast_type_decl = c_ast.TypeDecl("main", 
                                    [], 
                                    c_ast.IdentifierType(["int"]))
-    ast_func_decl = c_ast.FuncDecl(c_ast.ParamList([]), 
+    ast_func_decl = c_ast.FuncDecl(c_ast.ParamList([ast_argc_decl, ast_argv_decl]), 
                                    ast_type_decl)
     ast_decl      = c_ast.Decl(ast_type_decl.declname, 
                                [], 
@@ -229,11 +500,11 @@ def decorate_formal_params(node, struct_info):
             assert len(node.type.type.names) == 1
             (base_type,) = node.type.type.names
             if base_type == "int":
-                node.value = random.randint(2,17)
+                node.value = get_random_state().randint(2,17)
             elif base_type == "float":
-                node.value = random.uniform(1,10)
+                node.value = get_random_state().uniform(1,10)
             elif base_type == "double":
-                node.value = random.uniform(1,10)
+                node.value = get_random_state().uniform(1,10)
             else:
                 assert False, "Unknown base type %s" % base_type
         elif isinstance(node.type.type, c_ast.Struct):
@@ -298,34 +569,81 @@ class FuncDeclVisitor(c_ast.NodeVisitor):
         if FuncDeclVisitor.regex_pencil_prefix.match(function_name):
             self.functions[function_name] = node
         
-def remove_pencil_qualifiers_from_file(filename):
-    filename2    = filename + ".temp"
-    regex_pencil = re.compile(r'(static|restrict|const)')
-    f1 = open(filename, 'r') 
-    f2 = open(filename2, 'w')
+def remove_pencil_qualifiers(text):
+    return re.sub(r'\b(static|restrict|const)\b', "", text)
+
+# The PENCIL interfaces parsed so far, keyed by a hash of the preprocessed source
+parsed_interfaces = {}
+
+def load_interface(ppcg_input_file):
+    """The key and the parsed PENCIL function declarations and struct definitions 
+    of the file, and whether they came from a cache. They are parsed once per 
+    distinct preprocessed source and kept in memory and under --parse-cache-dir, 
+    so variants with the same PENCIL interface skip pycparser. This may run in a 
+    worker process, so the caller counts cache hits and misses"""
+    # Remove PENCIL qualifiers from a copy of the C code otherwise it will not parse
+    text = remove_pencil_qualifiers(pycparser.preprocess_file(ppcg_input_file))
+    key  = hashlib.sha1(text).hexdigest()
+    hit  = True
+    if key not in parsed_interfaces:
+        cache_file = os.path.join(os.path.abspath(config.Arguments.parse_cache_dir), "%s.pickle" % key)
+        if os.path.exists(cache_file):
+            debug.verbose_message("Reusing the parse of '%s' from the cache" % ppcg_input_file, __name__)
+            with open(cache_file, 'rb') as f:
+                parsed_interfaces[key] = pickle.load(f)
+        else:
+            hit = False
+            ast = c_parser.CParser().parse(text, ppcg_input_file)
+            # Find PENCIL function declarations
+            pencil_info = FuncDeclVisitor()
+            pencil_info.visit(ast)
+            # Find struct definitions
+            struct_info = StructDefintionVisitor()
+            struct_info.visit(ast)
+            parsed_interfaces[key] = (pencil_info, struct_info)
+            if not os.path.isdir(config.Arguments.parse_cache_dir):
+                os.makedirs(config.Arguments.parse_cache_dir)
+            # Write to a private name first so that a partially written parse is never in the cache
+            temporary = "%s.%d.tmp" % (cache_file, os.getpid())
+            with open(temporary, 'wb') as f:
+                pickle.dump(parsed_interfaces[key], f, pickle.HIGHEST_PROTOCOL)
+            os.rename(temporary, cache_file)
+    return key, parsed_interfaces[key], hit
+
+def count_parse(hit):
+    if hit:
+        telemetry.cache_hit("parse")
+    else:
+        telemetry.cache_miss("parse")
+
+def parse_interface(ppcg_input_file):
+    key, interface, hit = load_interface(ppcg_input_file)
+    count_parse(hit)
+    # The formal parameters of a test case are decorated with its own test data
+    return copy.deepcopy(interface)
+
+def parse_interfaces(ppcg_input_files):
+    """Parse the files in up to --harness-build-jobs processes, as pycparser is 
+    bound by the interpreter rather than by I/O"""
+    if config.Arguments.harness_build_jobs == 1 or len(ppcg_input_files) == 1:
+        return [parse_interface(ppcg_input_file) for ppcg_input_file in ppcg_input_files]
+    pool = multiprocessing.Pool(min(config.Arguments.harness_build_jobs, len(ppcg_input_files)))
     try:
-        for line1 in f1:
-            line2 = regex_pencil.sub("", line1)
-            f2.write(line2)
-    finally: 
-        f1.close()
-        f2.close()
-        shutil.move(filename2, filename)
+        results = pool.map(load_interface, ppcg_input_files)
+    finally:
+        pool.close()
+        pool.join()
+    interfaces = []
+    for key, interface, hit in results:
+        count_parse(hit)
+        parsed_interfaces[key] = interface
+        interfaces.append(copy.deepcopy(interface))
+    return interfaces
     
 def create_test_case(ppcg_input_file, ppcg_output_files):   
     assert len(ppcg_output_files) == 1, "Currently support OpenCL only for VOBLA"     
-    # Remove PENCIL qualifiers from C code otherwise it will not parse
-    remove_pencil_qualifiers_from_file(ppcg_input_file)                      
-    # Pre-process and parse the file               
-    ast = pycparser.parse_file(ppcg_input_file, use_cpp=True)
-    gen = c_generator.CGenerator()
-    gen.visit(ast)
-    # Find PENCIL function declarations
-    pencil_info = FuncDeclVisitor()
-    pencil_info.visit(ast)
-    # Find struct definitions
-    struct_info = StructDefintionVisitor()
-    struct_info.visit(ast)
+    # Pre-process and parse the file, unless a file with the same interface has been parsed
+    pencil_info, struct_info = parse_interface(ppcg_input_file)
     # We need the struct and function prototypes to dump in the test file
     ast_new_file = copy_ast_declarations(pencil_info, struct_info)
     # Analyse the types of parameters in each PENCIL function
@@ -336,8 +654,47 @@ def create_test_case(ppcg_input_file, ppcg_output_files):
     main_func = create_main(pencil_info)
     ast_new_file.ext.append(main_func)
     # Write the program to a file
-    test_file = write_to_file(ast_new_file, ppcg_input_file)
+    test_file = write_to_file(ast_new_file, config.Arguments.tuning_function)
     # Compile the code
     binary = compile_test_case(test_file, ppcg_output_files[0])
     return binary
-    
\ No newline at end of file
+
+def create_test_cases(test_cases, multiplexed=False):
+    """Create test cases for a library of (PPCG input file, PPCG output files) pairs 
+    in one pass: the inputs are parsed in parallel and all harnesses are built in 
+    one build graph. Returns the binary of each PENCIL function. Either every 
+    function gets a harness of its own or, if multiplexed, a single harness runs 
+    the function named by its first argument (or all of them without one)"""
+    for ppcg_input_file, ppcg_output_files in test_cases:
+        assert len(ppcg_output_files) == 1, "Currently support OpenCL only for VOBLA"
+    interfaces = parse_interfaces([ppcg_input_file for ppcg_input_file, ppcg_output_files in test_cases])
+    # All functions and structs of the library, each once
+    library_pencil_info = FuncDeclVisitor()
+    library_struct_info = StructDefintionVisitor()
+    function_hosts      = collections.OrderedDict()
+    for (ppcg_input_file, ppcg_output_files), (pencil_info, struct_info) in zip(test_cases, interfaces):
+        for function_name in pencil_info.functions.keys():
+            for formal_param in pencil_info.get_formal_params(function_name):            
+                decorate_formal_params(formal_param, struct_info)
+            if function_name not in function_hosts:
+                library_pencil_info.functions[function_name] = pencil_info.functions[function_name]
+                function_hosts[function_name] = ppcg_output_files[0]
+        for struct in struct_info.structs:
+            if struct.type.name not in library_struct_info.flattened_types:
+                library_struct_info.structs.append(struct)
+                library_struct_info.flattened_types[struct.type.name] = struct_info.flattened_types[struct.type.name]
+    if multiplexed:
+        ast_new_file = copy_ast_declarations(library_pencil_info, library_struct_info)
+        ast_new_file.ext.append(create_main(library_pencil_info))
+        test_file    = write_to_file(ast_new_file, config.Arguments.tuning_function or "library")
+        host_files   = list(collections.OrderedDict.fromkeys(function_hosts.values()))
+        (binary,)    = compile_test_cases([(test_file, host_files)])
+        return collections.OrderedDict((function_name, binary) for function_name in function_hosts.keys())
+    harnesses = []
+    for function_name, host_file in function_hosts.iteritems():
+        pencil_info = FuncDeclVisitor()
+        pencil_info.functions[function_name] = library_pencil_info.functions[function_name]
+        ast_new_file = copy_ast_declarations(pencil_info, library_struct_info)
+        ast_new_file.ext.append(create_main(pencil_info))
+        harnesses.append((write_to_file(ast_new_file, function_name), [host_file]))
+    return collections.OrderedDict(zip(function_hosts.keys(), compile_test_cases(harnesses)))
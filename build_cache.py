@@ -0,0 +1,135 @@
+import os
+import re
+import pipes
+import timeit
+import hashlib
+import config
+import debug
+import enums
+import tracing
+import telemetry
+import child_process
+
+# How many objects were reused and how long the compilations we did run took
+hits         = 0
+misses       = 0
+compile_time = 0.0
+
+def get_compiler(source):
+    """The compiler for a translation unit, and which tuned flags apply to it,
+    decided by its file extension"""
+    extension = os.path.splitext(source)[1]
+    if extension == ".c":
+        return config.Arguments.cc, "cc_flags"
+    if extension in [".cpp", ".cc", ".cxx", ".C"]:
+        return config.Arguments.cxx, "cxx_flags"
+    if extension == ".cu":
+        return config.Arguments.nvcc, "nvcc_flags"
+    raise ValueError("Do not know how to compile '%s'" % source)
+
+def get_linker():
+    extensions = [os.path.splitext(source)[1] for source in config.Arguments.build_sources]
+    if ".cu" in extensions:
+        return config.Arguments.nvcc
+    if any(extension in [".cpp", ".cc", ".cxx", ".C"] for extension in extensions):
+        return config.Arguments.cxx
+    return config.Arguments.cc
+
+def locate(source, work_dir):
+    """Sources generated by PPCG are in the working directory of the individual;
+    the rest are relative to the directory the auto-tuner was started in"""
+    if work_dir and os.path.exists(os.path.join(work_dir, source)):
+        return os.path.join(work_dir, source)
+    return os.path.abspath(source)
+
+# Line markers such as '# 1 "/scratch/individual-3/kernel.cu"' name the file
+# they come from, which may be in the working directory of the individual
+line_marker = re.compile(r'^#(line)? *\d+.*$', re.MULTILINE)
+
+def get_key_text(preprocessed, work_dir):
+    """The preprocessed source without anything which depends on where it is, so
+    that the same source in the working directories of two individuals has one key"""
+    text = line_marker.sub('', preprocessed)
+    if work_dir:
+        text = text.replace(os.path.abspath(work_dir), '')
+    return text
+
+def add_usage(total, usage):
+    total.returncode   = total.returncode or usage.returncode
+    total.user_time   += usage.user_time
+    total.system_time += usage.system_time
+    total.max_rss      = max(total.max_rss, usage.max_rss)
+
+def compile_object(solution, source, total):
+    """Return the object file of the translation unit, compiling it only if no
+    object with the same key is in the cache. The key hashes the preprocessed
+    source, so that a change to an included header (such as one generated by PPCG)
+    is a change to the source, but a move of the source is not"""
+    global hits, misses, compile_time
+    compiler, flags_attribute = get_compiler(source)
+    flags = ' '.join(flag.get_command_line_string(value) for flag, value in getattr(solution, flags_attribute).iteritems())
+    flags = "%s %s" % (config.Arguments.compile_flags, flags)
+    path  = locate(source, solution.work_dir)
+    with tracing.span(enums.TraceCategory.cache, "preprocess %s" % source, solution.ID):
+        usage = child_process.run("%s %s -E %s" % (compiler, flags, pipes.quote(path)), 
+                                  capture_stdout=True, 
+                                  cwd=solution.work_dir)
+    add_usage(total, usage)
+    if usage.returncode:
+        return None
+    key         = hashlib.sha1('\0'.join([compiler, ' '.join(flags.split()), get_key_text(usage.stdout, solution.work_dir)])).hexdigest()
+    object_file = os.path.join(os.path.abspath(config.Arguments.build_cache_dir), "%s.o" % key)
+    if os.path.exists(object_file):
+        debug.verbose_message("Reusing object of '%s' from the cache" % source, __name__)
+        hits += 1
+        telemetry.cache_hit("object")
+        return object_file
+    misses += 1
+    telemetry.cache_miss("object")
+    # Compile to a private name first so that a partially written object is never in the cache
+    temporary = "%s.%d.tmp" % (object_file, os.getpid())
+    cmd       = "%s %s -c %s -o %s" % (compiler, flags, pipes.quote(path), pipes.quote(temporary))
+    debug.verbose_message("Running '%s'" % cmd, __name__)
+    usage = child_process.run(cmd, cwd=solution.work_dir)
+    add_usage(total, usage)
+    compile_time += usage.wall_time
+    if usage.returncode:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        return None
+    os.rename(temporary, object_file)
+    return object_file
+
+def build(solution):
+    """Build the binary of the individual from --build-sources, compiling each
+    translation unit separately and then linking. Returns the resource usage of
+    all the commands together, with a non-zero return code if any of them failed"""
+    if not os.path.isdir(config.Arguments.build_cache_dir):
+        os.makedirs(config.Arguments.build_cache_dir)
+    total = child_process.Result()
+    start = timeit.default_timer()
+    try:
+        object_files = []
+        for source in config.Arguments.build_sources:
+            object_file = compile_object(solution, source, total)
+            if object_file is None:
+                return total
+            object_files.append(object_file)
+        cmd = "%s %s -o %s %s" % (get_linker(),
+                                  ' '.join(pipes.quote(object_file) for object_file in object_files),
+                                  pipes.quote(config.Arguments.binary_file),
+                                  config.Arguments.link_flags)
+        debug.verbose_message("Running '%s'" % cmd, __name__)
+        add_usage(total, child_process.run(cmd, cwd=solution.work_dir))
+        return total
+    finally:
+        total.wall_time = timeit.default_timer() - start
+
+def summarise():
+    print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+    print("Objects reused from the cache:      %d" % (hits))
+    print("Objects compiled:                   %d" % (misses))
+    print("Time compiling objects:             %.2f seconds" % (compile_time))
+    if misses:
+        print("Estimated compile time saved:       %.2f seconds" % (hits * compile_time / misses))
+    print
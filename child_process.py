@@ -0,0 +1,80 @@
+import os
+import errno
+import tempfile
+import timeit
+import subprocess
+
+class Result:
+    """The outcome of running a child process, including the resources it used"""
+
+    def __init__(self, returncode=0, stdout=None, stderr=None, wall_time=0.0, user_time=0.0,
+                 system_time=0.0, max_rss=0, voluntary_context_switches=0, involuntary_context_switches=0):
+        self.returncode                   = returncode
+        self.stdout                       = stdout
+        self.stderr                       = stderr
+        self.wall_time                    = wall_time
+        self.user_time                    = user_time
+        self.system_time                  = system_time
+        # In kilobytes
+        self.max_rss                      = max_rss
+        self.voluntary_context_switches   = voluntary_context_switches
+        self.involuntary_context_switches = involuntary_context_switches
+
+    def cpu_time(self):
+        return self.user_time + self.system_time
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @staticmethod
+    def from_dict(data):
+        result = Result()
+        result.__dict__.update(data)
+        return result
+
+def wait_for(proc):
+    """Reap the child through wait4 so that we also get its resource usage"""
+    while True:
+        try:
+            pid, status, rusage = os.wait4(proc.pid, 0)
+            break
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+    # Let the Popen object know the child has gone so that it never waits on it again
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    return rusage
+
+def run(cmd, capture_stdout=False, capture_stderr=False, **kwargs):
+    """Run a shell command to completion. Captured output goes through temporary
+    files rather than pipes so that we never have to interleave reading the pipes
+    with waiting for the child"""
+    stdout = tempfile.TemporaryFile() if capture_stdout else None
+    stderr = tempfile.TemporaryFile() if capture_stderr else None
+    try:
+        start  = timeit.default_timer()
+        proc   = subprocess.Popen(cmd, shell=True, stdout=stdout, stderr=stderr, **kwargs)
+        rusage = wait_for(proc)
+        end    = timeit.default_timer()
+        result = Result(proc.returncode,
+                        wall_time=end - start,
+                        user_time=rusage.ru_utime,
+                        system_time=rusage.ru_stime,
+                        max_rss=rusage.ru_maxrss,
+                        voluntary_context_switches=rusage.ru_nvcsw,
+                        involuntary_context_switches=rusage.ru_nivcsw)
+        if stdout:
+            stdout.seek(0)
+            result.stdout = stdout.read()
+        if stderr:
+            stderr.seek(0)
+            result.stderr = stderr.read()
+        return result
+    finally:
+        if stdout:
+            stdout.close()
+        if stderr:
+            stderr.close()
@@ -1,7 +1,16 @@
 import re
 import os
+import sys
 import time
+import json
+import shutil
+import threading
 import debug
+import enums
+import config
+import tracing
+import child_process
+import internal_exceptions
 from subprocess import Popen, PIPE
 
 def get_execution_time(err):
@@ -39,12 +48,292 @@ def run_on_CX1(binary):
         f.write("module load cuda\n")
         f.write("time ${PROG}\n")
     cmd = "qsub -q pqkelly -v PROG=%s %s" % (binary, pbs)
-    debug.verboseMessage("Running '%s'" % cmd)
+    debug.verbose_message("Running '%s'" % cmd, __name__)
     proc = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE)    
     if proc.wait():
         print "FAILED: '%s'" % cmd    
     wait_for_job_completion(out, err)
     return get_execution_time(err)
 
+# The worker pool used to run binaries when pilot jobs are enabled
+pool = None
+
+class PilotJobQueue:
+    """A file-based queue shared between the auto-tuner and its pilot workers.
+    Jobs move from 'pending' to a worker's 'claimed' directory by an atomic
+    rename, and their results appear in 'done'"""
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self.pending   = os.path.join(self.directory, "pending")
+        self.claimed   = os.path.join(self.directory, "claimed")
+        self.done      = os.path.join(self.directory, "done")
+        self.workers   = os.path.join(self.directory, "workers")
+        self.stop_file = os.path.join(self.directory, "stop")
+
+    def is_queue(self):
+        return all(os.path.isdir(directory) for directory in [self.pending, self.claimed, self.done, self.workers])
+
+    def create(self):
+        if os.path.exists(self.directory):
+            # Only the queue of an earlier run is ever removed, never the user's files
+            if os.listdir(self.directory) and not self.is_queue():
+                raise internal_exceptions.PilotJobException("'%s' exists and is not a pilot job queue, so it cannot be used as --pilot-queue-dir" % self.directory)
+            shutil.rmtree(self.directory)
+        for directory in [self.pending, self.claimed, self.done, self.workers]:
+            os.makedirs(directory)
+
+    def remove(self):
+        if os.path.exists(self.directory) and self.is_queue():
+            shutil.rmtree(self.directory)
+
+    def claimed_directory(self, worker_ID):
+        return os.path.join(self.claimed, worker_ID)
+
+    def heartbeat_file(self, worker_ID):
+        return os.path.join(self.workers, "%s.heartbeat" % worker_ID)
+
+    def result_file(self, job_ID):
+        return os.path.join(self.done, "%s.result" % job_ID)
+
+    def write_atomically(self, filename, data):
+        # Readers must never see a partially-written file
+        temporary = filename + ".tmp"
+        with open(temporary, 'w') as f:
+            json.dump(data, f)
+        os.rename(temporary, filename)
+
+    def put(self, job_ID, job):
+        self.write_atomically(os.path.join(self.pending, "%s.job" % job_ID), job)
+
+    def claim(self, worker_ID):
+        for job_file in sorted(os.listdir(self.pending)):
+            if not job_file.endswith(".job"):
+                continue
+            claimed_job_file = os.path.join(self.claimed_directory(worker_ID), job_file)
+            try:
+                os.rename(os.path.join(self.pending, job_file), claimed_job_file)
+            except OSError:
+                # Another worker won the race for this job
+                continue
+            with open(claimed_job_file, 'r') as f:
+                return os.path.splitext(job_file)[0], json.load(f)
+        return None, None
+
+    def complete(self, worker_ID, job_ID, result):
+        self.write_atomically(self.result_file(job_ID), result)
+        claimed_job_file = os.path.join(self.claimed_directory(worker_ID), "%s.job" % job_ID)
+        if os.path.exists(claimed_job_file):
+            os.remove(claimed_job_file)
+
+    def requeue(self, worker_ID):
+        """Put the jobs claimed by a dead worker back onto the queue"""
+        requeued  = []
+        directory = self.claimed_directory(worker_ID)
+        if os.path.exists(directory):
+            for job_file in os.listdir(directory):
+                job_ID = os.path.splitext(job_file)[0]
+                if not os.path.exists(self.result_file(job_ID)):
+                    os.rename(os.path.join(directory, job_file), os.path.join(self.pending, job_file))
+                    requeued.append(job_ID)
+        return requeued
+
+def send_heartbeats(heartbeat, poll_interval):
+    while os.path.exists(heartbeat):
+        try:
+            os.utime(heartbeat, None)
+        except OSError:
+            # The queue has been removed
+            return
+        time.sleep(poll_interval)
+
+def run_pilot_worker(queue_directory, worker_ID, poll_interval=0.1):
+    """The main loop of a pilot job: pull binary runs off the queue until told to stop"""
+    queue = PilotJobQueue(queue_directory)
+    if not os.path.exists(queue.claimed_directory(worker_ID)):
+        os.makedirs(queue.claimed_directory(worker_ID))
+    heartbeat = queue.heartbeat_file(worker_ID)
+    open(heartbeat, 'a').close()
+    # Keep the heartbeat fresh even while a long-running binary executes
+    heartbeat_thread = threading.Thread(target=send_heartbeats, args=(heartbeat, poll_interval))
+    heartbeat_thread.daemon = True
+    heartbeat_thread.start()
+    while not os.path.exists(queue.stop_file):
+        try:
+            job_ID, job = queue.claim(worker_ID)
+        except OSError:
+            # The auto-tuner has finished and removed the queue
+            break
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        env = os.environ.copy()
+        env.update(job["env"])
+        # The runs of one binary follow each other so that they never compete
+        runs  = []
+        start = time.time()
+        for run in xrange(0, job["warmup_runs"] + job["runs"]):
+            run_start = time.time()
+            result    = child_process.run(job["cmd"], capture_stdout=True, cwd=job["cwd"], env=env).to_dict()
+            if run >= job["warmup_runs"]:
+                result["start"] = run_start
+                runs.append(result)
+        queue.complete(worker_ID, job_ID, {"worker": worker_ID, "start": start, "runs": runs})
+
+class PilotWorker:
+    """A pilot job submitted to the batch scheduler (or a local process standing in for one)"""
+
+    def __init__(self, worker_ID):
+        self.worker_ID = worker_ID
+        self.process   = None
+        self.job_ID    = None
+        self.submitted = time.time()
+
+class PilotJobPool:
+    """Runs binaries on a small number of long-lived pilot jobs rather than
+    paying the batch scheduler's queueing latency for every candidate"""
+
+    def __init__(self):
+        self.queue          = PilotJobQueue(config.Arguments.pilot_queue_dir)
+        self.workers        = {}
+        self.next_worker_ID = 0
+        self.next_job_ID    = 0
+        self.submit_times   = {}
+        self.resubmissions  = 0
+        self.requeued_jobs  = 0
+
+    def start(self):
+        self.queue.create()
+        for i in range(0, config.Arguments.pilot_workers):
+            self.submit_worker()
+
+    def stop(self):
+        open(self.queue.stop_file, 'w').close()
+        for worker in self.workers.values():
+            if worker.process:
+                worker.process.wait()
+        # Batch workers which are still running stop once the queue has gone
+        self.queue.remove()
+
+    def worker_command(self, worker_ID):
+        return [sys.executable,
+                os.path.splitext(os.path.abspath(__file__))[0] + ".py",
+                "--pilot-worker",
+                self.queue.directory,
+                worker_ID]
+
+    def submit_worker(self):
+        self.next_worker_ID += 1
+        worker = PilotWorker("worker%03d" % self.next_worker_ID)
+        os.makedirs(self.queue.claimed_directory(worker.worker_ID))
+        cmd = self.worker_command(worker.worker_ID)
+        if config.Arguments.pilot_scheduler == enums.Scheduler.local:
+            debug.verbose_message("Starting local pilot worker '%s'" % ' '.join(cmd), __name__)
+            worker.process = Popen(cmd)
+        else:
+            pbs = os.path.join(self.queue.workers, "%s.pbs" % worker.worker_ID)
+            with open(pbs, 'w') as f:
+                f.write("#!/bin/bash\n")
+                f.write("#PBS -l walltime=24:00:00\n")
+                f.write("#PBS -l select=1:ngpus=1\n")
+                f.write("#PBS -e %s.err.txt\n" % pbs)
+                f.write("#PBS -o %s.out.txt\n" % pbs)
+                f.write("cd $PBS_O_WORKDIR\n")
+                f.write("module load cuda\n")
+                f.write("%s\n" % ' '.join(cmd))
+            qsub = "%s %s" % (config.Arguments.pilot_qsub_cmd, pbs)
+            debug.verbose_message("Running '%s'" % qsub, __name__)
+            proc = Popen(qsub, shell=True, stdout=PIPE, stderr=PIPE)
+            stdout, stderr = proc.communicate()
+            if proc.returncode:
+                raise internal_exceptions.PilotJobException("FAILED: '%s'" % qsub)
+            worker.job_ID = stdout.strip()
+        self.workers[worker.worker_ID] = worker
+
+    def is_dead(self, worker):
+        if worker.process and worker.process.poll() is not None:
+            return True
+        heartbeat = self.queue.heartbeat_file(worker.worker_ID)
+        if not os.path.exists(heartbeat):
+            # A batch job may sit in the scheduler's queue for a long time before 
+            # it sends its first heartbeat, but one which never does has died
+            return time.time() - worker.submitted > config.Arguments.pilot_startup_timeout
+        return time.time() - os.path.getmtime(heartbeat) > config.Arguments.pilot_heartbeat_timeout
+
+    def check_workers(self):
+        for worker in self.workers.values():
+            if self.is_dead(worker):
+                debug.warning_message("Pilot worker %s died" % worker.worker_ID)
+                del self.workers[worker.worker_ID]
+                requeued = self.queue.requeue(worker.worker_ID)
+                self.requeued_jobs += len(requeued)
+                if self.resubmissions >= config.Arguments.pilot_max_resubmissions:
+                    raise internal_exceptions.PilotJobException("Too many pilot workers have failed")
+                self.resubmissions += 1
+                self.submit_worker()
+
+    def submit(self, solution):
+        """Queue the --warmup-runs and --runs runs of the binary of the individual as one job"""
+        self.next_job_ID += 1
+        job_ID = "job%08d" % self.next_job_ID
+        # Carry the environment variables through which the auto-tuner
+        # communicates with the user's commands
+        env = dict((key, value) for key, value in os.environ.iteritems() if key.startswith("AUTOTUNER_"))
+        if solution.binary_file:
+            env["AUTOTUNER_BINARY"] = solution.binary_file
+        self.queue.put(job_ID, {"cmd"        : config.Arguments.run_cmd,
+                                "cwd"        : solution.work_dir or os.getcwd(),
+                                "env"        : env,
+                                "warmup_runs": config.Arguments.warmup_runs,
+                                "runs"       : config.Arguments.runs})
+        self.submit_times[job_ID] = time.time()
+        return job_ID
+
+    def wait(self, jobs, poll_interval=0.1):
+        """Wait for the (job ID, individual ID) pairs and return the timed runs of each job in order"""
+        results = {}
+        with tracing.span(enums.TraceCategory.queue, "wait for pilot jobs", jobs[0][1] if len(jobs) == 1 else None):
+            while len(results) < len(jobs):
+                for job_ID, individual_ID in jobs:
+                    if job_ID not in results and os.path.exists(self.queue.result_file(job_ID)):
+                        with open(self.queue.result_file(job_ID), 'r') as f:
+                            result = json.load(f)
+                        os.remove(self.queue.result_file(job_ID))
+                        results[job_ID] = result
+                        tracing.record(enums.TraceCategory.queue,
+                                       "queued %s" % job_ID,
+                                       self.submit_times.pop(job_ID),
+                                       result["start"],
+                                       individual_ID,
+                                       "pilot queue")
+                        for run, run_result in enumerate(result["runs"]):
+                            tracing.record(enums.TraceCategory.binary,
+                                           "%s run #%d" % (job_ID, run+1),
+                                           run_result["start"],
+                                           run_result["start"] + run_result["wall_time"],
+                                           individual_ID,
+                                           result["worker"])
+                if len(results) < len(jobs):
+                    self.check_workers()
+                    time.sleep(poll_interval)
+        return [[child_process.Result.from_dict(run_result) for run_result in results[job_ID]["runs"]]
+                for job_ID, individual_ID in jobs]
+
+    def run(self, population):
+        """Run the binaries of the individuals on whichever workers are free, one job
+        per individual, and return the timed runs of each keyed on individual ID"""
+        jobs = [(self.submit(solution), solution.ID) for solution in population]
+        return dict((solution.ID, runs) for solution, runs in zip(population, self.wait(jobs)))
+
+    def summarise(self):
+        print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+        print("Pilot workers resubmitted:     %d" % (self.resubmissions))
+        print("Jobs requeued after a failure: %d" % (self.requeued_jobs))
+        print
+
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    if len(sys.argv) == 4 and sys.argv[1] == "--pilot-worker":
+        run_pilot_worker(sys.argv[2], sys.argv[3])
+    else:
+        print >> sys.stderr, "Usage: %s --pilot-worker <queue directory> <worker ID>" % sys.argv[0]
+        sys.exit(1)
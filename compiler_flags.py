@@ -1,5 +1,8 @@
-import random
 import config
+import enums
+import internal_exceptions
+import random_streams
+import tile_model
 import re
 import os
 import collections
@@ -23,6 +26,11 @@ class Flag:
     def __str__(self):
         return self.name
     
+    def __deepcopy__(self, memo):
+        # A flag only describes what can be tuned and does not change once the
+        # search starts, so a copied individual shares its flags
+        return self
+    
     @abc.abstractmethod
     def get_command_line_string(self, value):
         pass
@@ -30,89 +38,192 @@ class Flag:
 class EnumerationFlag(Flag):
     """Models compiler flags where it is easy to enumerate the values up front"""
     
-    def __init__ (self, name, possible_values=[True, False]):
+    def __init__ (self, name, possible_values=[True, False], separator=" "):
         Flag.__init__(self, name)
         self.possible_values = possible_values
+        # What goes between the name and the value, e.g. nothing for '-O3'
+        self.separator       = separator
     
-    def random_value(self):
+    def random_value(self, rng):
         if not self.tuneable:
             return True
-        idx = random.randint(0,len(self.possible_values)-1)
+        idx = rng.randint(0,len(self.possible_values)-1)
         return self.possible_values[idx]
     
     def get_command_line_string(self, value):
+        if value is None:
+            # Leave the choice to the compiler
+            return ""
         if type(value) is bool:
             if value:
                 return self.name
             else:
                 return ""
         else:
-            return "%s %s" % (self.name, value.__str__( ))
+            return "%s%s%s" % (self.name, self.separator, value.__str__( ))
+    
+class ToggleFlag(EnumerationFlag):
+    """Models a '-f' flag of gcc or clang, which can be turned on, turned off through
+    its '-fno-' form, or left to the compiler"""
+    
+    def __init__ (self, name):
+        EnumerationFlag.__init__(self, name, [None, True, False])
+        
+    def get_command_line_string(self, value):
+        if value is None:
+            return ""
+        if value:
+            return self.name
+        return "-fno-%s" % self.name[2:]
+    
+class Dependency:
+    """A flag which only has an effect when another flag has one of the given values.
+    Otherwise the flag is left to the compiler"""
+    
+    def __init__(self, name, other_name, other_values):
+        self.name         = name
+        self.other_name   = other_name
+        self.other_values = other_values
+        
+    def apply(self, flags):
+        the_flag  = get_optimisation_flag(flags.keys(), self.name)
+        the_other = get_optimisation_flag(flags.keys(), self.other_name)
+        if the_flag and the_other and flags[the_other] not in self.other_values:
+            flags[the_flag] = None
+            
+class Conflict:
+    """Two flag values which must not be combined. When they are, the second flag is 
+    left to the compiler"""
+    
+    def __init__(self, name, value, other_name, other_value):
+        self.name        = name
+        self.value       = value
+        self.other_name  = other_name
+        self.other_value = other_value
+        
+    def apply(self, flags):
+        the_flag  = get_optimisation_flag(flags.keys(), self.name)
+        the_other = get_optimisation_flag(flags.keys(), self.other_name)
+        if the_flag and the_other and flags[the_flag] == self.value and flags[the_other] == self.other_value:
+            flags[the_other] = None
+    
+def get_domain_values(domain, lower_bound, upper_bound):
+    """The values of a size domain, given as (kind, parameter), which lie in
+    [lower_bound, upper_bound), in ascending order"""
+    kind, parameter = domain
+    if kind == enums.SizeDomain.pow2:
+        candidates = [2**i for i in range(0, upper_bound.bit_length())]
+    elif kind == enums.SizeDomain.multiple:
+        candidates = range(parameter, upper_bound, parameter)
+    elif kind == enums.SizeDomain.divisors:
+        candidates = [x for x in range(1, parameter+1) if parameter % x == 0]
+    elif kind == enums.SizeDomain.list:
+        candidates = parameter
+    else:
+        candidates = range(lower_bound, upper_bound)
+    return sorted(set(x for x in candidates if lower_bound <= x < upper_bound))
     
 class Size:
     """Models a tile, block or grid size"""
     
-    def __init__(self, dimensions, lower_bound, upper_bound, product_bound):
+    def __init__(self, dimensions, lower_bound, upper_bound, product_bound, domain=(enums.SizeDomain.all, None)):
         self.dimensions    = dimensions
         self.lower_bound   = lower_bound
         self.upper_bound   = upper_bound
         self.product_bound = product_bound
-    
-    def random_value(self):
+        # Sampling and permutation move through these values only, so a step in
+        # a domain of powers of two doubles or halves the size
+        self.values        = get_domain_values(domain, lower_bound, upper_bound)
+        self.structured    = domain[0] != enums.SizeDomain.all
+        
+    def get_possible_values(self, product_bound):
+        possible_values = [x for x in self.values if x <= product_bound]
+        if not possible_values:
+            # The bound leaves nothing, so take the smallest size
+            return self.values[:1]
+        return possible_values
+    
+    def random_value(self, rng):
         the_values    = []
         product_bound = self.product_bound
         for i in range(0,self.dimensions):
-            possible_values = [x for x in range(self.lower_bound, self.upper_bound) if x <= product_bound]
-            idx             = random.randint(0,len(possible_values)-1)
+            possible_values = self.get_possible_values(product_bound)
+            idx             = rng.randint(0,len(possible_values)-1)
             the_value       = possible_values[idx]
             the_values.append(the_value)
             product_bound /= the_value
-        random.shuffle(the_values)
+        rng.shuffle(the_values)
         size_tuple = ()
         for i in range(0,self.dimensions):
             size_tuple += (the_values[i],)
         return size_tuple
 
-    def permute(self, old_size_tuple):
+    def permute(self, old_size_tuple, rng):
         new_size_tuple = ()
         product_bound  = self.product_bound
         for i in range(0, self.dimensions):
-            possible_values = [x for x in range(self.lower_bound, self.upper_bound) if x <= product_bound]
+            possible_values = self.get_possible_values(product_bound)
             old_value       = old_size_tuple[i]
             if old_value not in possible_values:
                 idx = len(possible_values)-1
             else:
                 idx = possible_values.index(old_size_tuple[i])
-            distance = random.randint(0, 5) 
-            if bool(random.getrandbits(1)):
-                new_idx = (idx + distance) % len(possible_values)
+            if self.structured:
+                # Move to a neighbouring domain value, e.g. double or halve a power
+                # of two, rather than jump across the domain
+                if bool(rng.getrandbits(1)):
+                    new_idx = min(idx + 1, len(possible_values)-1)
+                else:
+                    new_idx = max(idx - 1, 0)
             else:
-                new_idx = (idx - distance) % len(possible_values)
+                distance = rng.randint(0, 5) 
+                if bool(rng.getrandbits(1)):
+                    new_idx = (idx + distance) % len(possible_values)
+                else:
+                    new_idx = (idx - distance) % len(possible_values)
             the_value = possible_values[new_idx]
             product_bound /= the_value
             new_size_tuple += (the_value,)
         return new_size_tuple
     
 class TileSize(Size):
-    def __init__(self, dimensions):
+    def __init__(self, dimensions, kernel_number=None):
         Size.__init__(self, dimensions,
                       config.Arguments.tile_size_range[0],
                       config.Arguments.tile_size_range[1],
-                      config.Arguments.tile_size_product_bound)
+                      config.Arguments.tile_size_product_bound,
+                      config.Arguments.tile_size_domain)
+        # The kernel whose tile this is, or None for a tile shared by all kernels
+        self.kernel_number = kernel_number
+        
+    def random_value(self, rng):
+        if not tile_model.kernels:
+            return Size.random_value(self, rng)
+        # Draw several tiles and let the cost model pick among them
+        candidates = [Size.random_value(self, rng) for i in range(0, config.Arguments.tile_model_samples)]
+        return tile_model.choose(self.kernel_number, candidates, rng)
+    
+    def permute(self, old_size_tuple, rng):
+        if not tile_model.kernels:
+            return Size.permute(self, old_size_tuple, rng)
+        candidates = [Size.permute(self, old_size_tuple, rng) for i in range(0, config.Arguments.tile_model_samples)]
+        return tile_model.choose(self.kernel_number, candidates, rng)
         
 class BlockSize(Size):
     def __init__(self, dimensions):
         Size.__init__(self, dimensions,
               config.Arguments.block_size_range[0],
               config.Arguments.block_size_range[1],
-              config.Arguments.block_size_product_bound)
+              config.Arguments.block_size_product_bound,
+              config.Arguments.block_size_domain)
         
 class GridSize(Size):
     def __init__(self, dimensions):
         Size.__init__(self, dimensions,
               config.Arguments.grid_size_range[0],
               config.Arguments.grid_size_range[1],
-              config.Arguments.grid_size_product_bound)
+              config.Arguments.grid_size_product_bound,
+              config.Arguments.grid_size_domain)
     
 class SizeTuple:
     """Models a 3-tuple of tile, block and grid sizes"""
@@ -143,14 +254,15 @@ class SizesFlag(Flag):
                 # Rip out the kernel tile, block and grid sizes from PPCG's output
                 for size_lexeme in line.split(';'):
                     values = size_lexeme.split('->')
-                    assert len(values) == 2
+                    if len(values) != 2:
+                        raise internal_exceptions.InvalidSizesException("Unable to parse '%s' in the sizes information from PPCG output" % size_lexeme)
                     kernel_number  = re.findall(r'\d+', values[0])
                     size_parameter = re.findall(r'[a-z]+', values[1])
                     sizes          = re.findall(r'\d+', values[1])
                     sizes          = map(int, sizes)
                     if sizes:
-                        assert len(kernel_number) == 1
-                        assert len(size_parameter) == 1
+                        if len(kernel_number) != 1 or len(size_parameter) != 1:
+                            raise internal_exceptions.InvalidSizesException("Unable to parse '%s' in the sizes information from PPCG output" % size_lexeme)
                         the_kernel = kernel_number[0]
                         the_param  = size_parameter[0]
                         if the_kernel not in kernel_sizes:
@@ -162,12 +274,15 @@ class SizesFlag(Flag):
                         elif the_param == 'grid':
                             kernel_sizes[the_kernel][2] = sizes
                         else:
-                            assert False, "Unknown sizes parameter %s for kernel %s" % (the_param, the_kernel)
+                            raise internal_exceptions.InvalidSizesException("Unknown sizes parameter %s for kernel %s" % (the_param, the_kernel))
                 for the_kernel in kernel_sizes.keys():
+                    if None in kernel_sizes[the_kernel]:
+                        raise internal_exceptions.InvalidSizesException("PPCG output lacks the tile, block or grid sizes of kernel %s" % the_kernel)
                     kernel_sizes[the_kernel] = SizeTuple(tuple(kernel_sizes[the_kernel][0]), 
                                                          tuple(kernel_sizes[the_kernel][1]), 
                                                          tuple(kernel_sizes[the_kernel][2]))
-        assert kernel_sizes, "Unable to find sizes information from PPCG output"
+        if not kernel_sizes:
+            raise internal_exceptions.InvalidSizesException("Unable to find sizes information from PPCG output")
         return kernel_sizes
     
     @staticmethod
@@ -189,29 +304,62 @@ class SizesFlag(Flag):
             
     def __init__(self):
         Flag.__init__(self, '--sizes')
-        self.tile_dimensions  = random.randint(1,config.Arguments.tile_dimensions)
-        self.block_dimensions = random.randint(1,config.Arguments.block_dimensions)
-        self.grid_dimensions  = random.randint(1,config.Arguments.grid_dimensions)
+        self.tile_dimensions  = random_streams.setup.randint(1,config.Arguments.tile_dimensions)
+        self.block_dimensions = random_streams.setup.randint(1,config.Arguments.block_dimensions)
+        self.grid_dimensions  = random_streams.setup.randint(1,config.Arguments.grid_dimensions)
         self.tile_size        = TileSize(self.tile_dimensions)
         self.block_size       = BlockSize(self.block_dimensions)
         self.grid_size        = GridSize(self.grid_dimensions)
-    
-    def random_value(self):
+        # The tile, block and grid sizes of each kernel, once the kernels are known
+        self.kernels          = None
+        
+    def set_kernels(self, kernel_sizes):
+        """Tune the sizes of each kernel individually from the outset. The kernels, 
+        and the number of tile, block and grid dimensions of each, come from the 
+        output of a PPCG --dump-sizes run"""
+        self.kernels = collections.OrderedDict()
+        for kernel_number in sorted(kernel_sizes.keys(), key=int):
+            size_tuple = kernel_sizes[kernel_number]
+            self.kernels[kernel_number] = (TileSize(len(size_tuple.tile_size), kernel_number),
+                                           BlockSize(len(size_tuple.block_size)),
+                                           GridSize(len(size_tuple.grid_size)))
+            
+    def get_sizes(self, kernel_number, size_tuple):
+        if self.kernels and kernel_number in self.kernels:
+            return self.kernels[kernel_number]
+        if kernel_number == SizesFlag.ALL_KERNELS_SENTINEL:
+            return (self.tile_size, self.block_size, self.grid_size)
+        # A kernel we have only seen through its sizes
+        return (TileSize(len(size_tuple.tile_size), kernel_number),
+                BlockSize(len(size_tuple.block_size)),
+                GridSize(len(size_tuple.grid_size)))
+    
+    def random_value(self, rng):
         per_kernel_size_info = collections.OrderedDict()
-        per_kernel_size_info[SizesFlag.ALL_KERNELS_SENTINEL] = SizeTuple(self.tile_size.random_value(), 
-                                                                         self.block_size.random_value(),
-                                                                         self.grid_size.random_value())
+        if self.kernels:
+            for kernel_number, (tile_size, block_size, grid_size) in self.kernels.iteritems():
+                per_kernel_size_info[kernel_number] = SizeTuple(tile_size.random_value(rng),
+                                                                block_size.random_value(rng),
+                                                                grid_size.random_value(rng))
+            return per_kernel_size_info
+        per_kernel_size_info[SizesFlag.ALL_KERNELS_SENTINEL] = SizeTuple(self.tile_size.random_value(rng), 
+                                                                         self.block_size.random_value(rng),
+                                                                         self.grid_size.random_value(rng))
         return per_kernel_size_info
     
-    def permute(self, value):
+    def permute(self, value, rng):
         per_kernel_size_info = collections.OrderedDict()
         for kernel_number, size_tuple in value.iteritems():
-            new_tile_size  = self.tile_size.permute(size_tuple.tile_size)
-            new_block_size = self.block_size.permute(size_tuple.block_size)
-            new_grid_size  = self.grid_size.permute(size_tuple.grid_size)
-            per_kernel_size_info[kernel_number] = SizeTuple(new_tile_size, new_block_size, new_grid_size)
+            per_kernel_size_info[kernel_number] = self.permute_kernel(kernel_number, size_tuple, rng)
         return per_kernel_size_info
         
+    def permute_kernel(self, kernel_number, size_tuple, rng):
+        """Permute the sizes of a single kernel"""
+        tile_size, block_size, grid_size = self.get_sizes(kernel_number, size_tuple)
+        return SizeTuple(tile_size.permute(size_tuple.tile_size, rng),
+                         block_size.permute(size_tuple.block_size, rng),
+                         grid_size.permute(size_tuple.grid_size, rng))
+        
     def get_command_line_string(self, value):
         per_kernel_size_strings = []
         for kernel_number, size_tuple in value.iteritems():
@@ -311,11 +459,13 @@ class CC:
     """All C compiler flags"""
     
     optimisation_flags = []
+    rules              = []
     
 class CXX:
     """All C++ compiler flags"""
     
     optimisation_flags = []
+    rules              = []
     
 class NVCC:
     """All CUDA compiler flags"""
@@ -913,3 +1063,82 @@ class GNU:
     
     optimisation_flags_482 = optimisation_flags_480[:]
     
+    
+class Clang:
+    """Optimisation flags for clang/clang++ beyond the -O levels"""
+    
+    optimisation_flags = [ToggleFlag('-funroll-loops'),
+                          ToggleFlag('-fvectorize'),
+                          ToggleFlag('-fslp-vectorize'),
+                          ToggleFlag('-finline-functions'),
+                          ToggleFlag('-fomit-frame-pointer'),
+                          ToggleFlag('-fstrict-aliasing'),
+                          ToggleFlag('-fmerge-all-constants'),
+                          ToggleFlag('-fjump-tables'),
+                          EnumerationFlag('-mllvm -unroll-threshold', [None, 50, 150, 300, 600], "="),
+                          EnumerationFlag('-mllvm -inline-threshold', [None, 75, 225, 500, 1000], "=")]
+    
+    optimisation_levels = ['0', '1', '2', '3', 's', 'z', 'fast']
+    
+    # Conflicts come first, as the flags they reset may in turn have dependents
+    rules = [Conflict('-O', 's', '-funroll-loops', True),
+             Conflict('-O', 'z', '-funroll-loops', True),
+             Dependency('-mllvm -unroll-threshold', '-funroll-loops', [None, True])]
+    
+# Further gcc/g++ flags that no -O level turns on
+GNU.extra_optimisation_flags = [ToggleFlag('-funroll-loops'),
+                                ToggleFlag('-fpeel-loops'),
+                                ToggleFlag('-fprefetch-loop-arrays'),
+                                EnumerationFlag('--param max-unroll-times', [None, 2, 4, 8, 16], "="),
+                                EnumerationFlag('--param max-inline-insns-auto', [None, 15, 30, 60, 120], "="),
+                                EnumerationFlag('--param max-inline-insns-single', [None, 200, 400, 800], "="),
+                                EnumerationFlag('--param inline-unit-growth', [None, 20, 40, 80, 160], "=")]
+
+GNU.optimisation_levels = ['0', '1', '2', '3', 's', 'fast']
+
+GNU.rules = [Conflict('-O', 's', '-funroll-loops', True),
+             Dependency('--param max-unroll-times', '-funroll-loops', [True]),
+             Dependency('-fvect-cost-model', '-ftree-vectorize', [None, True])]
+
+def get_compiler_family(command):
+    """Whether the compiler command is (a version of) clang or gcc"""
+    executable = os.path.basename(command.split()[0])
+    if executable.startswith(enums.Compilers.clang):
+        return enums.Compilers.clang
+    return enums.Compilers.gcc
+
+def get_gcc_versions():
+    """The gcc versions whose flags are known, e.g. '4.8.2' for GNU.optimisation_flags_482"""
+    versions = []
+    for name in dir(GNU):
+        match = re.match(r'optimisation_flags_(\d)(\d)(\d)$', name)
+        if match:
+            versions.append("%s.%s.%s" % match.groups())
+    return sorted(versions)
+
+def get_host_flag_space(command, gcc_version, march_choices):
+    """The optimisation flags, and the rules between them, of the given C or C++ compiler"""
+    if get_compiler_family(command) == enums.Compilers.clang:
+        the_flags = Clang.optimisation_flags[:]
+        levels    = Clang.optimisation_levels
+        rules     = Clang.rules[:]
+    else:
+        the_flags = []
+        for flag in getattr(GNU, "optimisation_flags_%s" % gcc_version.replace('.', '')) + GNU.extra_optimisation_flags:
+            if isinstance(flag, EnumerationFlag) and flag.possible_values == [True, False]:
+                flag = ToggleFlag(flag.name)
+            if flag not in the_flags:
+                the_flags.append(flag)
+        levels = GNU.optimisation_levels
+        rules  = GNU.rules[:]
+    # No optimisation takes effect at -O0. These rules go after the conflicts, like
+    # every dependency, but before the other dependencies, whose flags they may reset
+    conflicts = len([rule for rule in rules if isinstance(rule, Conflict)])
+    rules[conflicts:conflicts] = [Dependency(flag.name, '-O', [level for level in levels if level != '0']) for flag in the_flags]
+    the_flags.insert(0, EnumerationFlag('-O', levels, ""))
+    the_flags.append(EnumerationFlag('-march', [None] + march_choices, "="))
+    return the_flags, rules
+
+def apply_rules(flags, rules):
+    for rule in rules:
+        rule.apply(flags)
@@ -5,12 +5,18 @@ class Arguments:
 
 # Timing data
 time_PPCG    = 0.0
+time_opt     = 0.0
 time_backend = 0.0
+time_VOBLA   = 0.0
 time_binary  = 0.0
 
 def summarise_timing():
     print("%s Summary of timing %s" % ('*' * 30, '*' * 30))
     print("Total time running PPCG:               %.2f seconds" % (time_PPCG))
+    if time_opt:
+        print("Total time running opt:                %.2f seconds" % (time_opt))
     print("Total time running build:              %.2f seconds" % (time_backend))
+    if time_VOBLA:
+        print("Total time building test cases:        %.2f seconds" % (time_VOBLA))
     print("Total time running generated binaries: %.2f seconds" % (time_binary))
     print
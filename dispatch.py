@@ -0,0 +1,178 @@
+import os
+import json
+import itertools
+import collections
+import config
+import enums
+import debug
+import telemetry
+
+# Every configuration which passed, by its flags, so that a configuration met
+# again, e.g. by the search for another size class, is not compiled and run twice
+evaluations = collections.OrderedDict()
+reused      = 0
+# The size classes whose search completed
+searched    = []
+
+# The attributes of an evaluated individual which a reused evaluation copies
+measured = ["ppcg_cmd_line_flags", "size_data", "ppcg_usage", "build_usage", "run_usages",
+            "kernel_times", "size_times", "cpu_time", "max_rss"]
+
+def get_size_classes():
+    """Every combination of the --problem-size values, each as a map from parameter
+    name to value, in the order in which the size classes are numbered"""
+    if not config.Arguments.problem_size:
+        return []
+    names = [name for name, values in config.Arguments.problem_size]
+    return [collections.OrderedDict(zip(names, point))
+            for point in itertools.product(*[values for name, values in config.Arguments.problem_size])]
+
+def reuse(solution):
+    """Give the individual the times measured for an earlier individual with the
+    same configuration. Returns False if there is none"""
+    global reused
+    key = solution.get_configuration_key()
+    if key not in evaluations:
+        telemetry.cache_miss("evaluation")
+        return False
+    telemetry.cache_hit("evaluation")
+    reused += 1
+    earlier = evaluations[key]
+    for attribute in measured:
+        if hasattr(earlier, attribute):
+            setattr(solution, attribute, getattr(earlier, attribute))
+    # Every run reports all size classes, so only the mix of them is redone
+    solution.execution_time = solution.mix_size_times(solution.size_times)
+    solution.status         = enums.Status.passed
+    solution.failed_stage   = None
+    debug.verbose_message("Individual %d reuses the times of individual %d" % (solution.ID, earlier.ID), __name__)
+    return True
+
+def record(solution):
+    if solution.status == enums.Status.passed and solution.size_times:
+        evaluations.setdefault(solution.get_configuration_key(), solution)
+
+def get_winners():
+    """The fastest configuration of each size class over all evaluations, or None
+    for a class which no configuration passed"""
+    winners = []
+    for size_class in range(0, len(get_size_classes())):
+        best = None
+        for solution in evaluations.values():
+            the_time = solution.size_times.get(str(size_class))
+            if the_time is not None and (best is None or the_time < best.size_times[str(size_class)]):
+                best = solution
+        winners.append(best)
+    return winners
+
+def get_variants(winners):
+    """The distinct winning configurations, which are the variants to precompile"""
+    variants = []
+    for solution in winners:
+        if solution is not None and solution not in variants:
+            variants.append(solution)
+    return variants
+
+def export(table_filename, selector_filename):
+    """Write the dispatch table as JSON and a C header whose selector maps a
+    runtime problem size to the variant of the nearest size class"""
+    winners  = get_winners()
+    variants = get_variants(winners)
+    classes  = get_size_classes()
+    table    = collections.OrderedDict()
+    table["parameters"] = [name for name, values in config.Arguments.problem_size]
+    table["variants"]   = []
+    for solution in variants:
+        variant = collections.OrderedDict()
+        variant["individual"] = solution.ID
+        variant["ppcg_flags"] = solution.ppcg_cmd_line_flags
+        for flags_attribute in ["cc_flags", "cxx_flags", "nvcc_flags"]:
+            variant[flags_attribute] = solution.get_command_line_string(flags_attribute)
+        table["variants"].append(variant)
+    table["classes"] = []
+    for size_class, (sizes, solution) in enumerate(zip(classes, winners)):
+        entry = collections.OrderedDict()
+        entry["class"]          = size_class
+        entry["sizes"]          = sizes
+        # The variant of a class whose search failed or was interrupted may still
+        # come from the evaluations of other searches, but was not searched for
+        entry["searched"]       = size_class in searched
+        entry["variant"]        = variants.index(solution) if solution is not None else None
+        entry["execution_time"] = solution.size_times[str(size_class)] if solution is not None else None
+        table["classes"].append(entry)
+    with open(table_filename, 'w') as f:
+        json.dump(table, f, indent=2)
+    with open(selector_filename, 'w') as f:
+        f.write(create_selector(table))
+    debug.verbose_message("Wrote dispatch table '%s' and selector '%s'" % (table_filename, selector_filename), __name__)
+
+def create_selector(table):
+    """C text of the selector. Distance between a runtime size and a size class is
+    the product over the parameters of the ratio of the larger to the smaller size,
+    i.e. the distance in log space without needing libm. Classes which no
+    configuration passed are skipped"""
+    guard      = "AUTOTUNER_DISPATCH_%s" % ''.join(c if c.isalnum() else '_' for c in os.path.basename(config.Arguments.dispatch_selector).upper())
+    parameters = table["parameters"]
+    classes    = [entry for entry in table["classes"] if entry["variant"] is not None]
+    lines      = []
+    lines.append("/* Generated by the auto-tuner: variant of each size class of %s */" % ' '.join(parameters))
+    lines.append("#ifndef %s" % guard)
+    lines.append("#define %s" % guard)
+    lines.append("")
+    not_searched = [str(entry["class"]) for entry in table["classes"] if not entry["searched"]]
+    if not_searched:
+        lines.append("/* Not searched, so possibly not the best variant: size classes %s */" % ', '.join(not_searched))
+    lines.append("#define AUTOTUNER_VARIANTS %d" % len(table["variants"]))
+    for number, variant in enumerate(table["variants"]):
+        lines.append("#define AUTOTUNER_VARIANT_%d_PPCG_FLAGS %s" % (number, json.dumps(variant["ppcg_flags"])))
+    lines.append("")
+    if classes:
+        lines.append("static const long autotuner_class_sizes[%d][%d] = {" % (len(classes), len(parameters)))
+        lines.append(",\n".join("  {%s}" % ", ".join("%dL" % entry["sizes"][name] for name in parameters) for entry in classes))
+        lines.append("};")
+        lines.append("static const int autotuner_class_variants[%d] = {%s};" % (len(classes), ", ".join(str(entry["variant"]) for entry in classes)))
+        lines.append("")
+    lines.append("/* The variant to run at the given problem size, or -1 if none was tuned */")
+    lines.append("static inline int autotuner_select_variant(%s)" % ", ".join("long %s" % name for name in parameters))
+    lines.append("{")
+    if classes:
+        lines.append("  const long sizes[%d] = {%s};" % (len(parameters), ", ".join(parameters)))
+        lines.append("  int best = 0, i, j;")
+        lines.append("  double best_distance = 0.0;")
+        lines.append("  for (i = 0; i < %d; i++) {" % len(classes))
+        lines.append("    double distance = 1.0;")
+        lines.append("    for (j = 0; j < %d; j++) {" % len(parameters))
+        lines.append("      double size  = sizes[j] > 0 ? (double) sizes[j] : 1.0;")
+        lines.append("      double point = (double) autotuner_class_sizes[i][j];")
+        lines.append("      distance *= size > point ? size / point : point / size;")
+        lines.append("    }")
+        lines.append("    if (i == 0 || distance < best_distance) {")
+        lines.append("      best          = i;")
+        lines.append("      best_distance = distance;")
+        lines.append("    }")
+        lines.append("  }")
+        lines.append("  return autotuner_class_variants[best];")
+    else:
+        lines.append("  return -1;")
+    lines.append("}")
+    lines.append("")
+    lines.append("#endif")
+    return "\n".join(lines) + "\n"
+
+def summarise():
+    print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+    print("Evaluations reused across size classes: %d" % (reused))
+    winners  = get_winners()
+    variants = get_variants(winners)
+    for size_class, (sizes, solution) in enumerate(zip(get_size_classes(), winners)):
+        description = ' '.join("%s=%d" % (name, value) for name, value in sizes.iteritems())
+        if size_class not in searched:
+            description += ", not searched"
+        if solution is None:
+            print("Size class %d (%s): no configuration passed" % (size_class, description))
+        else:
+            print("Size class %d (%s): variant %d, execution time %f seconds" % (size_class, description, variants.index(solution), solution.size_times[str(size_class)]))
+    for number, solution in enumerate(variants):
+        debug.summary_message("Variant %d, individual %d, passes the following to PPCG:" % (number, solution.ID))
+        debug.summary_message(solution.ppcg_cmd_line_flags, False)
+    print
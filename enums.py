@@ -18,6 +18,40 @@ class SearchStrategy:
     ga                  = "ga"
     random              = "random"
     simulated_annealing = "simulated-annealing"
+    decomposed_sizes    = "decomposed-sizes"
+    nsga2               = "nsga2"
+    llvm_passes         = "llvm-passes"
+
+class SizeDomain:
+    all       = "all"
+    pow2      = "pow2"
+    multiple  = "multiple"
+    divisors  = "divisors"
+    list      = "list"
+
+class Scheduler:
+    local = "local"
+    pbs   = "pbs"
+
+class TraceCategory:
+    ppcg   = "ppcg"
+    opt    = "opt"
+    build  = "build"
+    binary = "binary"
+    queue  = "queue"
+    cache  = "cache"
+
+class FitnessMetric:
+    wall_time = "wall-time"
+    cpu_time  = "cpu-time"
+
+class Stage:
+    occupancy = "occupancy"
+    ppcg      = "ppcg"
+    opt       = "opt"
+    build     = "build"
+    binary    = "binary"
+    memory    = "memory"
 
 class Status:
     passed = "passed"
@@ -0,0 +1,140 @@
+import json
+import math
+import collections
+import config
+import debug
+import enums
+import compiler_flags
+import random_streams
+
+class Sample:
+    """The outcome of evaluating one configuration"""
+
+    def __init__(self, features, failed_stage):
+        self.features     = features
+        self.failed_stage = failed_stage
+
+def size_products(value):
+    """The largest tile, block and grid size products over all kernels"""
+    products = [0, 0, 0]
+    for size_tuple in value.values():
+        for idx, sizes in enumerate([size_tuple.tile_size, size_tuple.block_size, size_tuple.grid_size]):
+            product = reduce(lambda x, y: x * y, sizes, 1)
+            products[idx] = max(products[idx], product)
+    # Work on a logarithmic scale: size products span several orders of magnitude
+    return [math.log(product, 2) if product else 0.0 for product in products]
+
+def features(solution):
+    """Encode the configuration of an individual as a vector of numbers"""
+    vector = []
+    for flag, value in zip(solution.all_flags(), solution.all_flag_values()):
+        if isinstance(flag, compiler_flags.SizesFlag):
+            vector.extend(size_products(value))
+        elif type(value) is bool:
+            vector.append(1.0 if value else 0.0)
+        elif isinstance(value, (int, long, float)):
+            vector.append(float(value))
+        else:
+            vector.append(float(flag.possible_values.index(value)))
+    return vector
+
+class InfeasibilityPredictor:
+    """Learns online, by k-nearest neighbours, which configurations fail in PPCG,
+    in the build or when run, so that they can be rejected or repaired before
+    they are compiled"""
+
+    def __init__(self):
+        self.samples      = []
+        self.rejected     = 0
+        self.repaired     = 0
+        self.failures     = collections.OrderedDict()
+        self.wasted_time  = 0.0
+        self.compile_time = 0.0
+        self.compilations = 0
+        if config.Arguments.failure_log:
+            open(config.Arguments.failure_log, 'w').close()
+
+    def record(self, solution):
+        if solution.status == enums.Status.passed:
+            failed_stage = None
+        else:
+            failed_stage = solution.failed_stage
+            self.failures[failed_stage] = self.failures.get(failed_stage, 0) + 1
+            if config.Arguments.failure_log:
+                with open(config.Arguments.failure_log, 'a') as f:
+                    f.write(json.dumps(collections.OrderedDict([("individual", solution.ID),
+                                                                ("stage", failed_stage),
+                                                                ("ppcg_flags", ' '.join(flag.get_command_line_string(value) for flag, value in solution.ppcg_flags.iteritems())),
+                                                                ("nvcc_flags", ' '.join(flag.get_command_line_string(value) for flag, value in solution.nvcc_flags.iteritems()))])) + "\n")
+        # Track how much compilation went into configurations that failed anyway
+        compile_time = 0.0
+        for usage in [getattr(solution, "ppcg_usage", None), getattr(solution, "build_usage", None)]:
+            if usage:
+                compile_time += usage.wall_time
+        self.compile_time += compile_time
+        self.compilations += 1
+        if failed_stage:
+            self.wasted_time += compile_time
+        self.samples.append(Sample(features(solution), failed_stage))
+
+    def normalise(self, vectors):
+        lows  = [min(column) for column in zip(*vectors)]
+        highs = [max(column) for column in zip(*vectors)]
+        return [[(x - low) / (high - low) if high > low else 0.0 for x, low, high in zip(vector, lows, highs)]
+                for vector in vectors]
+
+    def predict(self, solution):
+        """Return the stage at which the individual is predicted to fail, or None if
+        it is predicted to be feasible (or there is too little data to say)"""
+        if len(self.samples) < config.Arguments.infeasibility_min_samples:
+            return None
+        if not any(sample.failed_stage for sample in self.samples):
+            return None
+        vectors   = self.normalise([sample.features for sample in self.samples] + [features(solution)])
+        query     = vectors.pop()
+        distances = [(sum((a - b) ** 2 for a, b in zip(query, vector)), sample)
+                     for vector, sample in zip(vectors, self.samples)]
+        distances.sort(key=lambda x: x[0])
+        neighbours = [sample for distance, sample in distances[:config.Arguments.infeasibility_neighbours]]
+        failed     = [sample.failed_stage for sample in neighbours if sample.failed_stage]
+        if float(len(failed)) / len(neighbours) >= config.Arguments.infeasibility_threshold:
+            return collections.Counter(failed).most_common(1)[0][0]
+        return None
+
+    def repair(self, solution):
+        # Re-sample about half of the flags, as GA mutation does
+        for flags in [solution.ppcg_flags, solution.cc_flags, solution.cxx_flags, solution.nvcc_flags]:
+            for flag in flags.keys():
+                if bool(random_streams.repair.getrandbits(1)):
+                    flags[flag] = flag.random_value(random_streams.repair)
+
+    def screen(self, solution):
+        """Return False if the individual should not be compiled because it is predicted
+        to fail. Predicted failures are repaired where possible"""
+        stage = self.predict(solution)
+        if stage is None:
+            return True
+        for attempt in range(0, config.Arguments.repair_attempts):
+            self.repair(solution)
+            if self.predict(solution) is None:
+                debug.verbose_message("Repaired individual %d, which was predicted to fail in %s" % (solution.ID, stage), __name__)
+                self.repaired += 1
+                return True
+        debug.verbose_message("Rejected individual %d, which is predicted to fail in %s" % (solution.ID, stage), __name__)
+        self.rejected += 1
+        solution.failed_stage = stage
+        return False
+
+    def summarise(self):
+        print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+        for stage, count in self.failures.iteritems():
+            print("Failures in stage '%s': %d" % (stage, count))
+        print("Compile time spent on failed configurations: %.2f seconds" % (self.wasted_time))
+        print("Configurations repaired before compilation:  %d" % (self.repaired))
+        print("Configurations rejected before compilation:  %d" % (self.rejected))
+        if self.compilations:
+            print("Estimated compile time saved by rejection:   %.2f seconds" % (self.rejected * self.compile_time / self.compilations))
+        print
+
+# The predictor consulted before every compilation, if enabled
+predictor = None
@@ -1,5 +1,6 @@
 import abc
-import random
+import json
+import random_streams
 import math
 import copy
 import config
@@ -7,9 +8,20 @@ import compiler_flags
 import enums
 import debug
 import individual
+import llvm_passes
+import telemetry
 import collections
 import internal_exceptions
 
+def replicate_message(fittest):
+    debug.summary_message("To replicate, pass the following to PPCG:")
+    debug.summary_message(fittest.ppcg_cmd_line_flags, False)
+    if config.Arguments.tune_host_flags:
+        debug.summary_message("the following to '%s':" % config.Arguments.cc)
+        debug.summary_message(fittest.get_command_line_string("cc_flags"), False)
+        debug.summary_message("and the following to '%s':" % config.Arguments.cxx)
+        debug.summary_message(fittest.get_command_line_string("cxx_flags"), False)
+
 class SearchStrategy:
     """Abstract class for a search strategy"""
     
@@ -25,15 +37,17 @@ class GA(SearchStrategy):
     """Search using a genetic algorithm"""
     
     def set_child_flags(self, child, the_flags, the_flag_values):
+        # The C and C++ compilers share flag names, so a flag goes to the first
+        # compiler, in the order of Individual.all_flags, which does not have it yet
+        compilers = [(compiler_flags.PPCG, child.ppcg_flags),
+                     (compiler_flags.CC, child.cc_flags),
+                     (compiler_flags.CXX, child.cxx_flags),
+                     (compiler_flags.NVCC, child.nvcc_flags)]
         for idx, flag in enumerate(the_flags):
-            if flag in compiler_flags.PPCG.optimisation_flags:
-                child.ppcg_flags[flag] = the_flag_values[idx]
-            elif flag in compiler_flags.CC.optimisation_flags:
-                child.cc_flags[flag] = the_flag_values[idx]
-            elif flag in compiler_flags.CXX.optimisation_flags:
-                child.cxx_flags[flag] = the_flag_values[idx]
-            elif flag in compiler_flags.NVCC.optimisation_flags:
-                child.nvcc_flags[flag] = the_flag_values[idx]
+            for the_compiler, child_flags in compilers:
+                if flag in the_compiler.optimisation_flags and flag not in child_flags:
+                    child_flags[flag] = the_flag_values[idx]
+                    break
             else:
                 assert False, "Unknown flag %s" % flag
                 
@@ -54,7 +68,7 @@ class GA(SearchStrategy):
         
         # Compute the crossover indices            
         point1 = 0
-        point2 = random.randint(point1, len(mother_flags))
+        point2 = random_streams.crossover.randint(point1, len(mother_flags))
         point3 = len(mother_flags)
         
         child1_flags = []
@@ -84,8 +98,8 @@ class GA(SearchStrategy):
         
         # Compute the crossover indices            
         point1 = 0
-        point2 = random.randint(point1, len(mother_flags))
-        point3 = random.randint(point2, len(mother_flags))
+        point2 = random_streams.crossover.randint(point1, len(mother_flags))
+        point3 = random_streams.crossover.randint(point2, len(mother_flags))
         point4 = len(mother_flags)
         
         child1_flags = []
@@ -112,23 +126,23 @@ class GA(SearchStrategy):
     def select_parent(self, cumulative_fitnesses):
         # This implements roulette wheel selection
         for tup in cumulative_fitnesses:
-            if tup[0] > random.uniform(0.0,1.0):
+            if tup[0] > random_streams.selection.uniform(0.0,1.0):
                 return tup[1]
     
     def do_mutation(self, child):
         debug.verbose_message("Mutating child %d" % child.ID, __name__)
         for flag in child.ppcg_flags.keys():   
-            if bool(random.getrandbits(1)):
-                child.ppcg_flags[flag] = flag.random_value()
+            if bool(random_streams.mutation.getrandbits(1)):
+                child.ppcg_flags[flag] = flag.random_value(random_streams.mutation)
         for flag in child.cc_flags.keys():    
-            if bool(random.getrandbits(1)):
-                child.cc_flags[flag] = flag.random_value()
+            if bool(random_streams.mutation.getrandbits(1)):
+                child.cc_flags[flag] = flag.random_value(random_streams.mutation)
         for flag in child.cxx_flags.keys():    
-            if bool(random.getrandbits(1)):
-                child.cxx_flags[flag] = flag.random_value()
+            if bool(random_streams.mutation.getrandbits(1)):
+                child.cxx_flags[flag] = flag.random_value(random_streams.mutation)
         for flag in child.nvcc_flags.keys():    
-            if bool(random.getrandbits(1)):
-                child.nvcc_flags[flag] = flag.random_value()
+            if bool(random_streams.mutation.getrandbits(1)):
+                child.nvcc_flags[flag] = flag.random_value(random_streams.mutation)
     
     def create_initial(self):
         new_population = []
@@ -142,7 +156,12 @@ class GA(SearchStrategy):
         for individual in old_population:
             total_fitness += individual.fitness
         for individual in old_population:
-            individual.fitness /= total_fitness
+            if total_fitness:
+                individual.fitness /= total_fitness
+            else:
+                # Every individual failed, which can only happen when failures do 
+                # not abort the search, so select among them uniformly
+                individual.fitness = 1.0/len(old_population)
         old_population.sort(key=lambda x: x.fitness, reverse=True)
     
     def do_evolution(self, old_population):     
@@ -182,23 +201,23 @@ class GA(SearchStrategy):
             father    = self.select_parent(cumulative_fitnesses)
             # Create as many children as needed
             if len(new_population) < len(old_population) - 2:
-                if random.uniform(0.0, 1.0) < config.Arguments.crossover_rate:
+                if random_streams.crossover.uniform(0.0, 1.0) < config.Arguments.crossover_rate:
                     childList = crossover(mother, father, 2)
                     self.total_crossovers += 1
                 else:
                     childList = [mother, father]
             else:
-                if random.uniform(0.0, 1.0) < config.Arguments.crossover_rate:
+                if random_streams.crossover.uniform(0.0, 1.0) < config.Arguments.crossover_rate:
                     childList = crossover(mother, father, 1)
                     self.total_crossovers += 1
                 else:
-                    if bool(random.getrandbits(1)):
+                    if bool(random_streams.selection.getrandbits(1)):
                         childList = [mother]
                     else:
                         childList = [father]
             # Mutate
             for child in childList:
-                if random.uniform(0.0, 1.0) < config.Arguments.mutation_rate:
+                if random_streams.mutation.uniform(0.0, 1.0) < config.Arguments.mutation_rate:
                     self.total_mutations += 1
                     self.do_mutation(child)    
             # Add the children to the new population
@@ -207,6 +226,20 @@ class GA(SearchStrategy):
         assert len(new_population) == len(old_population)
         return new_population    
     
+    def diversity(self, population):
+        """The mean fraction of flags on which two individuals in the population differ"""
+        genomes = [[str(value) for value in solution.all_flag_values()] for solution in population]
+        pairs   = 0
+        total   = 0.0
+        for i in range(0, len(genomes)):
+            for j in range(i+1, len(genomes)):
+                differences = sum(1 for a, b in zip(genomes[i], genomes[j]) if a != b)
+                total      += float(differences) / max(len(genomes[i]), 1)
+                pairs      += 1
+        if not pairs:
+            return 0.0
+        return total / pairs
+    
     def run(self):        
         self.generations      = collections.OrderedDict()  
         self.total_mutations  = 0
@@ -235,8 +268,10 @@ class GA(SearchStrategy):
                 debug.verbose_message("Now tuning individual kernel sizes", __name__)
                 the_sizes_flag = compiler_flags.PPCG.flag_map[compiler_flags.PPCG.sizes]
                 old_population = self.generations[generation-1]
-                for individual in old_population:
-                    individual.ppcg_flags[the_sizes_flag] = individual.size_data
+                for solution in old_population:
+                    # Individuals which were rejected, or for which PPCG failed, keep their sizes
+                    if getattr(solution, "size_data", None) is not None:
+                        solution.ppcg_flags[the_sizes_flag] = solution.size_data
                 self.generations[generation] = self.do_evolution(old_population)
                 legal_transitions.remove((state_basic_evolution, state_sizes_evolution))
                 next_state = state_basic_evolution
@@ -244,14 +279,15 @@ class GA(SearchStrategy):
                 assert False, "Unknown state reached"
             
             # Generation created, now calculate the fitness of each individual
-            for solution in self.generations[generation]:
-                solution.run()
+            individual.run_population(self.generations[generation])
+            telemetry.generation_finished(generation, self.diversity(self.generations[generation]))
                 
             if current_state == state_basic_evolution:
                 # Decide whether to start tuning on individual kernel sizes in the next state
                 if not config.Arguments.no_tune_kernel_sizes \
+                and not compiler_flags.PPCG.flag_map[compiler_flags.PPCG.sizes].kernels \
                 and (state_basic_evolution, state_sizes_evolution) in legal_transitions \
-                and bool(random.getrandbits(1)):
+                and bool(random_streams.selection.getrandbits(1)):
                     next_state = state_sizes_evolution
                     
             current_state = next_state
@@ -266,11 +302,182 @@ class GA(SearchStrategy):
             try:
                 fittest = individual.get_fittest(population)
                 debug.summary_message("The fittest individual from generation %d had execution time %f seconds" % (generation, fittest.execution_time)) 
-                debug.summary_message("To replicate, pass the following to PPCG:")
-                debug.summary_message(fittest.ppcg_cmd_line_flags, False)
+                replicate_message(fittest)
             except internal_exceptions.NoFittestException:
                 pass            
 
+class NSGA2(GA):
+    """Multi-objective search using NSGA-II. Execution time is traded off against 
+    compile time (PPCG plus the build) and, optionally, peak memory use"""
+    
+    def __init__(self):
+        # Set before the search runs so that an interrupted search can be summarised
+        self.evaluated        = []
+        self.total_mutations  = 0
+        self.total_crossovers = 0
+    
+    def objectives(self, solution):
+        if solution.status != enums.Status.passed:
+            return [float("inf")] * self.number_of_objectives
+        values = [solution.execution_time, solution.compile_time()]
+        if config.Arguments.minimise_max_rss:
+            values.append(solution.max_rss)
+        return values
+    
+    def dominates(self, first, second):
+        return all(a <= b for a, b in zip(first.objective_values, second.objective_values)) \
+           and any(a < b for a, b in zip(first.objective_values, second.objective_values))
+    
+    def non_dominated_sort(self, population):
+        """Partition the population into fronts, setting the rank of each individual"""
+        dominated_by     = collections.defaultdict(list)
+        domination_count = collections.defaultdict(int)
+        fronts           = [[]]
+        for p in population:
+            for q in population:
+                if self.dominates(p, q):
+                    dominated_by[p.ID].append(q)
+                elif self.dominates(q, p):
+                    domination_count[p.ID] += 1
+            if domination_count[p.ID] == 0:
+                p.rank = 0
+                fronts[0].append(p)
+        while fronts[-1]:
+            next_front = []
+            for p in fronts[-1]:
+                for q in dominated_by[p.ID]:
+                    domination_count[q.ID] -= 1
+                    if domination_count[q.ID] == 0:
+                        q.rank = len(fronts)
+                        next_front.append(q)
+            fronts.append(next_front)
+        return fronts[:-1]
+    
+    def set_crowding_distances(self, front):
+        for solution in front:
+            solution.crowding_distance = 0.0
+        for objective in range(0, self.number_of_objectives):
+            front.sort(key=lambda x: x.objective_values[objective])
+            front[0].crowding_distance  = float("inf")
+            front[-1].crowding_distance = float("inf")
+            lowest  = front[0].objective_values[objective]
+            highest = front[-1].objective_values[objective]
+            if highest == lowest or highest == float("inf"):
+                continue
+            for idx in range(1, len(front)-1):
+                front[idx].crowding_distance += (front[idx+1].objective_values[objective] - front[idx-1].objective_values[objective]) / (highest - lowest)
+    
+    def select_parent(self, population):
+        # Binary tournament on rank, then on crowding distance
+        first, second = random_streams.selection.sample(population, 2)
+        if first.rank != second.rank:
+            return first if first.rank < second.rank else second
+        return first if first.crowding_distance >= second.crowding_distance else second
+    
+    def clone(self, solution):
+        clone    = copy.deepcopy(solution)
+        clone.ID = individual.Individual.get_ID()
+        return clone
+    
+    def create_offspring(self, population):
+        offspring = []
+        crossover = getattr(self, config.Arguments.crossover)
+        while len(offspring) < len(population):
+            mother = self.select_parent(population)
+            father = self.select_parent(population)
+            if random_streams.crossover.uniform(0.0, 1.0) < config.Arguments.crossover_rate:
+                childList = crossover(mother, father, 2)
+                self.total_crossovers += 1
+            else:
+                childList = [self.clone(mother), self.clone(father)]
+            for child in childList:
+                if random_streams.mutation.uniform(0.0, 1.0) < config.Arguments.mutation_rate:
+                    self.total_mutations += 1
+                    self.do_mutation(child)
+            offspring.extend(childList)
+        return offspring[:len(population)]
+    
+    def evaluate(self, population):
+        individual.run_population(population)
+        for solution in population:
+            solution.objective_values = self.objectives(solution)
+        self.evaluated.extend(population)
+    
+    def select_survivors(self, population, size):
+        survivors = []
+        for front in self.non_dominated_sort(population):
+            self.set_crowding_distances(front)
+            if len(survivors) + len(front) <= size:
+                survivors.extend(front)
+            else:
+                front.sort(key=lambda x: x.crowding_distance, reverse=True)
+                survivors.extend(front[:size - len(survivors)])
+                break
+        return survivors
+    
+    def pareto_front(self):
+        """The non-dominated individuals among everything evaluated so far"""
+        passed = [solution for solution in self.evaluated if solution.status == enums.Status.passed]
+        front  = [p for p in passed if not any(self.dominates(q, p) for q in passed)]
+        front.sort(key=lambda x: x.objective_values)
+        return front
+    
+    def run(self):
+        self.generations          = collections.OrderedDict()
+        self.evaluated            = []
+        self.total_mutations      = 0
+        self.total_crossovers     = 0
+        self.number_of_objectives = 3 if config.Arguments.minimise_max_rss else 2
+        
+        debug.verbose_message("%s Creating generation 1 %s" % ('+' * 10, '+' * 10), __name__)
+        population = self.create_initial()
+        self.evaluate(population)
+        population = self.select_survivors(population, len(population))
+        self.generations[1] = population
+        telemetry.generation_finished(1, self.diversity(population))
+        for generation in xrange(2, config.Arguments.generations+1):
+            debug.verbose_message("%s Creating generation %d %s" % ('+' * 10, generation, '+' * 10), __name__)
+            offspring = self.create_offspring(population)
+            self.evaluate(offspring)
+            population = self.select_survivors(population + offspring, len(population))
+            self.generations[generation] = population
+            telemetry.generation_finished(generation, self.diversity(population))
+    
+    def objective_names(self):
+        names = ["execution_time", "compile_time"]
+        if config.Arguments.minimise_max_rss:
+            names.append("max_rss")
+        return names
+    
+    def export_pareto_front(self, filename):
+        front = []
+        for solution in self.pareto_front():
+            point = collections.OrderedDict()
+            point["individual"] = solution.ID
+            for name, value in zip(self.objective_names(), solution.objective_values):
+                point[name] = value
+            point["ppcg_flags"] = solution.ppcg_cmd_line_flags
+            point["cc_flags"]   = ' '.join(flag.get_command_line_string(value) for flag, value in solution.cc_flags.iteritems())
+            point["cxx_flags"]  = ' '.join(flag.get_command_line_string(value) for flag, value in solution.cxx_flags.iteritems())
+            point["nvcc_flags"] = ' '.join(flag.get_command_line_string(value) for flag, value in solution.nvcc_flags.iteritems())
+            front.append(point)
+        with open(filename, 'w') as f:
+            json.dump(collections.OrderedDict([("objectives", self.objective_names()), ("front", front)]), f, indent=2)
+    
+    def summarise(self):
+        # Exported here rather than at the end of run() so that an interrupted
+        # search keeps the front found so far
+        if config.Arguments.pareto_front_file:
+            self.export_pareto_front(config.Arguments.pareto_front_file)
+        print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+        print("Total number of mutations:  %d" % (self.total_mutations))
+        print("Total number of crossovers: %d" % (self.total_crossovers))
+        print
+        print("Pareto front (%s)" % ', '.join(self.objective_names()))
+        for solution in self.pareto_front():
+            debug.summary_message("Individual %d: %s" % (solution.ID, ', '.join("%s = %g" % pair for pair in zip(self.objective_names(), solution.objective_values))))
+            debug.summary_message(solution.ppcg_cmd_line_flags, False)
+
 class Random(SearchStrategy):
     """Search using random sampling"""
     
@@ -278,16 +485,15 @@ class Random(SearchStrategy):
         self.individuals = []
         for i in xrange(1, config.Arguments.population+1):
             solution = individual.create_random()
-            solution.run()
             self.individuals.append(solution)
+        individual.run_population(self.individuals)
     
     def summarise(self):
         print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
         try:
             fittest = individual.get_fittest(self.individuals)
             debug.summary_message("The fittest individual had execution time %f seconds" % (fittest.execution_time)) 
-            debug.summary_message("To replicate, pass the following to PPCG:")
-            debug.summary_message(fittest.ppcg_cmd_line_flags, False)
+            replicate_message(fittest)
         except internal_exceptions.NoFittestException:
             pass
 
@@ -301,7 +507,7 @@ class SimulatedAnnealing(SearchStrategy):
     
     def mutate_backend_flags(self, clone_flags, solution_flags):
         for the_flag in solution_flags.keys():   
-            if bool(random.getrandbits(1)):
+            if bool(random_streams.mutation.getrandbits(1)):
                 idx    = the_flag.possible_values.index(solution_flags[the_flag])
                 newIdx = (idx + 1) % len(the_flag.possible_values)
                 clone_flags[the_flag] = the_flag.possible_values[newIdx]
@@ -310,14 +516,14 @@ class SimulatedAnnealing(SearchStrategy):
         clone    = copy.deepcopy(solution)
         clone.ID = individual.Individual.get_ID()
         for the_flag in solution.ppcg_flags.keys():   
-            if bool(random.getrandbits(1)):
+            if bool(random_streams.mutation.getrandbits(1)):
                 if isinstance(the_flag, compiler_flags.EnumerationFlag):
                     idx    = the_flag.possible_values.index(solution.ppcg_flags[the_flag])
                     newIdx = (idx + 1) % len(the_flag.possible_values)
                     clone.ppcg_flags[the_flag] = the_flag.possible_values[newIdx]
                 else:
                     assert isinstance(the_flag, compiler_flags.SizesFlag)
-                    clone.ppcg_flags[the_flag] = the_flag.permute(solution.ppcg_flags[the_flag])
+                    clone.ppcg_flags[the_flag] = the_flag.permute(solution.ppcg_flags[the_flag], random_streams.mutation)
                     
         self.mutate_backend_flags(clone.cc_flags, solution.cc_flags)
         self.mutate_backend_flags(clone.cxx_flags, solution.cxx_flags)
@@ -325,9 +531,22 @@ class SimulatedAnnealing(SearchStrategy):
         return clone
     
     def run(self):        
+        self.proposals   = 0
+        self.acceptances = 0
+        self.fittest     = None
         debug.verbose_message("Creating initial solution", __name__)
         current = individual.create_random()
         current.run()   
+        # Annealing needs an execution time to start from, which it looks for
+        # within the budget of evaluations it was given
+        attempts = 1
+        while current.status != enums.Status.passed:
+            if attempts >= config.Arguments.cooling_steps * config.Arguments.temperature_steps:
+                raise internal_exceptions.NoFittestException("None of %d initial solutions completed successfully" % attempts)
+            attempts += 1
+            debug.verbose_message("Initial solution failed. Creating another", __name__)
+            current = individual.create_random()
+            current.run()
         self.fittest = current
         
         temperature = config.Arguments.initial_temperature
@@ -339,13 +558,198 @@ class SimulatedAnnealing(SearchStrategy):
                 new = self.mutate(current)
                 new.run()       
                 if new.status == enums.Status.passed:     
-                    if self.acceptance_probability(current.execution_time, new.execution_time, temperature):
+                    self.proposals += 1
+                    if self.acceptance_probability(current.execution_time, new.execution_time, temperature) > random_streams.selection.uniform(0.0, 1.0):
                         current = new
+                        self.acceptances += 1
+                    telemetry.set_gauge("sa_acceptance_rate", float(self.acceptances) / self.proposals)
+                    telemetry.set_gauge("sa_temperature", temperature)
                     if current.execution_time < self.fittest.execution_time:
                         self.fittest = current
     
     def summarise(self):
+        if getattr(self, "fittest", None) is None:
+            debug.summary_message("No initial solution completed successfully")
+            return
         debug.summary_message("The final individual had execution time %f seconds" % (self.fittest.execution_time)) 
-        debug.summary_message("To replicate, pass the following to PPCG:")
-        debug.summary_message(self.fittest.ppcg_cmd_line_flags, False)
-        
\ No newline at end of file
+        replicate_message(self.fittest)
+        
+
+class DecomposedSizes(SearchStrategy):
+    """Search the --sizes of each kernel independently. Every evaluation permutes the
+    sizes of all kernels at once and each kernel keeps its new sizes only if its own
+    execution time, as reported by the binary, improved. The per-kernel winners are
+    combined at the end. The joint space is thereby replaced by one small space per kernel"""
+    
+    def __init__(self):
+        # Set before the search runs so that an interrupted search can be summarised
+        self.base         = None
+        self.fittest      = None
+        self.kernel_sizes = collections.OrderedDict()
+        self.kernel_times = collections.OrderedDict()
+        self.improvements = collections.OrderedDict()
+        self.redrawn      = 0
+    
+    def create_candidate(self, base, per_kernel_size_info):
+        candidate    = copy.deepcopy(base)
+        candidate.ID = individual.Individual.get_ID()
+        candidate.ppcg_flags[self.the_sizes_flag] = per_kernel_size_info
+        return candidate
+    
+    def run(self):
+        self.the_sizes_flag = compiler_flags.PPCG.flag_map[compiler_flags.PPCG.sizes]
+        
+        debug.verbose_message("Creating the base solution", __name__)
+        self.base = individual.create_random()
+        self.base.run()
+        if self.base.status != enums.Status.passed:
+            raise internal_exceptions.NoFittestException("The base solution failed, hence there are no kernel times to improve on")
+        if not self.base.kernel_times:
+            raise internal_exceptions.BinaryRunException("The binary reported no 'kernel<N> <seconds>' lines, hence there are no kernel times to improve on")
+        
+        # Start each kernel from the sizes PPCG reported for the base solution
+        self.kernel_sizes = collections.OrderedDict()
+        self.kernel_times = collections.OrderedDict()
+        for kernel_number, size_tuple in self.base.size_data.iteritems():
+            self.kernel_sizes[kernel_number] = size_tuple
+            self.kernel_times[kernel_number] = self.base.kernel_times.get(kernel_number)
+        self.improvements = collections.OrderedDict((kernel_number, 0) for kernel_number in self.kernel_sizes.keys())
+        
+        for evaluation in xrange(1, config.Arguments.evaluations+1):
+            debug.verbose_message("Evaluation %d" % evaluation, __name__)
+            per_kernel_size_info = collections.OrderedDict()
+            for kernel_number, size_tuple in self.kernel_sizes.iteritems():
+                per_kernel_size_info[kernel_number] = self.the_sizes_flag.permute_kernel(kernel_number, size_tuple, random_streams.mutation)
+            candidate = self.create_candidate(self.base, per_kernel_size_info)
+            candidate.run()
+            if candidate.status != enums.Status.passed:
+                continue
+            # Screening may have repaired the candidate with other sizes, so the 
+            # times are credited to the sizes which were actually built
+            built_sizes = candidate.ppcg_flags[self.the_sizes_flag]
+            if built_sizes != per_kernel_size_info:
+                self.redrawn += 1
+            for kernel_number, kernel_time in candidate.kernel_times.iteritems():
+                if kernel_number not in self.kernel_sizes:
+                    continue
+                size_tuple = built_sizes.get(kernel_number, built_sizes.get(compiler_flags.SizesFlag.ALL_KERNELS_SENTINEL))
+                if size_tuple is None:
+                    continue
+                if self.kernel_times[kernel_number] is None or kernel_time < self.kernel_times[kernel_number]:
+                    self.kernel_sizes[kernel_number]  = size_tuple
+                    self.kernel_times[kernel_number]  = kernel_time
+                    self.improvements[kernel_number] += 1
+        
+        debug.verbose_message("Combining the per-kernel winners", __name__)
+        self.fittest = self.create_candidate(self.base, collections.OrderedDict(self.kernel_sizes))
+        self.fittest.run()
+    
+    def summarise(self):
+        print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+        for kernel_number, size_tuple in self.kernel_sizes.iteritems():
+            debug.summary_message("Kernel %s: best sizes %s, execution time %s seconds, improved %d times" \
+                                  % (kernel_number, size_tuple, self.kernel_times[kernel_number], self.improvements[kernel_number]))
+        debug.summary_message("Candidates whose sizes were redrawn before being built: %d" % (self.redrawn))
+        if self.fittest and self.fittest.status == enums.Status.passed:
+            debug.summary_message("The combined individual had execution time %f seconds (base individual: %f seconds)" \
+                                  % (self.fittest.execution_time, self.base.execution_time)) 
+            replicate_message(self.fittest)
+
+class PassSequenceGA(SearchStrategy):
+    """Search for an ordering of LLVM passes using a genetic algorithm over pass
+    sequences of a fixed length. One-point crossover keeps a prefix of one parent, 
+    so children often share a prefix whose bitcode is already cached"""
+    
+    def random_sequence(self):
+        return [random_streams.sampling.choice(self.passes) for i in xrange(config.Arguments.sequence_length)]
+    
+    def crossover(self, mother, father):
+        point = random_streams.crossover.randint(1, len(mother.passes)-1)
+        return llvm_passes.PassSequenceIndividual(mother.passes[:point] + father.passes[point:])
+    
+    def mutate(self, passes):
+        """Replace, swap, insert or delete one pass, keeping the length of the sequence"""
+        rng       = random_streams.mutation
+        passes    = passes[:]
+        idx       = rng.randint(0, len(passes)-1)
+        operation = rng.choice(["replace", "swap", "insert", "delete"])
+        if operation == "replace":
+            passes[idx] = rng.choice(self.passes)
+        elif operation == "swap":
+            other = rng.randint(0, len(passes)-1)
+            passes[idx], passes[other] = passes[other], passes[idx]
+        elif operation == "insert":
+            passes.insert(idx, rng.choice(self.passes))
+            passes.pop()
+        else:
+            del passes[idx]
+            passes.append(rng.choice(self.passes))
+        return passes
+    
+    def select_parent(self, population):
+        # Binary tournament on fitness
+        first, second = random_streams.selection.sample(population, 2)
+        return first if first.fitness >= second.fitness else second
+    
+    def update_fittest(self, population):
+        for solution in population:
+            if solution.status == enums.Status.passed \
+            and (self.fittest is None or solution.fitness > self.fittest.fitness):
+                self.fittest = solution
+    
+    def diversity(self, population):
+        """The mean fraction of positions at which the pass sequences of two individuals differ"""
+        pairs = 0
+        total = 0.0
+        for i in range(0, len(population)):
+            for j in range(i+1, len(population)):
+                differences = sum(1 for a, b in zip(population[i].passes, population[j].passes) if a != b)
+                total      += float(differences) / max(len(population[i].passes), 1)
+                pairs      += 1
+        if not pairs:
+            return 0.0
+        return total / pairs
+    
+    def run(self):
+        self.passes           = llvm_passes.get_passes(config.Arguments.llvm_version)
+        self.total_mutations  = 0
+        self.total_crossovers = 0
+        self.fittest          = None
+        llvm_passes.cache     = llvm_passes.BitcodeCache()
+        
+        debug.verbose_message("Creating initial generation", __name__)
+        population = [llvm_passes.PassSequenceIndividual(self.random_sequence()) for i in xrange(config.Arguments.population)]
+        individual.run_population(population)
+        self.update_fittest(population)
+        telemetry.generation_finished(1, self.diversity(population))
+        
+        for generation in xrange(2, config.Arguments.generations+1):
+            debug.verbose_message("Creating generation %d" % generation, __name__)
+            children = []
+            while len(children) < config.Arguments.population - 1:
+                mother = self.select_parent(population)
+                if random_streams.crossover.uniform(0.0, 1.0) < config.Arguments.crossover_rate:
+                    child = self.crossover(mother, self.select_parent(population))
+                    self.total_crossovers += 1
+                else:
+                    child = llvm_passes.PassSequenceIndividual(mother.passes[:])
+                if random_streams.mutation.uniform(0.0, 1.0) < config.Arguments.mutation_rate:
+                    child.passes = self.mutate(child.passes)
+                    self.total_mutations += 1
+                children.append(child)
+            individual.run_population(children)
+            # The fittest individual so far survives without being evaluated again
+            population = children + [self.fittest or self.select_parent(population)]
+            self.update_fittest(children)
+            telemetry.generation_finished(generation, self.diversity(population))
+    
+    def summarise(self):
+        print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+        print("Total number of mutations:  %d" % (self.total_mutations))
+        print("Total number of crossovers: %d" % (self.total_crossovers))
+        print
+        llvm_passes.cache.summarise()
+        if self.fittest:
+            debug.summary_message("The fittest individual had execution time %f seconds" % (self.fittest.execution_time)) 
+            debug.summary_message("To replicate, pass the following to opt:")
+            debug.summary_message(' '.join(self.fittest.passes), False)
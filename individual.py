@@ -1,13 +1,23 @@
-import timeit
 import os
 import re
+import shutil
 import debug
 import compiler_flags
 import config
 import enums
 import collections
-import subprocess
 import internal_exceptions
+import cluster
+import tracing
+import child_process
+import measurement
+import telemetry
+import feasibility
+import occupancy
+import build_cache
+import scratch
+import random_streams
+import dispatch
 
 def get_fittest(population):
     fittest = None
@@ -22,21 +32,56 @@ def get_fittest(population):
         raise internal_exceptions.NoFittestException("None of the individuals among this population completed successfully, hence there is no fittest individual")
     return fittest
 
+def run_population(population):
+    """Evaluate every individual in the population. When runs are interleaved, all
+    individuals are built first and their binaries then run in alternating rounds.
+    With pilot workers and a private binary per individual, all individuals are
+    built first and their binaries then run on the workers at the same time"""
+    if not config.Arguments.interleave_runs and not (cluster.pool and config.Arguments.binary_file):
+        for solution in population:
+            solution.run()
+        return
+    prepared = [solution for solution in population if solution.prepare_or_reject()]
+    if config.Arguments.interleave_runs:
+        results = measurement.run_interleaved(prepared)
+    else:
+        results = cluster.pool.run(prepared) if prepared else {}
+    for solution in prepared:
+        solution.binary(results[solution.ID])
+        solution.finish()
+
+def discover_kernels():
+    """Run PPCG once with only --dump-sizes to find the kernels it generates and their sizes"""
+    os.environ["AUTOTUNER_PPCG_FLAGS"] = "--target=%s --dump-sizes" % config.Arguments.target
+    debug.verbose_message("Discovering kernels: running '%s'" % config.Arguments.ppcg_cmd, __name__)
+    work_dir = scratch.create_work_dir("discovery") if scratch.root else None
+    with tracing.span(enums.TraceCategory.ppcg, "kernel discovery") as the_span:
+        usage = child_process.run(config.Arguments.ppcg_cmd, capture_stderr=True, cwd=work_dir)
+    config.time_PPCG += the_span.duration()
+    if work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if usage.returncode:
+        raise internal_exceptions.FailedCompilationException("FAILED: '%s'" % config.Arguments.ppcg_cmd)
+    return compiler_flags.SizesFlag.parse_PPCG_dump_sizes(usage.stderr)
+
 def create_random():
     individual = Individual()   
     for flag in compiler_flags.PPCG.optimisation_flags:
-        individual.ppcg_flags[flag] = flag.random_value()
+        individual.ppcg_flags[flag] = flag.random_value(random_streams.sampling)
     for flag in compiler_flags.CC.optimisation_flags:
-        individual.cc_flags[flag] = flag.random_value()
+        individual.cc_flags[flag] = flag.random_value(random_streams.sampling)
     for flag in compiler_flags.CXX.optimisation_flags:
-        individual.cxx_flags[flag] = flag.random_value()
+        individual.cxx_flags[flag] = flag.random_value(random_streams.sampling)
     for flag in compiler_flags.NVCC.optimisation_flags:
-        individual.nvcc_flags[flag] = flag.random_value()
+        individual.nvcc_flags[flag] = flag.random_value(random_streams.sampling)
     return individual
 
 class Individual:
     """An individual solution in a population"""
     
+    # Whether a failure to compile ends the search, unless failures are being learned from
+    fatal_failures = True
+    
     ID = 0
     @staticmethod
     def get_ID():
@@ -50,30 +95,117 @@ class Individual:
         self.cxx_flags        = collections.OrderedDict()
         self.nvcc_flags       = collections.OrderedDict()
         self.status           = enums.Status.failed
+        self.failed_stage     = None
+        self.binary_file      = None
+        # Where PPCG, the build and the binary run when using scratch space
+        self.work_dir         = None
         
     def all_flags(self):
         return self.ppcg_flags.keys() + self.cc_flags.keys() + self.cxx_flags.keys() + self.nvcc_flags.keys()
     
     def all_flag_values(self):
         return self.ppcg_flags.values() + self.cc_flags.values() + self.cxx_flags.values() + self.nvcc_flags.values()
+    
+    def get_configuration_key(self):
+        """Equal for individuals which would build the same binary"""
+        return '|'.join(self.get_command_line_string(flags_attribute) for flags_attribute in ["ppcg_flags", "cc_flags", "cxx_flags", "nvcc_flags"])
             
     def run(self):
+        if self.prepare_or_reject():
+            self.binary()
+            self.finish()
+            
+    def prepare_or_reject(self):
+        """Prepare the individual for running. Returns False if it was rejected as 
+        infeasible before compilation, if it failed to compile or if its times were
+        already measured for the same configuration"""
+        self.failed_stage = None
+        if (occupancy.device and not occupancy.screen(self)) \
+        or (feasibility.predictor and not feasibility.predictor.screen(self)):
+            self.status = enums.Status.failed
+            self.set_fitness(screened=True)
+            return False
+        if config.Arguments.dispatch_table:
+            # Compare configurations as they would be built
+            self.apply_rules()
+            if dispatch.reuse(self):
+                self.set_fitness()
+                return False
         try:
-            self.compile()
-            if self.status == enums.Status.passed:
-                # Fitness is inversely proportional to execution time
-                self.fitness = 1/self.execution_time 
-                debug.verbose_message("Individual %d: execution time = %f, fitness = %f" \
-                                      % (self.ID, self.execution_time, self.fitness), __name__) 
-            else:
-                self.fitness = 0
+            self.prepare()
+            return True
         except internal_exceptions.FailedCompilationException as e:
-            debug.exit_message(e)
+            if self.fatal_failures and not feasibility.predictor:
+                debug.exit_message(e)
+            debug.warning_message(e)
+            self.status = enums.Status.failed
+            self.finish()
+            return False
+            
+    def finish(self):
+        self.set_fitness()
+        self.clean()
+        if feasibility.predictor:
+            feasibility.predictor.record(self)
+        if config.Arguments.dispatch_table:
+            dispatch.record(self)
+            
+    def set_fitness(self, screened=False):
+        if self.status == enums.Status.passed:
+            # Fitness is inversely proportional to execution time
+            self.fitness = 1/self.execution_time 
+            debug.verbose_message("Individual %d: execution time = %f, fitness = %f" \
+                                  % (self.ID, self.execution_time, self.fitness), __name__) 
+        else:
+            self.fitness = 0
+        if screened:
+            # Never compiled, so not an evaluation
+            telemetry.rejected(self)
+        else:
+            telemetry.evaluated(self)
+            
+    def compile_time(self):
+        return self.ppcg_usage.wall_time + self.build_usage.wall_time
             
     def compile(self):
-        self.ppcg()
-        self.build()
+        self.prepare()
         self.binary()
+        
+    def prepare(self):
+        self.ppcg_usage  = None
+        self.build_usage = None
+        self.binary_file = None
+        if scratch.root:
+            self.work_dir = scratch.create_work_dir("individual-%d" % self.ID)
+        self.apply_rules()
+        self.generate_code()
+        self.build()
+        if self.work_dir:
+            # The working directory is private to the individual, so no copy is needed
+            if config.Arguments.binary_file:
+                # --binary-file is relative here, so every individual has its own
+                self.binary_file = os.path.join(self.work_dir, config.Arguments.binary_file)
+        elif config.Arguments.binary_file:
+            # Keep a private copy of the binary so that it can be run after 
+            # other individuals have been built
+            self.binary_file = "%s.autotuner.%d" % (os.path.abspath(config.Arguments.binary_file), self.ID)
+            shutil.copy2(config.Arguments.binary_file, self.binary_file)
+            
+    def apply_rules(self):
+        # Settings which have no effect, or which clash, are left to the compiler
+        compiler_flags.apply_rules(self.cc_flags, compiler_flags.CC.rules)
+        compiler_flags.apply_rules(self.cxx_flags, compiler_flags.CXX.rules)
+            
+    def clean(self):
+        if self.work_dir:
+            scratch.release(self)
+            self.work_dir = None
+        elif self.binary_file and os.path.exists(self.binary_file):
+            os.remove(self.binary_file)
+
+    def generate_code(self):
+        """The stage before the build"""
+        self.ppcg()
 
     def ppcg(self):
         self.ppcg_cmd_line_flags = "--target=%s --dump-sizes %s" % (config.Arguments.target, 
@@ -81,56 +213,173 @@ class Individual:
         
         os.environ["AUTOTUNER_PPCG_FLAGS"] = self.ppcg_cmd_line_flags
         debug.verbose_message("Running '%s'" % config.Arguments.ppcg_cmd, __name__)
-        start  = timeit.default_timer()
-        proc   = subprocess.Popen(config.Arguments.ppcg_cmd, shell=True, stderr=subprocess.PIPE)  
-        stderr = proc.communicate()[1]
-        end    = timeit.default_timer()
-        config.time_PPCG += end - start
-        if proc.returncode:
+        with tracing.span(enums.TraceCategory.ppcg, "ppcg", self.ID) as the_span:
+            self.ppcg_usage = child_process.run(config.Arguments.ppcg_cmd, capture_stderr=True, cwd=self.work_dir)
+        config.time_PPCG += the_span.duration()
+        if self.ppcg_usage.returncode:
+            self.failed_stage = enums.Stage.ppcg
             raise internal_exceptions.FailedCompilationException("FAILED: '%s'" % config.Arguments.ppcg_cmd)         
         # Store the sizes used by PPCG
-        self.size_data = compiler_flags.SizesFlag.parse_PPCG_dump_sizes(stderr)
+        self.size_data = compiler_flags.SizesFlag.parse_PPCG_dump_sizes(self.ppcg_usage.stderr)
         
     def build(self):
-        debug.verbose_message("Running '%s'" % config.Arguments.build_cmd, __name__)
-        start  = timeit.default_timer()
-        proc   = subprocess.Popen(config.Arguments.build_cmd, shell=True)  
-        stderr = proc.communicate()[1]     
-        end    = timeit.default_timer()
-        config.time_backend += end - start
-        if proc.returncode:
+        with tracing.span(enums.TraceCategory.build, "build", self.ID) as the_span:
+            if config.Arguments.build_sources:
+                self.build_usage = build_cache.build(self)
+            else:
+                build_cmd = config.Arguments.build_cmd
+                for flags_attribute in ["cc_flags", "cxx_flags", "nvcc_flags"]:
+                    the_flags = self.get_command_line_string(flags_attribute)
+                    os.environ["AUTOTUNER_%s" % flags_attribute.upper()] = the_flags
+                    # Not str.format, as build commands may contain other braces
+                    build_cmd = build_cmd.replace("{%s}" % flags_attribute, the_flags)
+                debug.verbose_message("Running '%s'" % build_cmd, __name__)
+                self.build_usage = child_process.run(build_cmd, cwd=self.work_dir)
+        config.time_backend += the_span.duration()
+        if self.build_usage.returncode:
+            self.failed_stage = enums.Stage.build
+            if config.Arguments.build_sources:
+                raise internal_exceptions.FailedCompilationException("FAILED: building '%s'" % config.Arguments.binary_file)
             raise internal_exceptions.FailedCompilationException("FAILED: '%s'" % config.Arguments.build_cmd)
     
-    def binary(self):
-        time_regex = re.compile(r'^(\d*\.\d+|\d+)$')
-        total_time = 0.0
-        status     = enums.Status.passed
-        for run in xrange(1,config.Arguments.runs+1):
-            debug.verbose_message("Run #%d of '%s'" % (run, config.Arguments.run_cmd), __name__)
-            start = timeit.default_timer()
-            proc  = subprocess.Popen(config.Arguments.run_cmd, shell=True, stdout=subprocess.PIPE)    
-            stdout, stderr = proc.communicate()
-            end   = timeit.default_timer()
-            if proc.returncode:
-                status = enums.Status.failed
+    def get_command_line_string(self, flags_attribute):
+        """The tuned flags of one compiler, e.g. 'cc_flags', as passed to that compiler"""
+        the_flags = getattr(self, flags_attribute)
+        return ' '.join(string for string in (flag.get_command_line_string(the_flags[flag]) for flag in the_flags.keys()) if string)
+    
+    def run_once(self, label):
+        debug.verbose_message("%s of '%s'" % (label.capitalize(), config.Arguments.run_cmd), __name__)
+        if config.Arguments.binary_file:
+            os.environ["AUTOTUNER_BINARY"] = self.binary_file
+        with tracing.span(enums.TraceCategory.binary, label, self.ID):
+            return child_process.run(config.Arguments.run_cmd, 
+                                     capture_stdout=True, 
+                                     cwd=self.work_dir,
+                                     preexec_fn=measurement.get_preexec_fn())
+    
+    def run_binary(self):
+        """Run the binary the requested number of times, yielding the outcome of each run"""
+        if cluster.pool:
+            debug.verbose_message("Queueing %d runs of '%s'" % (config.Arguments.runs, config.Arguments.run_cmd), __name__)
+            for result in cluster.pool.run([self])[self.ID]:
+                yield result
+        else:
+            for run in xrange(1,config.Arguments.warmup_runs+1):
+                self.run_once("warm-up #%d" % run)
+            for run in xrange(1,config.Arguments.runs+1):
+                yield self.run_once("run #%d" % run)
+    
+    def mix_size_times(self, run_size_times):
+        """The execution time over problem sizes: the time of --size-class alone, the
+        mix given by --size-weights, or else the total"""
+        if config.Arguments.size_class is not None:
+            if str(config.Arguments.size_class) not in run_size_times:
+                raise internal_exceptions.BinaryRunException("The binary did not report a time for size class %d" % config.Arguments.size_class)
+            return run_size_times[str(config.Arguments.size_class)]
+        if config.Arguments.size_weights:
+            mixed_time = 0.0
+            for size, size_time in run_size_times.iteritems():
+                if int(size) >= len(config.Arguments.size_weights):
+                    raise internal_exceptions.BinaryRunException("The binary reported size %s, which has no weight" % size)
+                mixed_time += config.Arguments.size_weights[int(size)] * size_time
+            return mixed_time
+        return sum(run_size_times.values())
+    
+    def parse_execution_time(self, stdout, kernel_times, size_times):
+        """Parse the execution time a binary printed to standard output. Per-kernel 
+        times, printed as 'kernel<N> <seconds>', are appended to kernel_times and 
+        per-problem-size times, printed as 'size<N> <seconds>', to size_times. 
+        Per-function times of generated test harnesses, printed as 'function<N> 
+        <seconds>', only count towards the total: N is not a PPCG kernel number"""
+        time_regex          = re.compile(r'^(\d*\.\d+|\d+)$')
+        kernel_time_regex   = re.compile(r'^kernel\s*\[?(\d+)\]?\s+(\d*\.\d+|\d+)$')
+        function_time_regex = re.compile(r'^function\s*\[?(\d+)\]?\s+(\d*\.\d+|\d+)$')
+        size_time_regex     = re.compile(r'^size\s*\[?(\d+)\]?\s+(\d*\.\d+|\d+)$')
+        if not stdout:
+            raise internal_exceptions.BinaryRunException("Expected the binary to dump its execution time. Found nothing")
+        run_time          = None
+        run_kernel_time   = 0.0
+        run_function_time = None
+        # Several functions may report a time for the same problem size
+        run_size_times    = collections.OrderedDict()
+        for line in stdout.split(os.linesep):
+            line    = line.strip()
+            matches = time_regex.findall(line)
+            if matches:
+                try:
+                    run_time = (run_time or 0.0) + float(matches[0])
+                except:
+                    raise internal_exceptions.BinaryRunException("Execution time '%s' is not in the required format" % matches[0])
+            matches = kernel_time_regex.findall(line)
+            if matches:
+                kernel, kernel_time = matches[0]
+                kernel_times.setdefault(kernel, []).append(float(kernel_time))
+                run_kernel_time += float(kernel_time)
+            matches = function_time_regex.findall(line)
+            if matches:
+                function, function_time = matches[0]
+                run_function_time = (run_function_time or 0.0) + float(function_time)
+            matches = size_time_regex.findall(line)
+            if matches:
+                size, size_time = matches[0]
+                run_size_times[size] = run_size_times.get(size, 0.0) + float(size_time)
+        for size, size_time in run_size_times.iteritems():
+            size_times.setdefault(size, []).append(size_time)
+        if run_time is None and run_size_times:
+            # The binary reported times per problem size
+            run_time = self.mix_size_times(run_size_times)
+        elif run_time is None and (config.Arguments.size_class is not None or config.Arguments.size_weights):
+            raise internal_exceptions.BinaryRunException("Tuning for --size-class or --size-weights, but the binary reported no 'size<N> <seconds>' lines")
+        if run_time is None and run_function_time is not None and not kernel_times:
+            # The binary is a test harness which reported per-function times
+            run_time = run_function_time
+        if run_time is None:
+            # The binary only reported per-kernel times
+            run_time = run_kernel_time
+        return run_time
+    
+    def binary(self, results=None):
+        """Compute the execution time from the binary's runs. The runs may already 
+        have happened, e.g. interleaved with those of other individuals"""
+        if results is None:
+            results = self.run_binary()
+        total_time      = 0.0
+        binary_time     = 0.0
+        kernel_times    = collections.OrderedDict()
+        size_times      = collections.OrderedDict()
+        status          = enums.Status.passed
+        self.run_usages = []
+        for result in results:
+            if result.returncode:
+                status            = enums.Status.failed
+                self.failed_stage = enums.Stage.binary
                 debug.warning_message("FAILED: '%s'" % config.Arguments.run_cmd)
                 continue
+            self.run_usages.append(result)
+            if config.Arguments.max_rss_limit and result.max_rss > config.Arguments.max_rss_limit:
+                status            = enums.Status.failed
+                self.failed_stage = enums.Stage.memory
+                debug.warning_message("Individual %d used %d KB of memory, exceeding the limit of %d KB" \
+                                      % (self.ID, result.max_rss, config.Arguments.max_rss_limit))
+                continue
             if config.Arguments.execution_time_from_binary:
-                if not stdout:
-                    raise internal_exceptions.BinaryRunException("Expected the binary to dump its execution time. Found nothing")
-                for line in stdout.split(os.linesep):
-                    line    = line.strip()
-                    matches = time_regex.findall(line)
-                    if matches:
-                        try:
-                            total_time += float(matches[0])
-                        except:
-                            raise internal_exceptions.BinaryRunException("Execution time '%s' is not in the required format" % matches[0])
+                run_time = self.parse_execution_time(result.stdout, kernel_times, size_times)
+            else:
+                run_time = result.wall_time
+            binary_time += run_time
+            # The command line rules out CPU time together with --execution-time-from-binary
+            if config.Arguments.fitness_metric == enums.FitnessMetric.cpu_time:
+                total_time += result.cpu_time()
             else:
-                total_time += end - start
+                total_time += run_time
         self.status = status
-        config.time_binary += total_time
+        config.time_binary += binary_time
         self.execution_time = total_time/config.Arguments.runs
+        self.kernel_times   = collections.OrderedDict((kernel, sum(times)/len(times)) for kernel, times in kernel_times.iteritems())
+        self.size_times     = collections.OrderedDict((size, sum(times)/len(times)) for size, times in size_times.iteritems())
+        if self.run_usages:
+            self.cpu_time = sum(result.cpu_time() for result in self.run_usages)/len(self.run_usages)
+            self.max_rss  = max(result.max_rss for result in self.run_usages)
         
     def __str__(self):
         return "ID %d: fitness %f" % (self.ID, self.fitness)
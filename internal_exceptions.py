@@ -14,4 +14,10 @@ class FailedCompilationException(Exception):
     pass
 
 class BinaryRunException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class PilotJobException(Exception):
+    pass
+
+class InvalidSizesException(Exception):
+    pass
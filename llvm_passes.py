@@ -0,0 +1,184 @@
+import os
+import re
+import pipes
+import timeit
+import hashlib
+import config
+import debug
+import enums
+import tracing
+import telemetry
+import child_process
+import compiler_flags
+import individual
+import internal_exceptions
+
+def get_versions():
+    """The LLVM versions whose passes are known, e.g. '3.4' for LLVM.optimisation_flags_34"""
+    versions = []
+    for name in dir(compiler_flags.LLVM):
+        match = re.match(r'optimisation_flags_(\d)(\d)$', name)
+        if match:
+            versions.append("%s.%s" % match.groups())
+    return sorted(versions)
+
+def get_passes(version):
+    passes = []
+    for flag in getattr(compiler_flags.LLVM, "optimisation_flags_%s" % version.replace('.', '')):
+        if flag.name not in passes:
+            passes.append(flag.name)
+    return passes
+
+class TrieNode:
+    """The bitcode after running a sequence of passes, which is the path from the root"""
+
+    def __init__(self):
+        self.children  = {}
+        self.bitcode   = None
+        self.last_used = 0
+
+class BitcodeCache:
+    """A trie of pass sequences whose nodes may hold the bitcode produced by the
+    sequence so far, so that sequences with a common prefix only run the passes
+    after the longest prefix already in the cache. The trie only lives as long as
+    the run, so bitcode left in --llvm-cache-dir by earlier runs is removed"""
+
+    def __init__(self):
+        self.root         = TrieNode()
+        self.root.bitcode = os.path.abspath(config.Arguments.llvm_bitcode)
+        self.cached       = []
+        self.clock        = 0
+        self.passes_asked = 0
+        self.passes_run   = 0
+        if not os.path.isdir(config.Arguments.llvm_cache_dir):
+            os.makedirs(config.Arguments.llvm_cache_dir)
+        for filename in os.listdir(config.Arguments.llvm_cache_dir):
+            if filename.endswith(".bc") or filename.endswith(".tmp"):
+                os.remove(os.path.join(config.Arguments.llvm_cache_dir, filename))
+        self.salt         = self.get_salt()
+    
+    def get_salt(self):
+        """Identifies the input bitcode and the version of opt, so that cached
+        bitcode is never taken for that of another input or another opt"""
+        salt = hashlib.sha1()
+        with open(config.Arguments.llvm_bitcode, 'rb') as f:
+            salt.update(f.read())
+        version = child_process.run("%s --version" % config.Arguments.llvm_opt, capture_stdout=True)
+        salt.update(version.stdout or "")
+        return salt.hexdigest()
+
+    def lookup(self, passes):
+        """Return the length of the longest cached prefix of the passes and the node holding its bitcode"""
+        self.clock += 1
+        node, depth, best = self.root, 0, (0, self.root)
+        for the_pass in passes:
+            node = node.children.get(the_pass)
+            if node is None:
+                break
+            depth += 1
+            if node.bitcode:
+                best = (depth, node)
+        best[1].last_used = self.clock
+        return best
+
+    def store(self, passes, bitcode, path):
+        """Cache the bitcode produced by the passes. Nodes on the given path of the
+        sequence being built are never evicted"""
+        node = self.root
+        for the_pass in passes:
+            node = node.children.setdefault(the_pass, TrieNode())
+        node.bitcode   = bitcode
+        node.last_used = self.clock
+        self.cached.append(node)
+        path.append(node)
+        self.evict(path)
+        return node
+
+    def evict(self, path):
+        while len(self.cached) > config.Arguments.llvm_cache_size:
+            candidates = [node for node in self.cached if node not in path]
+            if not candidates:
+                return
+            victim = min(candidates, key=lambda node: node.last_used)
+            self.cached.remove(victim)
+            if os.path.exists(victim.bitcode):
+                os.remove(victim.bitcode)
+            victim.bitcode = None
+
+    def optimise(self, solution):
+        """Run the passes of the individual over the input bitcode, in chunks of
+        --llvm-cache-stride passes, caching the bitcode after every chunk. Returns
+        the resource usage of all opt runs together and the final bitcode"""
+        passes      = solution.passes
+        depth, node = self.lookup(passes)
+        bitcode     = node.bitcode
+        path        = [node]
+        if depth:
+            telemetry.cache_hit("bitcode")
+        else:
+            telemetry.cache_miss("bitcode")
+        self.passes_asked += len(passes)
+        self.passes_run   += len(passes) - depth
+        total = child_process.Result()
+        start = timeit.default_timer()
+        try:
+            while depth < len(passes):
+                chunk     = passes[depth:depth+config.Arguments.llvm_cache_stride]
+                key       = hashlib.sha1(self.salt + ' ' + ' '.join(passes[:depth+len(chunk)])).hexdigest()
+                output    = os.path.join(os.path.abspath(config.Arguments.llvm_cache_dir), "%s.bc" % key)
+                temporary = "%s.%d.tmp" % (output, os.getpid())
+                cmd       = "%s %s %s -o %s" % (config.Arguments.llvm_opt, ' '.join(chunk), pipes.quote(bitcode), pipes.quote(temporary))
+                debug.verbose_message("Running '%s'" % cmd, __name__)
+                usage = child_process.run(cmd, cwd=solution.work_dir)
+                total.returncode   = usage.returncode
+                total.user_time   += usage.user_time
+                total.system_time += usage.system_time
+                total.max_rss      = max(total.max_rss, usage.max_rss)
+                if usage.returncode:
+                    if os.path.exists(temporary):
+                        os.remove(temporary)
+                    return total, None
+                os.rename(temporary, output)
+                depth  += len(chunk)
+                bitcode = output
+                self.store(passes[:depth], bitcode, path)
+            return total, bitcode
+        finally:
+            total.wall_time = timeit.default_timer() - start
+
+    def summarise(self):
+        print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+        print("Passes in evaluated sequences:   %d" % (self.passes_asked))
+        print("Passes run:                      %d" % (self.passes_run))
+        if self.passes_asked:
+            print("Passes reused from cached prefixes: %.1f%%" % (100.0 * (self.passes_asked - self.passes_run) / self.passes_asked))
+        print
+
+# The cache shared by all individuals
+cache = None
+
+class PassSequenceIndividual(individual.Individual):
+    """An individual whose genome is a sequence of LLVM passes. The passes are run
+    over --llvm-bitcode in place of PPCG, and the build command finds the optimised
+    bitcode in the AUTOTUNER_BITCODE environment variable"""
+
+    # Some pass orderings make opt crash. Those are poor candidates, not errors
+    fatal_failures = False
+
+    def __init__(self, passes):
+        individual.Individual.__init__(self)
+        self.passes = passes
+
+    def generate_code(self):
+        debug.verbose_message("Running %d passes through '%s'" % (len(self.passes), config.Arguments.llvm_opt), __name__)
+        with tracing.span(enums.TraceCategory.opt, "opt", self.ID) as the_span:
+            # opt takes the place of PPCG, so its usage counts as code-generation time
+            self.ppcg_usage, self.bitcode = cache.optimise(self)
+        config.time_opt += the_span.duration()
+        if self.ppcg_usage.returncode:
+            self.failed_stage = enums.Stage.opt
+            raise internal_exceptions.FailedCompilationException("FAILED: '%s' with passes %s" % (config.Arguments.llvm_opt, ' '.join(self.passes)))
+        os.environ["AUTOTUNER_BITCODE"] = self.bitcode
+
+    def __str__(self):
+        return "ID %d: fitness %f, passes %s" % (self.ID, self.fitness, ' '.join(self.passes))
@@ -1,41 +1,117 @@
 #!/usr/bin/env python 
 
+import os
 import re
 import argparse
+import multiprocessing
 import config
 import enums
 import compiler_flags
 import heuristic_search
+import individual
+import internal_exceptions
+import debug
+import cluster
+import tracing
+import telemetry
+import feasibility
+import occupancy
+import tile_model
+import build_cache
+import scratch
+import random_streams
+import llvm_passes
+import dispatch
 import sys
 
-def print_summary(search):
+def print_summary(searches):
     try:
         if config.Arguments.results_file is not None:
             old_stdout    = sys.stdout
             output_stream = open(config.Arguments.results_file, 'w')
             sys.stdout    = output_stream
+        random_streams.summarise()
         config.summarise_timing()
-        search.summarise()
+        tracing.summarise()
+        if cluster.pool:
+            cluster.pool.summarise()
+        if feasibility.predictor:
+            feasibility.predictor.summarise()
+        if tile_model.kernels:
+            tile_model.summarise()
+        if occupancy.device:
+            occupancy.summarise()
+        if config.Arguments.build_sources:
+            build_cache.summarise()
+        if config.Arguments.scratch_dir:
+            scratch.summarise()
+        if config.Arguments.dispatch_table:
+            dispatch.summarise()
+        for search in searches:
+            search.summarise()
     finally:
         if config.Arguments.results_file is not None:
             output_stream.close()
             sys.stdout = old_stdout
 
-def autotune():
+def create_search():
     if config.Arguments.autotune_subcommand == enums.SearchStrategy.ga:
         search = heuristic_search.GA()
     elif config.Arguments.autotune_subcommand == enums.SearchStrategy.random:
         search = heuristic_search.Random()
     elif config.Arguments.autotune_subcommand == enums.SearchStrategy.simulated_annealing:
         search = heuristic_search.SimulatedAnnealing()
+    elif config.Arguments.autotune_subcommand == enums.SearchStrategy.nsga2:
+        search = heuristic_search.NSGA2()
+    elif config.Arguments.autotune_subcommand == enums.SearchStrategy.decomposed_sizes:
+        search = heuristic_search.DecomposedSizes()
+    elif config.Arguments.autotune_subcommand == enums.SearchStrategy.llvm_passes:
+        search = heuristic_search.PassSequenceGA()
     else:
         assert False, "Unknown testing strategy %s" % config.Arguments.autotune_subcommand
+    return search
+
+def autotune():
+    searches = []
+    if config.Arguments.predict_infeasible:
+        feasibility.predictor = feasibility.InfeasibilityPredictor()
+    if config.Arguments.pilot_workers:
+        cluster.pool = cluster.PilotJobPool()
+        cluster.pool.start()
     try:
-        search.run()
+        if config.Arguments.dispatch_table:
+            # One search per size class. Every run of a binary reports all size 
+            # classes, so configurations the searches share are evaluated once
+            for size_class, sizes in enumerate(dispatch.get_size_classes()):
+                debug.verbose_message("%s Tuning size class %d (%s) %s" % ('+' * 10, 
+                                                                          size_class, 
+                                                                          ' '.join("%s=%d" % (name, value) for name, value in sizes.iteritems()),
+                                                                          '+' * 10), __name__)
+                config.Arguments.size_class = size_class
+                searches.append(create_search())
+                try:
+                    searches[-1].run()
+                    dispatch.searched.append(size_class)
+                except internal_exceptions.NoFittestException as e:
+                    # The searches for the other size classes may still succeed
+                    debug.warning_message("The search for size class %d failed: %s" % (size_class, e))
+        else:
+            searches.append(create_search())
+            searches[-1].run()
     except KeyboardInterrupt:
         pass
     finally:
-        print_summary(search)
+        if cluster.pool:
+            cluster.pool.stop()
+        telemetry.finish()
+        scratch.finish()
+        if config.Arguments.trace_file:
+            tracing.export_chrome_trace(config.Arguments.trace_file)
+        if config.Arguments.trace_csv_file:
+            tracing.export_csv(config.Arguments.trace_csv_file)
+        if config.Arguments.dispatch_table:
+            dispatch.export(config.Arguments.dispatch_table, config.Arguments.dispatch_selector)
+        print_summary(searches)
 
 def setup_PPCG_flags():
     # We have to add some of the PPCG optimisation flags on the fly as they
@@ -67,6 +143,27 @@ def setup_PPCG_flags():
                 compiler_flags.PPCG.optimisation_flags.remove(compiler_flags.PPCG.flag_map[flag_name])
             else:
                 raise argparse.ArgumentTypeError("PPCG flag '%s' not recognised" % flag_name)
+    # Find the kernels up front so that their sizes are tuned individually from the first generation
+    the_sizes_flag = compiler_flags.PPCG.flag_map[compiler_flags.PPCG.sizes]
+    if the_sizes_flag in compiler_flags.PPCG.optimisation_flags \
+    and not config.Arguments.no_tune_kernel_sizes \
+    and not config.Arguments.no_discover_kernels:
+        try:
+            the_sizes_flag.set_kernels(individual.discover_kernels())
+            debug.verbose_message("Discovered kernels %s" % ', '.join(the_sizes_flag.kernels.keys()), __name__)
+        except (internal_exceptions.FailedCompilationException, internal_exceptions.InvalidSizesException) as e:
+            debug.warning_message("Unable to discover the kernels, so tuning a uniform size for all kernels initially (%s)" % e)
+    
+def setup_host_flags():
+    # The flag space depends on whether the user compiles with gcc or clang
+    compiler_flags.CC.optimisation_flags, compiler_flags.CC.rules = compiler_flags.get_host_flag_space(config.Arguments.cc,
+                                                                                                        config.Arguments.gcc_version,
+                                                                                                        config.Arguments.march_choices)
+    compiler_flags.CXX.optimisation_flags, compiler_flags.CXX.rules = compiler_flags.get_host_flag_space(config.Arguments.cxx,
+                                                                                                          config.Arguments.gcc_version,
+                                                                                                          config.Arguments.march_choices)
+    debug.verbose_message("Tuning %d C and %d C++ compiler flags" % (len(compiler_flags.CC.optimisation_flags), 
+                                                                     len(compiler_flags.CXX.optimisation_flags)), __name__)
     
 def the_command_line():    
     class ISLAction(argparse.Action):
@@ -87,11 +184,62 @@ def the_command_line():
             raise argparse.ArgumentTypeError("'%s' must be an integer range" % string)
         return (start, end+1)
     
+    def parse_size_domain(string):
+        kind, _, parameter = string.partition(':')
+        if kind in [enums.SizeDomain.all, enums.SizeDomain.pow2] and not parameter:
+            return (kind, None)
+        try:
+            if kind in [enums.SizeDomain.multiple, enums.SizeDomain.divisors]:
+                if int(parameter) > 0:
+                    return (kind, int(parameter))
+            elif kind == enums.SizeDomain.list:
+                return (kind, map(int, parameter.split(',')))
+        except ValueError:
+            pass
+        raise argparse.ArgumentTypeError("'%s' must be one of %s, %s, %s:<K>, %s:<N> or %s:<LIST>" % (string, 
+                                                                                                 enums.SizeDomain.all,
+                                                                                                 enums.SizeDomain.pow2,
+                                                                                                 enums.SizeDomain.multiple,
+                                                                                                 enums.SizeDomain.divisors,
+                                                                                                 enums.SizeDomain.list))
+    
     def int_csv(string):
         try:
             return map(int, string.split(','))
         except ValueError:
             raise argparse.ArgumentTypeError("'%s' must be a list of integers" % string)
+    
+    def float_csv(string):
+        try:
+            return map(float, string.split(','))
+        except ValueError:
+            raise argparse.ArgumentTypeError("'%s' must be a list of numbers" % string)
+    
+    def parse_problem_size(string):
+        # NAME=VALUES, where VALUES is a list, LO-HI doubling from LO, or LO-HI/STEP
+        name, _, values = string.partition('=')
+        try:
+            if name and values:
+                if '-' in values:
+                    bounds, _, step = values.partition('/')
+                    lo, hi          = map(int, bounds.split('-'))
+                    if 0 < lo <= hi:
+                        if step:
+                            if int(step) > 0:
+                                return (name, range(lo, hi+1, int(step)))
+                        else:
+                            sizes = []
+                            while lo <= hi:
+                                sizes.append(lo)
+                                lo *= 2
+                            return (name, sizes)
+                else:
+                    sizes = map(int, values.split(','))
+                    if all(size > 0 for size in sizes):
+                        return (name, sizes)
+        except ValueError:
+            pass
+        raise argparse.ArgumentTypeError("'%s' must be <NAME>=<LIST>, <NAME>=<LO>-<HI> or <NAME>=<LO>-<HI>/<STEP> with positive sizes" % string)
         
     def string_csv(string):
         return string.split(',')
@@ -111,18 +259,51 @@ def the_command_line():
                         help="log results of the search to this file",
                         default=None)
     
+    parser.add_argument("--seed",
+                        type=int,
+                        metavar="<int>",
+                        help="seed the random numbers used for sampling, mutation, crossover and selection so that, given the same execution times, the search takes the same course (default: a fresh seed, reported in the summary)",
+                        default=None)
+    
+    parser.add_argument("--trace-file",
+                        metavar="<STRING>",
+                        help="write a per-stage trace of every evaluation to this file in Chrome trace-event format",
+                        default=None)
+    
+    parser.add_argument("--trace-csv-file",
+                        metavar="<STRING>",
+                        help="write a per-stage trace of every evaluation to this file in CSV format",
+                        default=None)
+    
+    parser.add_argument("--telemetry-file",
+                        metavar="<STRING>",
+                        help="stream the progress of the search (best-so-far against evaluations and time, strategy measures, cache hit rates) to this file as JSON lines",
+                        default=None)
+    
+    parser.add_argument("--prometheus-file",
+                        metavar="<STRING>",
+                        help="periodically rewrite this file with the progress of the search in Prometheus text format",
+                        default=None)
+    
+    telemetry_interval = 10
+    parser.add_argument("--telemetry-interval",
+                        type=int,
+                        metavar="<int>",
+                        help="rewrite the Prometheus file at most once every this many seconds (default: %d)" % telemetry_interval,
+                        default=telemetry_interval)
+    
     # Building the application options
     building_and_running_group = parser.add_argument_group("Arguments for how to compile application and run executable") 
     
     building_and_running_group.add_argument("--ppcg-cmd",
                                             metavar="<STRING>",
-                                            help="how to call PPCG from the auto-tuner",
-                                            required=True)
+                                            help="how to call PPCG from the auto-tuner. Required unless tuning LLVM passes",
+                                            default=None)
     
     building_and_running_group.add_argument("--build-cmd",
                                             metavar="<STRING>",
-                                            help="how to build the application from the auto-tuner",
-                                            required=True)
+                                            help="how to build the application from the auto-tuner. Required unless the built-in build driver is used through --build-sources",
+                                            default=None)
     
     building_and_running_group.add_argument("--run-cmd",
                                             metavar="<STRING>",
@@ -141,6 +322,337 @@ def the_command_line():
                                             help="assume that the binary prints its execution time to standard output (rather than measuring the execution time through Python)",
                                             default=False)
     
+    building_and_running_group.add_argument("--binary-file",
+                                            metavar="<STRING>",
+                                            help="the binary produced by the build command. The auto-tuner keeps a private copy of it for each individual and passes its path to the run command in the AUTOTUNER_BINARY environment variable",
+                                            default=None)
+    
+    building_and_running_group.add_argument("--fitness-metric",
+                                            choices=[enums.FitnessMetric.wall_time, enums.FitnessMetric.cpu_time],
+                                            help="what to minimise: the execution time, or the user plus system CPU time of the binary as reported by wait4, which excludes --execution-time-from-binary (default: %s)" % enums.FitnessMetric.wall_time,
+                                            default=enums.FitnessMetric.wall_time)
+    
+    building_and_running_group.add_argument("--max-rss-limit",
+                                            type=int,
+                                            metavar="<int>",
+                                            help="reject configurations whose binary has a peak resident set size above this many kilobytes",
+                                            default=None)
+    
+    # Build driver options
+    build_driver_group = parser.add_argument_group("Arguments for the built-in build driver, which compiles each translation unit separately and reuses unchanged objects from a cache")
+    
+    build_driver_group.add_argument("--build-sources",
+                                    type=string_csv,
+                                    metavar="<LIST>",
+                                    help="build --binary-file from these comma-separated C (.c), C++ (.cpp, .cc, .cxx) and CUDA (.cu) files instead of running --build-cmd",
+                                    default=None)
+    
+    cc = "gcc"
+    build_driver_group.add_argument("--cc",
+                                    metavar="<STRING>",
+                                    help="the C compiler (default: %s)" % cc,
+                                    default=cc)
+    
+    cxx = "g++"
+    build_driver_group.add_argument("--cxx",
+                                    metavar="<STRING>",
+                                    help="the C++ compiler (default: %s)" % cxx,
+                                    default=cxx)
+    
+    nvcc = "nvcc"
+    build_driver_group.add_argument("--nvcc",
+                                    metavar="<STRING>",
+                                    help="the CUDA compiler (default: %s)" % nvcc,
+                                    default=nvcc)
+    
+    build_driver_group.add_argument("--compile-flags",
+                                    metavar="<STRING>",
+                                    help="flags passed to every compilation, such as include paths",
+                                    default="")
+    
+    build_driver_group.add_argument("--link-flags",
+                                    metavar="<STRING>",
+                                    help="flags passed when linking, such as libraries",
+                                    default="")
+    
+    build_cache_dir = ".autotuner-build-cache"
+    build_driver_group.add_argument("--build-cache-dir",
+                                    metavar="<STRING>",
+                                    help="where to cache object files (default: %s)" % build_cache_dir,
+                                    default=build_cache_dir)
+    
+    # Host compiler options
+    host_flags_group = parser.add_argument_group("Arguments for tuning the optimisation flags of the C and C++ compilers, which the build command finds in {cc_flags} and {cxx_flags} or AUTOTUNER_CC_FLAGS and AUTOTUNER_CXX_FLAGS")
+    
+    host_flags_group.add_argument("--tune-host-flags",
+                                  action="store_true",
+                                  help="tune the -O level, -march, -f flags and --param values of --cc and --cxx as well as the PPCG flags",
+                                  default=False)
+    
+    gcc_version = compiler_flags.get_gcc_versions()[-1]
+    host_flags_group.add_argument("--gcc-version",
+                                  choices=compiler_flags.get_gcc_versions(),
+                                  help="the version of gcc/g++ whose flags to tune (default: %s)" % gcc_version,
+                                  default=gcc_version)
+    
+    march_choices = ["native"]
+    host_flags_group.add_argument("--march-choices",
+                                  type=string_csv,
+                                  metavar="<LIST>",
+                                  help="the comma-separated -march values to try besides the compiler default (default: %s)" % ','.join(march_choices),
+                                  default=march_choices)
+    
+    # Scratch space options
+    scratch_group = parser.add_argument_group("Arguments for generating, building and running code in scratch space")
+    
+    scratch_group.add_argument("--scratch-dir",
+                               metavar="<STRING>",
+                               help="run PPCG, the build and the binary of each individual in a private directory under this directory, ideally in RAM such as /dev/shm. Commands run inside that directory and find the original working directory in the AUTOTUNER_SOURCE_DIR environment variable",
+                               default=None)
+    
+    keep_artifacts = 1
+    scratch_group.add_argument("--keep-artifacts",
+                               type=int,
+                               metavar="<int>",
+                               help="the number of best individuals whose generated code, objects and binary are promoted to persistent storage at the end (default: %d)" % keep_artifacts,
+                               default=keep_artifacts)
+    
+    artifacts_dir = "autotuner-artifacts"
+    scratch_group.add_argument("--artifacts-dir",
+                               metavar="<STRING>",
+                               help="where to promote the artifacts of the best individuals (default: %s)" % artifacts_dir,
+                               default=artifacts_dir)
+    
+    scratch_min_free = 256
+    scratch_group.add_argument("--scratch-min-free",
+                               type=int,
+                               metavar="<int>",
+                               help="wait before evaluating another individual while less than this many megabytes of scratch space are available (default: %d)" % scratch_min_free,
+                               default=scratch_min_free)
+    
+    scratch_wait_timeout = 300
+    scratch_group.add_argument("--scratch-wait-timeout",
+                               type=int,
+                               metavar="<int>",
+                               help="give up after waiting this many seconds for scratch space (default: %d)" % scratch_wait_timeout,
+                               default=scratch_wait_timeout)
+    
+    # Measurement options
+    measurement_group = parser.add_argument_group("Arguments for reducing measurement noise")
+    
+    measurement_group.add_argument("--pin-cpus",
+                                   type=int_csv,
+                                   metavar="<LIST>",
+                                   help="pin the binary to these cores while it is measured (only applies to binaries run by the auto-tuner itself)",
+                                   default=None)
+    
+    warmup_runs = 0
+    measurement_group.add_argument("--warmup-runs",
+                                   type=int,
+                                   metavar="<int>",
+                                   help="number of times to run the compiled executable before timing it; these runs are discarded (default: %d)" % warmup_runs,
+                                   default=warmup_runs)
+    
+    measurement_group.add_argument("--interleave-runs",
+                                   action="store_true",
+                                   help="build every individual in a population first and then run their binaries in alternating rounds so that drift affects them alike (requires --binary-file)",
+                                   default=False)
+    
+    # Infeasibility prediction options
+    feasibility_group = parser.add_argument_group("Arguments for predicting which configurations will fail")
+    
+    feasibility_group.add_argument("--predict-infeasible",
+                                   action="store_true",
+                                   help="carry on when a configuration fails to compile, and learn from every failure to reject or repair configurations predicted to fail before compiling them",
+                                   default=False)
+    
+    feasibility_group.add_argument("--failure-log",
+                                   metavar="<STRING>",
+                                   help="record the stage and configuration of every failure to this file as JSON lines",
+                                   default=None)
+    
+    infeasibility_neighbours = 5
+    feasibility_group.add_argument("--infeasibility-neighbours",
+                                   type=int,
+                                   metavar="<int>",
+                                   help="the number of nearest previously-evaluated configurations consulted by the prediction (default: %d)" % infeasibility_neighbours,
+                                   default=infeasibility_neighbours)
+    
+    infeasibility_threshold = 0.8
+    feasibility_group.add_argument("--infeasibility-threshold",
+                                   type=float,
+                                   metavar="<float>",
+                                   help="predict failure when at least this fraction of the nearest configurations failed (default: %.1f)" % infeasibility_threshold,
+                                   default=infeasibility_threshold)
+    
+    infeasibility_min_samples = 20
+    feasibility_group.add_argument("--infeasibility-min-samples",
+                                   type=int,
+                                   metavar="<int>",
+                                   help="only predict once this many configurations have been evaluated (default: %d)" % infeasibility_min_samples,
+                                   default=infeasibility_min_samples)
+    
+    repair_attempts = 5
+    feasibility_group.add_argument("--repair-attempts",
+                                   type=int,
+                                   metavar="<int>",
+                                   help="the number of times to re-sample flags of a configuration predicted to fail before rejecting it (default: %d)" % repair_attempts,
+                                   default=repair_attempts)
+    
+    # Test harness options
+    harness_group = parser.add_argument_group("Arguments for the test harness generated around BLAS/VOBLA functions, which reports the time of each PENCIL function for --execution-time-from-binary")
+    
+    harness_warmup_runs = 1
+    harness_group.add_argument("--harness-warmup-runs",
+                               type=int,
+                               metavar="<int>",
+                               help="number of untimed calls of each PENCIL function before it is timed (default: %d)" % harness_warmup_runs,
+                               default=harness_warmup_runs)
+    
+    harness_repeats = 5
+    harness_group.add_argument("--harness-repeats",
+                               type=int,
+                               metavar="<int>",
+                               help="number of timed calls of each PENCIL function, whose mean time is reported (default: %d)" % harness_repeats,
+                               default=harness_repeats)
+    
+    harness_group.add_argument("--tuning-function",
+                               metavar="<STRING>",
+                               help="the BLAS/VOBLA function under test, which names the generated test case",
+                               default=None)
+    
+    harness_group.add_argument("--ppcg-home",
+                               metavar="<STRING>",
+                               help="the PPCG installation, whose ocl_utilities.c every test case links",
+                               default=None)
+    
+    harness_group.add_argument("--pencil-home",
+                               metavar="<STRING>",
+                               help="the PENCIL installation, whose 'etc' directory holds pencil.h",
+                               default=None)
+    
+    harness_build_jobs = multiprocessing.cpu_count()
+    harness_group.add_argument("--harness-build-jobs",
+                               type=int,
+                               metavar="<int>",
+                               help="the number of compilations of a test case to run in parallel (default: %d)" % harness_build_jobs,
+                               default=harness_build_jobs)
+    
+    parse_cache_dir = ".autotuner-parse-cache"
+    harness_group.add_argument("--parse-cache-dir",
+                               metavar="<STRING>",
+                               help="where to cache the parsed PENCIL interfaces of test cases (default: %s)" % parse_cache_dir,
+                               default=parse_cache_dir)
+    
+    harness_group.add_argument("--problem-size",
+                               action="append",
+                               type=parse_problem_size,
+                               metavar="<NAME>=<VALUES>",
+                               help="time each PENCIL function at every value of its integer parameter NAME, given as a list, as LO-HI to double from LO up to HI, or as LO-HI/STEP. "
+                               "Repeat the option to sweep every combination of several parameters. Each combination is a size class, numbered in order from 0",
+                               default=None)
+    
+    harness_group.add_argument("--size-weights",
+                               type=float_csv,
+                               metavar="<LIST>",
+                               help="tune for the execution time over the size classes weighted by these factors, one per class (default: unweighted)",
+                               default=None)
+    
+    harness_group.add_argument("--size-class",
+                               type=int,
+                               metavar="<int>",
+                               help="tune for the execution time of this size class only",
+                               default=None)
+    
+    # Dispatch table options
+    dispatch_group = parser.add_argument_group("Arguments for tuning each size class of --problem-size separately and emitting a table of the best configuration per class")
+    
+    dispatch_group.add_argument("--dispatch-table",
+                                metavar="<FILE>",
+                                help="run one search per size class and write, as JSON to this file, the fastest configuration of each class over all evaluations. "
+                                "Configurations already evaluated for another class are not evaluated again",
+                                default=None)
+    
+    dispatch_group.add_argument("--dispatch-selector",
+                                metavar="<FILE>",
+                                help="write the C header with the selector mapping a runtime problem size to the variant of the nearest size class to this file (default: the dispatch table with extension .h)",
+                                default=None)
+    
+    # Tile cost model options
+    tile_model_group = parser.add_argument_group("Arguments for biasing tile sizes with a cost model")
+    
+    tile_model_group.add_argument("--tile-model",
+                                  metavar="<FILE>",
+                                  help="a JSON file giving, per kernel, the extents of its tiled loops and the loops indexing each array reference, from which the data reuse and shared memory footprint of a tile are estimated",
+                                  default=None)
+    
+    tile_model_samples = 8
+    tile_model_group.add_argument("--tile-model-samples",
+                                  type=int,
+                                  metavar="<int>",
+                                  help="the number of tiles drawn each time a tile is chosen, of which the cost model picks one in proportion to its score (default: %d)" % tile_model_samples,
+                                  default=tile_model_samples)
+    
+    # Occupancy model options
+    occupancy_group = parser.add_argument_group("Arguments for pruning configurations whose GPU occupancy is too low before compiling them")
+    
+    occupancy_group.add_argument("--device-file",
+                                 metavar="<FILE>",
+                                 help="a JSON file describing the GPU: sm_count, registers_per_sm, shared_memory_per_sm and warp_size, and optionally %s" % ', '.join(occupancy.Device.defaults.keys()),
+                                 default=None)
+    
+    min_occupancy = 0.25
+    occupancy_group.add_argument("--min-occupancy",
+                                 type=float,
+                                 metavar="<float>",
+                                 help="repair, or else reject, configurations whose modelled occupancy is below this fraction (default: %.2f)" % min_occupancy,
+                                 default=min_occupancy)
+    
+    # Pilot job options
+    pilot_group = parser.add_argument_group("Arguments for running binaries on long-lived pilot jobs")
+    
+    pilot_group.add_argument("--pilot-workers",
+                             type=int,
+                             metavar="<int>",
+                             help="run binaries on this many pilot jobs which pull work from a queue (default: 0, i.e. run binaries directly)",
+                             default=0)
+    
+    pilot_group.add_argument("--pilot-scheduler",
+                             choices=[enums.Scheduler.local, enums.Scheduler.pbs],
+                             help="how to launch pilot jobs: as local processes or through the PBS batch scheduler",
+                             default=enums.Scheduler.local)
+    
+    pilot_group.add_argument("--pilot-qsub-cmd",
+                             metavar="<STRING>",
+                             help="how to submit a pilot job script to PBS (default: qsub)",
+                             default="qsub")
+    
+    pilot_group.add_argument("--pilot-queue-dir",
+                             metavar="<STRING>",
+                             help="the directory, visible to the auto-tuner and to every pilot job, holding the work queue. It must not exist, be empty or hold the queue of an earlier run, and is removed at the end (default: ./pilot_queue)",
+                             default="pilot_queue")
+    
+    pilot_heartbeat_timeout = 60
+    pilot_group.add_argument("--pilot-heartbeat-timeout",
+                             type=int,
+                             metavar="<int>",
+                             help="consider a pilot job dead if it has not sent a heartbeat for this many seconds (default: %d)" % pilot_heartbeat_timeout,
+                             default=pilot_heartbeat_timeout)
+    
+    pilot_startup_timeout = 3600
+    pilot_group.add_argument("--pilot-startup-timeout",
+                             type=int,
+                             metavar="<int>",
+                             help="consider a pilot job dead if it has not sent its first heartbeat this many seconds after submission, which includes any time queued in the batch scheduler (default: %d)" % pilot_startup_timeout,
+                             default=pilot_startup_timeout)
+    
+    pilot_max_resubmissions = 10
+    pilot_group.add_argument("--pilot-max-resubmissions",
+                             type=int,
+                             metavar="<int>",
+                             help="give up after replacing this many dead pilot jobs (default: %d)" % pilot_max_resubmissions,
+                             default=pilot_max_resubmissions)
+    
     # PPCG options
     ppcg_group = parser.add_argument_group("PPCG arguments")
     
@@ -173,6 +685,14 @@ def the_command_line():
                             help="consider only values in this range when tuning the tile size (default: %d-%d)" % (tile_size_range[0], tile_size_range[1]),
                             default=tile_size_range)
     
+    tile_size_domain = enums.SizeDomain.all
+    ppcg_group.add_argument("--tile-size-domain",
+                            type=parse_size_domain,
+                            metavar="<DOMAIN>",
+                            help="consider only values in the range which are also in this domain when tuning the tile size: %s, %s (powers of two), %s:<K> (multiples of K), %s:<N> (divisors of N) or %s:<LIST>, e.g. 'divisors:1024' (default: %s)" \
+                            % (enums.SizeDomain.all, enums.SizeDomain.pow2, enums.SizeDomain.multiple, enums.SizeDomain.divisors, enums.SizeDomain.list, tile_size_domain),
+                            default=tile_size_domain)
+    
     tile_dimensions = 3
     ppcg_group.add_argument("--tile-dimensions",
                             type=int,
@@ -194,6 +714,14 @@ def the_command_line():
                             help="consider only values in this range when tuning the block size (default: %d-%d)" % (block_size_range[0], block_size_range[1]),
                             default=block_size_range)
     
+    block_size_domain = enums.SizeDomain.all
+    ppcg_group.add_argument("--block-size-domain",
+                            type=parse_size_domain,
+                            metavar="<DOMAIN>",
+                            help="consider only values in the range which are also in this domain when tuning the block size: %s, %s (powers of two), %s:<K> (multiples of K), %s:<N> (divisors of N) or %s:<LIST>, e.g. 'multiple:32' (default: %s)" \
+                            % (enums.SizeDomain.all, enums.SizeDomain.pow2, enums.SizeDomain.multiple, enums.SizeDomain.divisors, enums.SizeDomain.list, block_size_domain),
+                            default=block_size_domain)
+    
     block_dimensions = 3
     ppcg_group.add_argument("--block-dimensions",
                             type=int,
@@ -215,6 +743,14 @@ def the_command_line():
                             help="consider only values in this range when tuning the grid size (default: %d-%d)" % (grid_size_range[0], grid_size_range[1]),
                             default=grid_size_range)
     
+    grid_size_domain = enums.SizeDomain.all
+    ppcg_group.add_argument("--grid-size-domain",
+                            type=parse_size_domain,
+                            metavar="<DOMAIN>",
+                            help="consider only values in the range which are also in this domain when tuning the grid size: %s, %s (powers of two), %s:<K> (multiples of K), %s:<N> (divisors of N) or %s:<LIST>, e.g. 'pow2' (default: %s)" \
+                            % (enums.SizeDomain.all, enums.SizeDomain.pow2, enums.SizeDomain.multiple, enums.SizeDomain.divisors, enums.SizeDomain.list, grid_size_domain),
+                            default=grid_size_domain)
+    
     grid_dimensions = 3
     ppcg_group.add_argument("--grid-dimensions",
                             type=int,
@@ -234,11 +770,56 @@ def the_command_line():
                             help="do not tune kernel sizes individually, i.e. use a uniform tile size for all kernels and let PPCG decide on suitable block and grid sizes",
                             default=False)
     
+    ppcg_group.add_argument("--no-discover-kernels",
+                            action="store_true",
+                            help="do not run PPCG once at start-up to find the kernels and their depths; instead start from a uniform size for all kernels",
+                            default=False)
+    
     ppcg_group.add_argument("--all-isl-options",
                             action=ISLAction,
                             metavar="",
                             help="use all ISL options available. (Performance is likely to be very slow)")
     
+    # LLVM options
+    llvm_group = parser.add_argument_group("Arguments for tuning the order of LLVM passes")
+    
+    llvm_versions = llvm_passes.get_versions()
+    llvm_group.add_argument("--llvm-version",
+                            choices=llvm_versions,
+                            help="the version of LLVM whose passes are tuned (default: %s)" % llvm_versions[-1],
+                            default=llvm_versions[-1])
+    
+    llvm_group.add_argument("--llvm-bitcode",
+                            metavar="<STRING>",
+                            help="the unoptimised bitcode of the application, over which the passes are run",
+                            default=None)
+    
+    llvm_opt = "opt"
+    llvm_group.add_argument("--llvm-opt",
+                            metavar="<STRING>",
+                            help="the LLVM optimiser (default: %s)" % llvm_opt,
+                            default=llvm_opt)
+    
+    llvm_cache_dir = ".autotuner-llvm-cache"
+    llvm_group.add_argument("--llvm-cache-dir",
+                            metavar="<STRING>",
+                            help="where to cache the bitcode produced by prefixes of pass sequences, emptied of bitcode at startup (default: %s)" % llvm_cache_dir,
+                            default=llvm_cache_dir)
+    
+    llvm_cache_stride = 4
+    llvm_group.add_argument("--llvm-cache-stride",
+                            type=int,
+                            metavar="<int>",
+                            help="cache the bitcode after every this many passes. Smaller values share more work between sequences but start opt more often (default: %d)" % llvm_cache_stride,
+                            default=llvm_cache_stride)
+    
+    llvm_cache_size = 1000
+    llvm_group.add_argument("--llvm-cache-size",
+                            type=int,
+                            metavar="<int>",
+                            help="the maximum number of cached bitcode files, beyond which the least recently used are removed (default: %d)" % llvm_cache_size,
+                            default=llvm_cache_size)
+    
     search_subparsers = parser.add_subparsers(dest="autotune_subcommand",
                                               description="test generation subcommands")
         
@@ -330,10 +911,202 @@ def the_command_line():
                                default=randoms,
                                help="the number of random tests to generate (default: %d)" % randoms)
     
+    # Create the parser for the sub-command 'nsga2'
+    parser_nsga2 = search_subparsers.add_parser(enums.SearchStrategy.nsga2)
+    
+    parser_nsga2.add_argument("--generations",
+                              type=int,
+                              help="the number of generations (default: %d)" % generations,
+                              metavar="<int>",
+                              default=generations)
+    
+    parser_nsga2.add_argument("--population",
+                              type=int,
+                              metavar="<int>",
+                              default=population,
+                              help="the population size (default: %d)" % population)
+    
+    parser_nsga2.add_argument("--mutation-rate",
+                              type=float,
+                              metavar="<float>",
+                              default=mutation_rate,
+                              help="the mutation rate (default: %.3f)" % mutation_rate)
+    
+    parser_nsga2.add_argument("--crossover-rate",
+                              type=float,
+                              metavar="<float>",
+                              default=crossover_rate,
+                              help="the crossover rate (default: %.3f)" % crossover_rate)
+    
+    parser_nsga2.add_argument("--crossover",
+                              choices=[enums.Crossover.one_point, enums.Crossover.two_point],
+                              help="the crossover technique",
+                              default=enums.Crossover.two_point)
+    
+    parser_nsga2.add_argument("--minimise-max-rss",
+                              action="store_true",
+                              help="also minimise the peak resident set size of the binary",
+                              default=False)
+    
+    parser_nsga2.add_argument("--pareto-front-file",
+                              metavar="<STRING>",
+                              help="export the Pareto front of execution time, compile time and (optionally) peak memory to this JSON file",
+                              default=None)
+    
+    # Create the parser for the sub-command 'decomposed-sizes'
+    parser_decomposed = search_subparsers.add_parser(enums.SearchStrategy.decomposed_sizes)
+    
+    evaluations = generations * population
+    parser_decomposed.add_argument("--evaluations",
+                                   type=int,
+                                   metavar="<int>",
+                                   default=evaluations,
+                                   help="the number of evaluations, each of which tries new sizes for every kernel at once (default: %d)" % evaluations)
+    
+    # Create the parser for the sub-command 'llvm-passes'
+    parser_llvm = search_subparsers.add_parser(enums.SearchStrategy.llvm_passes)
+    
+    parser_llvm.add_argument("--generations",
+                             type=int,
+                             metavar="<int>",
+                             default=generations,
+                             help="the number of generations (default: %d)" % generations)
+    
+    parser_llvm.add_argument("--population",
+                             type=int,
+                             metavar="<int>",
+                             default=population,
+                             help="the population size (default: %d)" % population)
+    
+    sequence_mutation_rate = 0.3
+    parser_llvm.add_argument("--mutation-rate",
+                             type=float,
+                             metavar="<float>",
+                             default=sequence_mutation_rate,
+                             help="the probability that a child has one pass replaced, swapped, inserted or deleted (default: %.3f)" % sequence_mutation_rate)
+    
+    parser_llvm.add_argument("--crossover-rate",
+                             type=float,
+                             metavar="<float>",
+                             default=crossover_rate,
+                             help="the crossover rate (default: %.3f)" % crossover_rate)
+    
+    sequence_length = 16
+    parser_llvm.add_argument("--sequence-length",
+                             type=int,
+                             metavar="<int>",
+                             default=sequence_length,
+                             help="the number of passes in each sequence (default: %d)" % sequence_length)
+    
     parser.parse_args(namespace=config.Arguments)
+    
+    if config.Arguments.autotune_subcommand == enums.SearchStrategy.llvm_passes:
+        if not config.Arguments.llvm_bitcode:
+            parser.error("%s requires --llvm-bitcode" % enums.SearchStrategy.llvm_passes)
+        if config.Arguments.population < 2 or config.Arguments.sequence_length < 2:
+            parser.error("%s needs a population and sequences of at least two" % enums.SearchStrategy.llvm_passes)
+        if config.Arguments.predict_infeasible:
+            parser.error("--predict-infeasible cannot learn from pass sequences")
+    elif not config.Arguments.ppcg_cmd:
+        parser.error("--ppcg-cmd is required")
+    
+    if config.Arguments.autotune_subcommand == enums.SearchStrategy.nsga2 and config.Arguments.population < 2:
+        parser.error("%s selects parents by tournaments of two and hence needs a population of at least two" % enums.SearchStrategy.nsga2)
+    
+    if config.Arguments.fitness_metric == enums.FitnessMetric.cpu_time and config.Arguments.execution_time_from_binary:
+        parser.error("--fitness-metric %s measures the whole binary and so cannot be combined with --execution-time-from-binary" % enums.FitnessMetric.cpu_time)
+    
+    if config.Arguments.autotune_subcommand == enums.SearchStrategy.decomposed_sizes:
+        if not config.Arguments.execution_time_from_binary:
+            parser.error("%s needs per-kernel times and hence requires --execution-time-from-binary" % enums.SearchStrategy.decomposed_sizes)
+        if config.Arguments.blacklist and compiler_flags.PPCG.sizes in config.Arguments.blacklist:
+            parser.error("%s cannot tune %s when it is on the black list" % (enums.SearchStrategy.decomposed_sizes, compiler_flags.PPCG.sizes))
+    
+    if config.Arguments.build_sources:
+        if not config.Arguments.binary_file:
+            parser.error("--build-sources requires --binary-file")
+        for source in config.Arguments.build_sources:
+            try:
+                build_cache.get_compiler(source)
+            except ValueError as e:
+                parser.error(str(e))
+    elif not config.Arguments.build_cmd:
+        parser.error("either --build-cmd or --build-sources is required")
+    
+    if config.Arguments.harness_warmup_runs < 0 or config.Arguments.harness_repeats < 1:
+        parser.error("the test harness needs at least one timed call and no negative number of warm-up calls")
+    if config.Arguments.harness_build_jobs < 1:
+        parser.error("--harness-build-jobs must be at least 1")
+    if config.Arguments.size_weights is not None and config.Arguments.size_class is not None:
+        parser.error("--size-weights and --size-class are mutually exclusive")
+    if config.Arguments.problem_size:
+        names = [name for name, values in config.Arguments.problem_size]
+        if len(set(names)) != len(names):
+            parser.error("each parameter may only be given once to --problem-size")
+        size_classes = reduce(lambda x, y: x * y, [len(values) for name, values in config.Arguments.problem_size], 1)
+        if config.Arguments.size_weights is not None and len(config.Arguments.size_weights) != size_classes:
+            parser.error("--size-weights gives %d weights but --problem-size gives %d size classes" % (len(config.Arguments.size_weights), size_classes))
+        if config.Arguments.size_class is not None and not 0 <= config.Arguments.size_class < size_classes:
+            parser.error("--size-class must lie between 0 and %d" % (size_classes-1))
+    
+    if config.Arguments.dispatch_table:
+        if not config.Arguments.problem_size or not config.Arguments.execution_time_from_binary:
+            parser.error("--dispatch-table needs the times of each size class and hence requires --problem-size and --execution-time-from-binary")
+        if config.Arguments.size_weights is not None or config.Arguments.size_class is not None:
+            parser.error("--dispatch-table tunes every size class in turn, so neither --size-weights nor --size-class may be given")
+        if config.Arguments.autotune_subcommand == enums.SearchStrategy.llvm_passes:
+            parser.error("--dispatch-table tunes PPCG and compiler flags, not %s" % enums.SearchStrategy.llvm_passes)
+        if not config.Arguments.dispatch_selector:
+            config.Arguments.dispatch_selector = os.path.splitext(config.Arguments.dispatch_table)[0] + ".h"
+    elif config.Arguments.dispatch_selector:
+        parser.error("--dispatch-selector requires --dispatch-table")
+    
+    for kind in ["tile", "block", "grid"]:
+        size_range = getattr(config.Arguments, "%s_size_range" % kind)
+        if not compiler_flags.get_domain_values(getattr(config.Arguments, "%s_size_domain" % kind), size_range[0], size_range[1]):
+            parser.error("no value of --%s-size-domain lies in --%s-size-range" % (kind, kind))
+    
+    if config.Arguments.tile_model:
+        try:
+            tile_model.load(config.Arguments.tile_model)
+        except (IOError, ValueError) as e:
+            parser.error(str(e))
+        if config.Arguments.tile_model_samples < 1:
+            parser.error("--tile-model-samples must be at least 1")
+    
+    if config.Arguments.device_file:
+        try:
+            occupancy.device = occupancy.Device(config.Arguments.device_file)
+        except (IOError, ValueError) as e:
+            parser.error(str(e))
+        if config.Arguments.autotune_subcommand == enums.SearchStrategy.llvm_passes:
+            parser.error("--device-file has no effect on %s" % enums.SearchStrategy.llvm_passes)
+    
+    if config.Arguments.scratch_dir:
+        if not os.path.isdir(config.Arguments.scratch_dir):
+            parser.error("scratch directory '%s' does not exist" % config.Arguments.scratch_dir)
+        if config.Arguments.pilot_workers and config.Arguments.pilot_scheduler != enums.Scheduler.local:
+            parser.error("--scratch-dir is local to this machine, so pilot workers must use the %s scheduler" % enums.Scheduler.local)
+        if config.Arguments.binary_file and os.path.isabs(config.Arguments.binary_file):
+            parser.error("with --scratch-dir, --binary-file must be relative to the working directory of each individual, so that individuals do not share one binary")
+    
+    if config.Arguments.interleave_runs:
+        if not config.Arguments.binary_file:
+            parser.error("--interleave-runs requires --binary-file")
+        if config.Arguments.pilot_workers:
+            parser.error("--interleave-runs cannot be combined with --pilot-workers")
+    
+    if config.Arguments.pin_cpus and config.Arguments.pilot_workers:
+        parser.error("--pin-cpus cannot be combined with --pilot-workers, whose binaries are not run by the auto-tuner itself")
 
 if __name__ == "__main__":
     the_command_line()
-    setup_PPCG_flags()
+    random_streams.set_seed(config.Arguments.seed)
+    if config.Arguments.scratch_dir:
+        scratch.setup()
+    if config.Arguments.autotune_subcommand != enums.SearchStrategy.llvm_passes:
+        setup_PPCG_flags()
+    if config.Arguments.tune_host_flags:
+        setup_host_flags()
     autotune()    
         
\ No newline at end of file
@@ -0,0 +1,47 @@
+import os
+import ctypes
+import ctypes.util
+import collections
+import config
+import debug
+
+def set_cpu_affinity(cpus):
+    """Restrict the calling process, and hence everything it starts, to the given cores"""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+        return
+    # Python 2 has no binding for sched_setaffinity, so call into libc directly
+    bits_per_word = 8 * ctypes.sizeof(ctypes.c_ulong)
+    cpu_set       = (ctypes.c_ulong * (1024 / bits_per_word))()
+    for cpu in cpus:
+        cpu_set[cpu / bits_per_word] |= 1 << (cpu % bits_per_word)
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if libc.sched_setaffinity(0, ctypes.sizeof(cpu_set), ctypes.byref(cpu_set)):
+        error = ctypes.get_errno()
+        raise OSError(error, "sched_setaffinity: %s" % os.strerror(error))
+
+def pin_to_measurement_cpus():
+    """A Popen preexec_fn pinning the measured process to the cores set aside for measurement"""
+    set_cpu_affinity(config.Arguments.pin_cpus)
+
+def get_preexec_fn():
+    if config.Arguments.pin_cpus:
+        return pin_to_measurement_cpus
+    return None
+
+def run_interleaved(population):
+    """Run the binaries of several individuals in interleaved rounds (ABAB...) so that
+    slow drift in frequency scaling and cache state affects every individual alike.
+    The first --warmup-runs rounds are discarded. Returns the outcomes of the timed
+    runs keyed on individual ID"""
+    results = collections.OrderedDict((solution.ID, []) for solution in population)
+    rounds  = config.Arguments.warmup_runs + config.Arguments.runs
+    for the_round in xrange(1, rounds+1):
+        warmup = the_round <= config.Arguments.warmup_runs
+        debug.verbose_message("Interleaved %s round %d" % ("warm-up" if warmup else "timed", the_round), __name__)
+        for solution in population:
+            if warmup:
+                solution.run_once("warm-up #%d" % the_round)
+            else:
+                results[solution.ID].append(solution.run_once("run #%d" % (the_round - config.Arguments.warmup_runs)))
+    return results
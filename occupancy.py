@@ -0,0 +1,159 @@
+import json
+import math
+import collections
+import config
+import debug
+import enums
+import compiler_flags
+import random_streams
+
+class Device:
+    """The resources of one streaming multiprocessor (SM) of a GPU, which bound how
+    many blocks of a kernel it can run at once"""
+
+    # The JSON device file must give these
+    required = ["sm_count", "registers_per_sm", "shared_memory_per_sm", "warp_size"]
+
+    # Limits the device file may override. The defaults are those of compute capability 3.5
+    defaults = collections.OrderedDict([("max_threads_per_block", 1024),
+                                        ("max_warps_per_sm", 64),
+                                        ("max_blocks_per_sm", 16),
+                                        ("max_registers_per_thread", 255),
+                                        ("register_allocation_unit", 256),
+                                        ("shared_memory_per_block", 49152),
+                                        ("shared_memory_allocation_unit", 256)])
+
+    def __init__(self, filename):
+        with open(filename, 'r') as f:
+            description = json.load(f)
+        for key in Device.required:
+            if key not in description:
+                raise ValueError("Device file '%s' does not give '%s'" % (filename, key))
+        for key, value in description.iteritems():
+            if key not in Device.required and key not in Device.defaults:
+                raise ValueError("Device file '%s' gives unknown key '%s'" % (filename, key))
+            if type(value) is not int or value <= 0:
+                raise ValueError("Device file '%s' gives '%s' as %s, not a positive integer" % (filename, key, value))
+        for key in Device.required:
+            setattr(self, key, description[key])
+        for key, value in Device.defaults.iteritems():
+            setattr(self, key, description.get(key, value))
+
+    def round_up(self, value, unit):
+        return int(math.ceil(float(value) / unit)) * unit
+
+    def active_blocks(self, threads, registers=None, shared_memory=None):
+        """The number of blocks of the given shape resident on one SM at a time, which
+        is 0 if a block cannot be launched at all. Registers are per thread and
+        shared memory per block; None means the amount is not known up front"""
+        if threads <= 0 or threads > self.max_threads_per_block:
+            return 0
+        warps_per_block = int(math.ceil(float(threads) / self.warp_size))
+        limits          = [self.max_blocks_per_sm, self.max_warps_per_sm / warps_per_block]
+        if registers:
+            if registers > self.max_registers_per_thread:
+                return 0
+            registers_per_warp = self.round_up(registers * self.warp_size, self.register_allocation_unit)
+            limits.append((self.registers_per_sm / registers_per_warp) / warps_per_block)
+        if shared_memory:
+            if shared_memory > self.shared_memory_per_block:
+                return 0
+            limits.append(self.shared_memory_per_sm / self.round_up(shared_memory, self.shared_memory_allocation_unit))
+        return min(limits)
+
+    def occupancy(self, threads, registers=None, shared_memory=None):
+        """The fraction of the warps an SM can hold which are active"""
+        warps_per_block = int(math.ceil(float(threads) / self.warp_size)) if threads > 0 else 0
+        return float(self.active_blocks(threads, registers, shared_memory) * warps_per_block) / self.max_warps_per_sm
+
+    def utilisation(self, threads, blocks, registers=None, shared_memory=None):
+        """The occupancy, scaled down when the grid has too few blocks to fill every SM"""
+        active = self.active_blocks(threads, registers, shared_memory)
+        if not active:
+            return 0.0
+        return self.occupancy(threads, registers, shared_memory) * min(1.0, float(blocks) / (active * self.sm_count))
+
+# The device whose occupancy is modelled, if --device-file is given
+device      = None
+rejected    = 0
+repaired    = 0
+occupancies = []
+
+def product(values):
+    return reduce(lambda x, y: x * y, values, 1)
+
+def get_resources(solution):
+    """The registers per thread and the shared memory per block requested by the
+    flags of the individual, each None if the flags leave it to the compiler. PPCG
+    may use less shared memory than --max-shared-memory allows, so the model errs
+    on the side of lower occupancy"""
+    registers = None
+    if config.Arguments.target == enums.Targets.cuda:
+        the_flag = compiler_flags.get_optimisation_flag(solution.nvcc_flags.keys(), '--maxrregcount')
+        if the_flag:
+            registers = solution.nvcc_flags[the_flag]
+    shared_memory = None
+    the_flag      = compiler_flags.get_optimisation_flag(solution.ppcg_flags.keys(), compiler_flags.PPCG.max_shared_memory)
+    no_shared     = compiler_flags.get_optimisation_flag(solution.ppcg_flags.keys(), compiler_flags.PPCG.no_shared_memory)
+    if the_flag and not (no_shared and solution.ppcg_flags[no_shared]):
+        shared_memory = solution.ppcg_flags[the_flag]
+    return registers, shared_memory
+
+def estimate(solution):
+    """The lowest utilisation over the kernels of the individual, or None if the
+    individual does not choose its block sizes"""
+    the_flag = compiler_flags.get_optimisation_flag(solution.ppcg_flags.keys(), compiler_flags.PPCG.sizes)
+    if not the_flag:
+        return None
+    registers, shared_memory = get_resources(solution)
+    return min(device.utilisation(product(size_tuple.block_size), product(size_tuple.grid_size), registers, shared_memory)
+               for size_tuple in solution.ppcg_flags[the_flag].values())
+
+def resample(solution):
+    """Redraw the flags which decide occupancy. These include --sizes, so a search
+    must read the sizes of a screened individual back rather than assume the sizes
+    it proposed were built"""
+    for flags, name in [(solution.ppcg_flags, compiler_flags.PPCG.sizes),
+                        (solution.ppcg_flags, compiler_flags.PPCG.max_shared_memory),
+                        (solution.nvcc_flags, '--maxrregcount')]:
+        the_flag = compiler_flags.get_optimisation_flag(flags.keys(), name)
+        if the_flag and the_flag.tuneable:
+            flags[the_flag] = the_flag.random_value(random_streams.repair)
+
+def screen(solution):
+    """Return False if the individual should not be compiled because its occupancy
+    is below --min-occupancy. Such individuals are first repaired: of --repair-attempts
+    redraws of the flags which decide occupancy, the one with the highest occupancy
+    is kept if it is good enough"""
+    global rejected, repaired
+    the_occupancy = estimate(solution)
+    if the_occupancy is None or the_occupancy >= config.Arguments.min_occupancy:
+        if the_occupancy is not None:
+            occupancies.append(the_occupancy)
+        return True
+    original = (solution.ppcg_flags.copy(), solution.nvcc_flags.copy())
+    best     = (the_occupancy, original)
+    for attempt in range(0, config.Arguments.repair_attempts):
+        solution.ppcg_flags, solution.nvcc_flags = original[0].copy(), original[1].copy()
+        resample(solution)
+        candidate = estimate(solution)
+        if candidate > best[0]:
+            best = (candidate, (solution.ppcg_flags, solution.nvcc_flags))
+    the_occupancy, (solution.ppcg_flags, solution.nvcc_flags) = best
+    if the_occupancy >= config.Arguments.min_occupancy:
+        debug.verbose_message("Repaired individual %d, whose occupancy was too low, to occupancy %.2f" % (solution.ID, the_occupancy), __name__)
+        repaired += 1
+        occupancies.append(the_occupancy)
+        return True
+    debug.verbose_message("Rejected individual %d, whose occupancy is %.2f" % (solution.ID, the_occupancy), __name__)
+    rejected += 1
+    solution.failed_stage = enums.Stage.occupancy
+    return False
+
+def summarise():
+    print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+    print("Configurations repaired before compilation: %d" % (repaired))
+    print("Configurations rejected before compilation: %d" % (rejected))
+    if occupancies:
+        print("Mean occupancy of compiled configurations:  %.2f" % (sum(occupancies) / len(occupancies)))
+    print
@@ -0,0 +1,40 @@
+import random
+import hashlib
+import collections
+
+# The seed from which every stream below is derived
+seed      = None
+
+# Independent streams of random numbers, one per purpose, so that drawing more
+# numbers for one purpose (e.g. mutating one more child) does not change the
+# numbers drawn for another
+sampling  = random.Random()   # Creating random configurations
+mutation  = random.Random()   # Mutating configurations
+crossover = random.Random()   # Deciding on and performing crossover
+selection = random.Random()   # Selecting parents and accepting moves
+repair    = random.Random()   # Repairing configurations predicted to fail
+setup     = random.Random()   # Choices made once, before the search starts
+data      = random.Random()   # Test data for generated test cases
+
+streams   = collections.OrderedDict([("sampling", sampling),
+                                     ("mutation", mutation),
+                                     ("crossover", crossover),
+                                     ("selection", selection),
+                                     ("repair", repair),
+                                     ("setup", setup),
+                                     ("data", data)])
+
+def set_seed(the_seed=None):
+    """Seed every stream from the given seed, or from a fresh one if it is None, so
+    that the seed of any run is known and the run can be repeated"""
+    global seed
+    if the_seed is None:
+        the_seed = random.SystemRandom().randint(0, 2**32-1)
+    seed = the_seed
+    for name, stream in streams.iteritems():
+        stream.seed(int(hashlib.sha1("%d:%s" % (seed, name)).hexdigest(), 16))
+
+def summarise():
+    print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+    print("Seed: %d (repeat this run with --seed %d)" % (seed, seed))
+    print
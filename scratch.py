@@ -0,0 +1,94 @@
+import os
+import time
+import atexit
+import shutil
+import tempfile
+import config
+import debug
+import enums
+
+# The directory under --scratch-dir holding the working directories of this run
+root         = None
+# The working directories kept for promotion, as (execution time, ID, directory), best first
+kept         = []
+waits        = 0
+waiting_time = 0.0
+
+def setup():
+    """Create the scratch area. User commands run in a working directory inside it
+    and find the original working directory in AUTOTUNER_SOURCE_DIR"""
+    global root
+    root = tempfile.mkdtemp(prefix="autotuner-", dir=config.Arguments.scratch_dir)
+    os.environ["AUTOTUNER_SOURCE_DIR"] = os.getcwd()
+    # Do not leave the scratch area behind if the auto-tuner exits early
+    atexit.register(finish)
+    debug.verbose_message("Using scratch directory '%s'" % root, __name__)
+
+def free_space():
+    """Space available in the scratch area, in megabytes"""
+    stats = os.statvfs(root)
+    return stats.f_bavail * stats.f_frsize / (1024 * 1024)
+
+def wait_for_space(poll_interval=1.0):
+    """Apply backpressure: do not create another working directory until the scratch
+    area has at least --scratch-min-free megabytes available"""
+    global waits, waiting_time
+    if free_space() >= config.Arguments.scratch_min_free:
+        return
+    # Give up all kept artifacts except the best before waiting
+    while len(kept) > 1 and free_space() < config.Arguments.scratch_min_free:
+        execution_time, ID, directory = kept.pop()
+        debug.verbose_message("Discarding artifacts of individual %d to free scratch space" % ID, __name__)
+        shutil.rmtree(directory, ignore_errors=True)
+    if free_space() >= config.Arguments.scratch_min_free:
+        return
+    debug.warning_message("Only %d MB available in '%s'. Waiting for space" % (free_space(), root))
+    waits += 1
+    start = time.time()
+    while free_space() < config.Arguments.scratch_min_free:
+        if time.time() - start > config.Arguments.scratch_wait_timeout:
+            debug.exit_message("Gave up waiting for space in '%s' after %d seconds" % (root, config.Arguments.scratch_wait_timeout))
+        time.sleep(poll_interval)
+    waiting_time += time.time() - start
+
+def create_work_dir(name):
+    wait_for_space()
+    directory = os.path.join(root, name)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    return directory
+
+def release(solution):
+    """Called once an individual has been evaluated: keep its working directory if
+    it is among the --keep-artifacts best so far, otherwise remove it"""
+    if solution.status == enums.Status.passed and config.Arguments.keep_artifacts > 0:
+        kept.append((solution.execution_time, solution.ID, solution.work_dir))
+        kept.sort()
+        while len(kept) > config.Arguments.keep_artifacts:
+            execution_time, ID, directory = kept.pop()
+            shutil.rmtree(directory, ignore_errors=True)
+    else:
+        shutil.rmtree(solution.work_dir, ignore_errors=True)
+
+def finish():
+    """Promote the kept artifacts to --artifacts-dir and remove the scratch area"""
+    global root
+    if root is None:
+        return
+    if kept and not os.path.isdir(config.Arguments.artifacts_dir):
+        os.makedirs(config.Arguments.artifacts_dir)
+    for rank, (execution_time, ID, directory) in enumerate(kept):
+        destination = os.path.join(config.Arguments.artifacts_dir, "%d-individual-%d" % (rank+1, ID))
+        if os.path.exists(destination):
+            shutil.rmtree(destination)
+        shutil.copytree(directory, destination)
+        debug.verbose_message("Promoted artifacts of individual %d to '%s'" % (ID, destination), __name__)
+    shutil.rmtree(root, ignore_errors=True)
+    root = None
+
+def summarise():
+    print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+    print("Artifacts promoted to '%s': %d" % (config.Arguments.artifacts_dir, len(kept)))
+    print("Waits for scratch space:    %d (%.2f seconds)" % (waits, waiting_time))
+    print
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import collections
+import config
+import enums
+
+# Progress of the search so far
+evaluations  = 0
+failures     = 0
+# Individuals rejected by screening before compilation, which are not evaluations
+rejections   = 0
+best         = None
+start        = time.time()
+# Strategy-specific measures, e.g. the acceptance rate of simulated annealing
+gauges       = collections.OrderedDict()
+# Hits and misses of every cache consulted during evaluation, keyed on cache name
+caches       = collections.OrderedDict()
+last_export  = None
+stream       = None
+
+def cache_hit(name):
+    caches.setdefault(name, [0, 0])[0] += 1
+
+def cache_miss(name):
+    caches.setdefault(name, [0, 0])[1] += 1
+
+def cache_hit_rates():
+    return collections.OrderedDict((name, float(hits) / (hits + misses)) for name, (hits, misses) in caches.iteritems())
+
+def set_gauge(name, value):
+    gauges[name] = value
+
+def write_record(record):
+    global stream
+    if not config.Arguments.telemetry_file:
+        return
+    if stream is None:
+        stream = open(config.Arguments.telemetry_file, 'w')
+    stream.write(json.dumps(record) + "\n")
+    # Flush so that the file can be followed while the search is running
+    stream.flush()
+
+def evaluated(solution):
+    """Called once an individual has been evaluated"""
+    global evaluations, failures, best
+    evaluations += 1
+    if solution.status == enums.Status.passed:
+        if best is None or solution.execution_time < best:
+            best = solution.execution_time
+    else:
+        failures += 1
+    record = collections.OrderedDict()
+    record["type"]            = "evaluation"
+    record["evaluation"]      = evaluations
+    record["wall_time"]       = time.time() - start
+    record["individual"]      = solution.ID
+    record["status"]          = solution.status
+    record["execution_time"]  = solution.execution_time if solution.status == enums.Status.passed else None
+    record["best_so_far"]     = best
+    record["gauges"]          = gauges
+    record["cache_hit_rates"] = cache_hit_rates()
+    write_record(record)
+    export_prometheus()
+
+def rejected(solution):
+    """Called when an individual is rejected before compilation"""
+    global rejections
+    rejections += 1
+    record = collections.OrderedDict()
+    record["type"]       = "rejection"
+    record["evaluation"] = evaluations
+    record["wall_time"]  = time.time() - start
+    record["individual"] = solution.ID
+    record["stage"]      = solution.failed_stage
+    write_record(record)
+
+def generation_finished(generation, diversity):
+    set_gauge("ga_generation", generation)
+    set_gauge("ga_diversity", diversity)
+    record = collections.OrderedDict()
+    record["type"]        = "generation"
+    record["generation"]  = generation
+    record["evaluation"]  = evaluations
+    record["wall_time"]   = time.time() - start
+    record["diversity"]   = diversity
+    record["best_so_far"] = best
+    write_record(record)
+
+def export_prometheus(force=False):
+    """Rewrite the Prometheus text-format file, at most once per --telemetry-interval seconds"""
+    global last_export
+    if not config.Arguments.prometheus_file:
+        return
+    now = time.time()
+    if not force and last_export is not None and now - last_export < config.Arguments.telemetry_interval:
+        return
+    last_export = now
+    lines = []
+    def metric(name, kind, help_text, samples):
+        lines.append("# HELP autotuner_%s %s" % (name, help_text))
+        lines.append("# TYPE autotuner_%s %s" % (name, kind))
+        for labels, value in samples:
+            lines.append("autotuner_%s%s %s" % (name, labels, repr(float(value))))
+    metric("evaluations_total", "counter", "Individuals evaluated so far.", [("", evaluations)])
+    metric("failed_evaluations_total", "counter", "Individuals which failed to run.", [("", failures)])
+    metric("rejections_total", "counter", "Individuals rejected before compilation.", [("", rejections)])
+    metric("elapsed_seconds", "gauge", "Wall-clock time since tuning started.", [("", now - start)])
+    if best is not None:
+        metric("best_execution_time_seconds", "gauge", "Best execution time found so far.", [("", best)])
+    for name, value in gauges.iteritems():
+        metric(name, "gauge", "Search-strategy measure '%s'." % name, [("", value)])
+    if caches:
+        metric("cache_hits_total", "counter", "Cache hits.",
+               [('{cache="%s"}' % name, hits) for name, (hits, misses) in caches.iteritems()])
+        metric("cache_misses_total", "counter", "Cache misses.",
+               [('{cache="%s"}' % name, misses) for name, (hits, misses) in caches.iteritems()])
+    # Replace the file atomically so that a scraper never sees half of it
+    temporary = config.Arguments.prometheus_file + ".tmp"
+    with open(temporary, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    os.rename(temporary, config.Arguments.prometheus_file)
+
+def finish():
+    global stream
+    export_prometheus(force=True)
+    if stream is not None:
+        stream.close()
+        stream = None
@@ -0,0 +1,30 @@
+import unittest
+import enums
+import compiler_flags
+
+class TestDomainValues(unittest.TestCase):
+
+    def test_all(self):
+        self.assertEqual(compiler_flags.get_domain_values((enums.SizeDomain.all, None), 1, 6), [1, 2, 3, 4, 5])
+
+    def test_pow2(self):
+        self.assertEqual(compiler_flags.get_domain_values((enums.SizeDomain.pow2, None), 1, 1025),
+                         [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024])
+        self.assertEqual(compiler_flags.get_domain_values((enums.SizeDomain.pow2, None), 3, 64), [4, 8, 16, 32])
+
+    def test_multiple(self):
+        self.assertEqual(compiler_flags.get_domain_values((enums.SizeDomain.multiple, 32), 1, 129), [32, 64, 96, 128])
+        self.assertEqual(compiler_flags.get_domain_values((enums.SizeDomain.multiple, 32), 40, 128), [64, 96])
+
+    def test_divisors(self):
+        self.assertEqual(compiler_flags.get_domain_values((enums.SizeDomain.divisors, 12), 1, 100), [1, 2, 3, 4, 6, 12])
+        self.assertEqual(compiler_flags.get_domain_values((enums.SizeDomain.divisors, 12), 2, 12), [2, 3, 4, 6])
+
+    def test_list(self):
+        self.assertEqual(compiler_flags.get_domain_values((enums.SizeDomain.list, [64, 8, 8, 2048]), 1, 1025), [8, 64])
+
+    def test_empty(self):
+        self.assertEqual(compiler_flags.get_domain_values((enums.SizeDomain.multiple, 256), 1, 100), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import json
+import tempfile
+import unittest
+import occupancy
+
+def create_device(**limits):
+    """A device with the resources of compute capability 3.5, e.g. a Tesla K20,
+    whose other limits are the defaults of Device, unless overridden"""
+    description = {"sm_count": 13, "registers_per_sm": 65536, "shared_memory_per_sm": 49152, "warp_size": 32}
+    description.update(limits)
+    handle, filename = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(handle, 'w') as f:
+        json.dump(description, f)
+    try:
+        return occupancy.Device(filename)
+    finally:
+        os.remove(filename)
+
+class TestDevice(unittest.TestCase):
+    """The expected values are those of the CUDA occupancy calculator"""
+
+    def setUp(self):
+        self.device = create_device()
+
+    def test_limited_by_warps(self):
+        self.assertEqual(self.device.active_blocks(256, 32), 8)
+        self.assertEqual(self.device.occupancy(256, 32), 1.0)
+
+    def test_limited_by_blocks(self):
+        self.assertEqual(self.device.active_blocks(32), 16)
+        self.assertEqual(self.device.occupancy(32), 0.25)
+
+    def test_limited_by_registers(self):
+        self.assertEqual(self.device.active_blocks(128, 64), 8)
+        self.assertEqual(self.device.occupancy(128, 64), 0.5)
+        # 37 registers per thread are allocated as 1280 per warp
+        self.assertEqual(self.device.active_blocks(192, 37), 8)
+        self.assertEqual(self.device.occupancy(192, 37), 0.75)
+
+    def test_limited_by_shared_memory(self):
+        self.assertEqual(self.device.active_blocks(256, None, 16384), 3)
+        self.assertEqual(self.device.occupancy(256, None, 16384), 0.375)
+        # 12000 bytes are allocated as 12032
+        self.assertEqual(self.device.active_blocks(64, None, 12000), 4)
+        self.assertEqual(self.device.occupancy(64, None, 12000), 0.125)
+
+    def test_partial_warp(self):
+        self.assertEqual(self.device.active_blocks(48), 16)
+        self.assertEqual(self.device.occupancy(48), 0.5)
+
+    def test_unlaunchable(self):
+        self.assertEqual(self.device.active_blocks(1025), 0)
+        self.assertEqual(self.device.active_blocks(0), 0)
+        self.assertEqual(self.device.active_blocks(32, 256), 0)
+        self.assertEqual(self.device.active_blocks(32, None, 49153), 0)
+        # 255 registers per thread leave too few for a block of 1024 threads
+        self.assertEqual(self.device.active_blocks(1024, 255), 0)
+        self.assertEqual(self.device.occupancy(1024, 255), 0.0)
+
+    def test_fermi(self):
+        device = create_device(registers_per_sm=32768,
+                               max_warps_per_sm=48,
+                               max_blocks_per_sm=8,
+                               max_registers_per_thread=63,
+                               register_allocation_unit=64,
+                               shared_memory_allocation_unit=128)
+        self.assertEqual(device.active_blocks(256, 20), 6)
+        self.assertEqual(device.occupancy(256, 20), 1.0)
+        self.assertEqual(device.active_blocks(256, 24), 5)
+        self.assertAlmostEqual(device.occupancy(256, 24), 40.0 / 48)
+
+    def test_utilisation(self):
+        self.assertEqual(self.device.utilisation(256, 13 * 8, 32), 1.0)
+        self.assertEqual(self.device.utilisation(256, 13 * 4, 32), 0.5)
+
+    def test_invalid_device_file(self):
+        self.assertRaises(ValueError, create_device, warp_size=0)
+        self.assertRaises(ValueError, create_device, max_threads=1024)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import tile_model
+
+# C[i][j] += A[i][k] * B[k][j] over loops i, j and k
+matmul = {"extents": [1024, 1024, 1024], "accesses": [[0, 2], [2, 1], [0, 1]]}
+
+class TestKernelModel(unittest.TestCase):
+
+    def setUp(self):
+        self.kernel = tile_model.KernelModel("0", matmul)
+
+    def test_fit(self):
+        self.assertEqual(self.kernel.fit((16,)), [16, 32, 32])
+        self.assertEqual(self.kernel.fit((16, 8, 4, 2)), [16, 8, 4])
+        self.assertEqual(self.kernel.fit((2048, 8, 4)), [1024, 8, 4])
+
+    def test_footprint(self):
+        self.assertEqual(self.kernel.footprint([32, 32, 32]), 4 * 3 * 32 * 32)
+        self.assertEqual(self.kernel.footprint([64, 16, 8]), 4 * (64 * 8 + 8 * 16 + 64 * 16))
+        kernel = tile_model.KernelModel("1", dict(matmul, element_size=8))
+        self.assertEqual(kernel.footprint([32, 32, 32]), 8 * 3 * 32 * 32)
+
+    def test_score(self):
+        # Every element of a 32x32x32 tile is used 32 times, the tiles cover the
+        # loops exactly and there are plenty of them
+        self.assertEqual(self.kernel.score((32, 32, 32), 49152), 32.0)
+        self.assertEqual(self.kernel.score((32, 32, 32), 8192), 32.0 * tile_model.OVERFLOW_PENALTY)
+
+    def test_score_of_partial_tiles(self):
+        # 22 tiles of 48 iterations cover 1056 of the 1024 iterations of loop i
+        self.assertAlmostEqual(self.kernel.score((48, 32, 32), 49152),
+                               self.kernel.reuse([48, 32, 32]) * 1024.0 / 1056)
+
+    def test_score_of_few_tiles(self):
+        kernel = tile_model.KernelModel("1", {"extents": [64, 64], "accesses": [[0, 1]], "parallel": [0, 1]})
+        # 4 tiles of the 16 needed to keep the GPU busy
+        self.assertEqual(kernel.score((32, 32), 49152), 0.25)
+
+    def test_invalid_kernel(self):
+        self.assertRaises(ValueError, tile_model.KernelModel, "1", {"extents": [0], "accesses": []})
+        self.assertRaises(ValueError, tile_model.KernelModel, "1", {"extents": [8], "accesses": [[1]]})
+
+if __name__ == "__main__":
+    unittest.main()
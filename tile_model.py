@@ -0,0 +1,117 @@
+import json
+import math
+import config
+import debug
+
+# The tile footprint of a kernel that overflows shared memory is worth this
+# fraction of one that fits
+OVERFLOW_PENALTY = 0.01
+
+class KernelModel:
+    """What the cost model knows about one kernel: the extent of each tiled loop,
+    the tiled loops indexing each array reference, and the size of an element"""
+
+    def __init__(self, name, description):
+        self.name         = name
+        self.extents      = description["extents"]
+        self.accesses     = description["accesses"]
+        self.element_size = description.get("element_size", 4)
+        self.parallel     = description.get("parallel", range(0, len(self.extents)))
+        self.min_tiles    = description.get("min_tiles", 16)
+        self.default_tile = description.get("default_tile", 32)
+        if not self.extents or any(type(extent) is not int or extent <= 0 for extent in self.extents):
+            raise ValueError("Kernel %s of the tile model needs positive integer loop extents" % name)
+        for access in self.accesses + [self.parallel]:
+            if any(dimension not in range(0, len(self.extents)) for dimension in access):
+                raise ValueError("Kernel %s of the tile model refers to a loop beyond its %d loops" % (name, len(self.extents)))
+
+    def fit(self, tile):
+        """PPCG applies as many tile sizes as the kernel has loops, padding with its default"""
+        tile = list(tile[:len(self.extents)]) + [self.default_tile] * (len(self.extents) - len(tile))
+        return [min(size, extent) for size, extent in zip(tile, self.extents)]
+
+    def footprint(self, tile):
+        """Bytes touched by one tile, which PPCG would place in shared memory"""
+        return self.element_size * sum(product(tile[dimension] for dimension in access) for access in self.accesses)
+
+    def reuse(self, tile):
+        """References per element brought into the tile"""
+        elements = self.footprint(tile) / self.element_size
+        return float(product(tile) * len(self.accesses)) / elements if elements else 1.0
+
+    def efficiency(self, tile):
+        """The fraction of tiled iterations which are within the loop bounds"""
+        return product(float(extent) / (int(math.ceil(float(extent) / size)) * size)
+                       for extent, size in zip(self.extents, tile))
+
+    def parallelism(self, tile):
+        """The fraction of the tiles needed to keep the GPU busy which the loops provide"""
+        tiles = product(int(math.ceil(float(self.extents[dimension]) / tile[dimension])) for dimension in self.parallel)
+        return min(1.0, float(tiles) / self.min_tiles)
+
+    def score(self, tile, shared_memory):
+        tile  = self.fit(tile)
+        score = self.reuse(tile) * self.efficiency(tile) * self.parallelism(tile)
+        if self.footprint(tile) > shared_memory:
+            score *= OVERFLOW_PENALTY
+        return score
+
+# The kernels of the cost model, if --tile-model is given
+kernels     = None
+drawn       = 0
+overflowing = 0
+
+def product(values):
+    return reduce(lambda x, y: x * y, values, 1)
+
+def load(filename):
+    """Read the cost model, a JSON object mapping kernel numbers to
+    {"extents": [...], "accesses": [[...], ...], "element_size": ..., "parallel": [...], "min_tiles": ...}"""
+    global kernels
+    with open(filename, 'r') as f:
+        description = json.load(f)
+    if not isinstance(description, dict) or not description:
+        raise ValueError("Tile model '%s' does not describe any kernels" % filename)
+    kernels = {}
+    for name, kernel in description.iteritems():
+        try:
+            kernels[name] = KernelModel(name, kernel)
+        except KeyError as e:
+            raise ValueError("Kernel %s of tile model '%s' does not give %s" % (name, filename, e))
+
+def score(kernel_number, tile):
+    """The score of a tile of the given kernel, or of every modelled kernel at once
+    if the kernel is None or not modelled: then the worst score counts"""
+    # Tiles are only rejected for overflowing the largest shared memory being tuned
+    shared_memory = max(config.Arguments.shared_memory)
+    if kernel_number is not None and str(kernel_number) in kernels:
+        return kernels[str(kernel_number)].score(tile, shared_memory)
+    return min(kernel.score(tile, shared_memory) for kernel in kernels.values())
+
+def choose(kernel_number, candidates, rng):
+    """Pick one of the candidate tiles with probability proportional to its score,
+    so that promising tiles are favoured without giving up the others entirely"""
+    global drawn, overflowing
+    scores = [score(kernel_number, tile) for tile in candidates]
+    total  = sum(scores)
+    chosen = candidates[-1]
+    if total > 0:
+        point = rng.uniform(0.0, total)
+        for tile, the_score in zip(candidates, scores):
+            point -= the_score
+            if point <= 0:
+                chosen = tile
+                break
+    drawn += 1
+    shared_memory = max(config.Arguments.shared_memory)
+    if any(kernel.footprint(kernel.fit(chosen)) > shared_memory for name, kernel in kernels.iteritems()
+           if kernel_number is None or str(kernel_number) not in kernels or name == str(kernel_number)):
+        overflowing += 1
+    debug.verbose_message("Chose tile %s of kernel %s from %d candidates" % (chosen, kernel_number, len(candidates)), __name__)
+    return chosen
+
+def summarise():
+    print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+    print("Tile sizes drawn through the cost model: %d" % (drawn))
+    print("Of which overflow shared memory:         %d" % (overflowing))
+    print
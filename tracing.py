@@ -0,0 +1,118 @@
+import csv
+import json
+import time
+import collections
+import enums
+
+class Span:
+    """A stretch of wall-clock time spent in one stage of evaluating an individual"""
+
+    def __init__(self, category, name, individual_ID=None, thread="tuner", start=None, end=None):
+        self.category      = category
+        self.name          = name
+        self.individual_ID = individual_ID
+        self.thread        = thread
+        self.start         = start
+        self.end           = end
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = time.time()
+        spans.append(self)
+        return False
+
+    def duration(self):
+        return self.end - self.start
+
+# All spans recorded so far, in order of completion
+spans  = []
+# When tracing began, so that exported times are relative to the start of tuning
+origin = time.time()
+
+def span(category, name, individual_ID=None, thread="tuner"):
+    """Use in a 'with' statement to record the time spent in the enclosed block"""
+    return Span(category, name, individual_ID, thread)
+
+def record(category, name, start, end, individual_ID=None, thread="tuner"):
+    """Record a span whose start and end were measured elsewhere, e.g. by a pilot job"""
+    the_span = Span(category, name, individual_ID, thread, start, end)
+    spans.append(the_span)
+    return the_span
+
+def export_chrome_trace(filename):
+    """Write the spans in the Chrome trace-event format (load through chrome://tracing)"""
+    threads = collections.OrderedDict()
+    events  = []
+    for the_span in spans:
+        if the_span.thread not in threads:
+            threads[the_span.thread] = len(threads) + 1
+            events.append({"name": "thread_name",
+                           "ph"  : "M",
+                           "pid" : 1,
+                           "tid" : threads[the_span.thread],
+                           "args": {"name": the_span.thread}})
+        events.append({"name": the_span.name,
+                       "cat" : the_span.category,
+                       "ph"  : "X",
+                       "ts"  : (the_span.start - origin) * 1e6,
+                       "dur" : the_span.duration() * 1e6,
+                       "pid" : 1,
+                       "tid" : threads[the_span.thread],
+                       "args": {"individual": the_span.individual_ID}})
+    with open(filename, 'w') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+def export_csv(filename):
+    with open(filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(["category", "name", "individual", "thread", "start", "end", "duration"])
+        for the_span in spans:
+            writer.writerow([the_span.category,
+                             the_span.name,
+                             the_span.individual_ID,
+                             the_span.thread,
+                             "%.6f" % (the_span.start - origin),
+                             "%.6f" % (the_span.end - origin),
+                             "%.6f" % the_span.duration()])
+
+def busy_time(intervals):
+    """The length of the union of the given (start, end) intervals"""
+    total      = 0.0
+    last_end   = None
+    for start, end in sorted(intervals):
+        if last_end is None or start > last_end:
+            total   += end - start
+            last_end = end
+        elif end > last_end:
+            total   += end - last_end
+            last_end = end
+    return total
+
+def summarise():
+    if not spans:
+        return
+    wall_clock = max(the_span.end for the_span in spans) - origin
+    print("%s Summary of %s %s" % ('*' * 30, __name__, '*' * 30))
+    per_category = collections.OrderedDict()
+    for the_span in spans:
+        per_category.setdefault(the_span.category, []).append((the_span.start, the_span.end))
+    for category, intervals in per_category.iteritems():
+        category_time = busy_time(intervals)
+        print("%-40s %10.2f seconds (%5.1f%%)" % ("Time in stage '%s':" % category,
+                                                  category_time,
+                                                  100 * category_time / wall_clock))
+    # The auto-tuner is idle whenever it is not inside any span on its own thread
+    tuner_intervals = [(the_span.start, the_span.end) for the_span in spans if the_span.thread == "tuner"]
+    idle_time       = wall_clock - busy_time(tuner_intervals)
+    print("%-40s %10.2f seconds (%5.1f%%)" % ("Time outside any stage:", idle_time, 100 * idle_time / wall_clock))
+    # Utilisation of the parallel workers, if there were any
+    per_worker = collections.OrderedDict()
+    for the_span in spans:
+        if the_span.thread != "tuner" and the_span.category == enums.TraceCategory.binary:
+            per_worker.setdefault(the_span.thread, []).append((the_span.start, the_span.end))
+    for worker, intervals in per_worker.iteritems():
+        print("%-40s %10.1f%%" % ("Utilisation of %s:" % worker, 100 * busy_time(intervals) / wall_clock))
+    print